@@ -7,22 +7,34 @@ video url: https://youtu.be/FUKv5NUwBWU
 """
 module imports
 """
-from flask import Flask, request, render_template, redirect, url_for, session # flask tools
+from flask import Flask, request, render_template, redirect, url_for, session, abort, Response, jsonify # flask tools
 from database import Database # my database class
 from werkzeug.security import check_password_hash, generate_password_hash # used to hash passwords for secure private password storing
 from werkzeug.utils import secure_filename # renames the file to something proper in the very rare case where it isnt already properly named
 import os # allows me to access personal files, currently just to get the secret key from key.env
-import io # used to create an 'in memory file' to help store the image in the db
 from io import BytesIO # user to convert from binary back to a normal file
-import base64 # used to convert images to bytes for storage in the db as a BLOB type
 import pandas as pd # library for managing data files in python
 import uuid # used to create a random string of letters to use as an annoymous user_id when a user isnt logged in
-from apscheduler.schedulers.background import BackgroundScheduler # allows me to run code in the background, used to clean the db periodically
+from rendering import RenderEngine # draws visuals in parallel worker processes
+from cache import DataFrameCache, SortOrderCache, RenderCache, hash_data_set, render_cache_key # caches of parsed datasets and drawn visuals
+from blob_store import BlobStore # stores the uploaded dataset files once, by the hash of their contents
+from frame_store import ProcessedFrameStore # stores the processed DataFrame of each dataset file, so files are parsed once
+from ingestion import ingest_csv # reads csv files straight into processed DataFrames
+from profiling import ColumnProfileStore # profiles the columns of each dataset once, for the data report
+from maintenance import Maintenance # runs the background jobs that clean the db and caches, in one worker process
 # personal functions
 from functions import (
-    generate_and_recommend_WIP, 
+    plan_visuals,
+    render_pngs,
+    THUMBNAIL_DPI,
+    VISUAL_DPIS,
+    STYLE_VERSION,
+    ROW_BUDGET,
+    DEFAULT_THEME,
     process_data, 
     get_data_report_data,
+    get_data_rows,
+    get_sort_order,
     )
 
 
@@ -33,19 +45,261 @@ start up processes
 # app setup
 app = Flask(__name__)
 
+# define the max file size allowed
+max_file_size = 2**20 // 2 # file_size is in Bytes, so 2**20 // 2 would represent 500 kb
+file_too_large_message = "File size to large, max file size: 500 kb"
+
+# requests larger than the max file size (plus room for the rest of the upload form) are rejected with a 413 before they
+# are read, see request_too_large
+app.config['MAX_CONTENT_LENGTH'] = max_file_size + 2**16
+
 # get the VISUALIZZE_SECRET_KEY from .env file for secure sessions
 app.config['SECRET_KEY'] = os.getenv('VISUALIZZE_SECRET_KEY')
 
 # initialize visualizze's data base object
 db = Database("./visualizze.db")
 
-# start background process to clear the data_set table periodically
-def clean_data_base():
-    db.clear_data_sets()
-hour, minute = 0, 0 # 24 hour clock, time when the temp database table will be cleaned. 0,0 -> midnight
-scheduler = BackgroundScheduler()
-scheduler.add_job(func=clean_data_base, trigger='cron', hour=hour, minute=minute)
-scheduler.start()
+# number of saved datasets shown per page of the history page
+history_page_size = 50
+
+# the uploaded dataset files, the db only keeps their hashes
+blob_store = BlobStore("./blob_store")
+
+# the processed DataFrames of the uploaded files, stored beside their files in the blob store
+processed_frames = ProcessedFrameStore(blob_store)
+
+# the column profiles shown in the data report, stored beside the dataset files and cached in memory
+column_profiles = ColumnProfileStore(blob_store)
+
+# cache of processed datasets, so the dashboard doesnt re-parse the same file on every request
+max_data_frame_cache_size = 2**20 * 64 # in Bytes, 2**20 * 64 would represent 64 mb
+data_frame_cache = DataFrameCache(max_bytes=max_data_frame_cache_size)
+
+# cache of the sorted row orders of the dashboard data table, so paging through a sorted dataset only sorts it once
+max_sort_order_cache_size = 2**20 * 16 # 16 mb
+sort_order_cache = SortOrderCache(max_bytes=max_sort_order_cache_size)
+
+# cache of drawn visuals as pngs, kept in memory and on disk so every worker process can share them
+max_render_cache_memory_size = 2**20 * 32 # 32 mb
+max_render_cache_disk_size = 2**20 * 256 # 256 mb
+render_cache = RenderCache(
+    max_memory_bytes=max_render_cache_memory_size,
+    directory="./render_cache",
+    max_disk_bytes=max_render_cache_disk_size,
+    evict_on_put=False, # the disk cache is evicted by a maintenance job instead, see below
+    )
+
+# draws the visuals of a request in a pool of worker processes, VISUALIZZE_RENDER_WORKERS=0 draws them in this process instead
+render_workers = int(os.getenv('VISUALIZZE_RENDER_WORKERS', min(4, os.cpu_count() or 1)))
+# max seconds a request waits for a visual being drawn in the background, after that it draws the visual itself
+render_timeout = 30
+render_engine = RenderEngine(workers=render_workers, timeout=render_timeout)
+
+# max number of rows a visual is drawn from, larger datasets are sampled or binned first so drawing time stays about the same
+row_budget = int(os.getenv('VISUALIZZE_ROW_BUDGET', ROW_BUDGET))
+
+# datasets expire once they werent accessed for data_set_idle_ttl seconds, or were uploaded over data_set_max_age
+# seconds ago even if they are still in use. expired datasets are deleted every data_set_expiry_interval seconds
+data_set_idle_ttl = 60 * 60 * 6 # 6 hours
+data_set_max_age = 60 * 60 * 24 * 7 # 7 days
+data_set_expiry_interval = 60 * 5 # 5 minutes
+
+# a dataset is marked as accessed at most once per this many seconds, so loading it isnt a write every time
+data_set_touch_interval = 60
+
+# the background jobs, every worker process schedules them but they only run in one of them, see maintenance.Maintenance
+def expire_data_sets():
+    # deletes the expired datasets, the metrics (such as the bytes reclaimed) are kept in the job status
+    metrics = db.expire_data_sets(data_set_idle_ttl, data_set_max_age)
+    if metrics['rows']:
+        print(f"{metrics['rows']} expired datasets deleted, {metrics['db_bytes']} bytes reclaimed, "
+              f"write lock held for at most {metrics['max_lock_seconds'] * 1000:.1f} ms")
+    return metrics
+
+def collect_blob_garbage(grace_seconds=60 * 60):
+    # removes the dataset files that arent in data_sets or users_data_sets anymore
+    db.delete_unreferenced_blobs()
+    removed = blob_store.collect_garbage(db.get_referenced_blob_hashes(), grace_seconds=grace_seconds)
+    print(f"{removed} unreferenced dataset files removed")
+    return {'files': removed}
+
+def evict_render_cache():
+    return {'files': render_cache.evict_disk()}
+
+maintenance = Maintenance(lock_path="./maintenance.lock", status_path="./maintenance_status.json")
+maintenance.add_job('expire_data_sets', expire_data_sets, data_set_expiry_interval)
+maintenance.add_job('collect_blob_garbage', collect_blob_garbage, 60 * 60)
+maintenance.add_job('evict_render_cache', evict_render_cache, 60)
+# when this file is run directly the render worker processes re-import it as __mp_main__, they shouldnt run the scheduler too
+if __name__ != '__mp_main__':
+    maintenance.start()
+
+
+
+"""
+helper functions
+"""
+
+def parse_data_set(file, file_type):
+    """
+    reads a dataset file with pandas and processes it for visualization
+
+    Args:
+    file -> str or file: the path of the file, or the file itself
+    file_type -> str: 'csv' or 'xlsx'
+
+    Returns:
+    data -> DataFrame: the processed dataset
+
+    Raises:
+    ValueError: if the dataset is not a csv or xlsx file
+    """
+    if file_type == 'xlsx':
+        return process_data(pd.read_excel(file))
+    elif file_type == 'csv':
+        # csv files are parsed straight into processed columns, see ingestion.ingest_csv
+        return ingest_csv(file)
+    else:
+        raise ValueError(f"Unsupported file format: {file_type}")
+
+
+def load_data_set(dataset_id):
+    """
+    gets a dataset from the temporary data_sets table and reads it into a processed DataFrame, processed
+    DataFrames are cached so the same file is only parsed once
+
+    Args:
+    dataset_id -> int: the id of the dataset in the data_sets table
+
+    Returns:
+    data_set_entry -> dict: the dataset entry from the db, with the added 'content_hash' of the file. None if the
+    dataset was not found
+    data -> DataFrame: the processed dataset, None if the dataset was not found
+
+    Raises:
+    ValueError: if the dataset is not a csv or xlsx file
+    """
+    data_set_entry = db.get_data_set_by_id(dataset_id)
+    if not data_set_entry:
+        return None, None
+
+    # keep the dataset from expiring while it is in use
+    if data_set_entry['idle_seconds'] is None or data_set_entry['idle_seconds'] >= data_set_touch_interval:
+        db.touch_data_set(dataset_id)
+
+    file_type = data_set_entry['file_type']
+    blob_hash = data_set_entry['blob_hash']
+
+    # the blob hash is the hash of the file contents, datasets from before the blob store have their file in the db
+    content_hash = data_set_entry['content_hash'] = blob_hash or hash_data_set(data_set_entry['data_set'])
+
+    # check the cache for an already processed version of this dataset, it is keyed by the file contents so every
+    # dataset row of the same file (such as a saved dataset sent back to the visualizer) finds the same frame
+    data = data_frame_cache.get(content_hash)
+
+    # then the processed frame stored when the file was uploaded, which skips parsing and processing
+    if data is None and blob_hash:
+        data = processed_frames.get(blob_hash)
+
+    if data is None:
+        if blob_hash:
+            # read the file straight from the blob store, csv files are memory mapped instead of copied into memory first
+            data = parse_data_set(blob_store.path(blob_hash), file_type)
+            processed_frames.put(blob_hash, data)
+        else:
+            data = parse_data_set(BytesIO(data_set_entry['data_set']), file_type)
+
+    # cache it for the next requests
+    data_frame_cache.put(content_hash, data)
+
+    return data_set_entry, data
+
+
+def get_visual_key(content_hash, x_col, y_col, spec, theme, dpi=None):
+    # key of a visual in the render cache, also used as the id of the visual in its url
+    return render_cache_key(content_hash, x_col, y_col, spec['title'], theme, STYLE_VERSION, dpi=dpi, row_budget=row_budget)
+
+
+def get_visual_png(content_hash, x_col, y_col, spec, theme=DEFAULT_THEME, dpi=None):
+    """
+    draws a planned visual as a png, or gets it from the render cache if the same visual was already drawn,
+    if the visual is still being drawn in the background this waits for it instead of drawing it again.
+
+    a visual that has to be drawn is rasterized at every size in VISUAL_DPIS from the one figure, and all of them are
+    cached, so its thumbnail (or full size visual) is never drawn again
+
+    Args:
+    content_hash -> str: the hash of the dataset file the visual is planned from
+    x_col, y_col -> str: the selected column names
+    spec -> dict: the visual spec, see functions.plan_visuals
+    theme -> str: the name of the theme to draw the visual with, see functions.THEMES
+    dpi -> int: resolution to rasterize at, THUMBNAIL_DPI for thumbnails. None for the full size visual
+
+    Returns:
+    png -> bytes: the png image data
+    """
+    key = get_visual_key(content_hash, x_col, y_col, spec, theme, dpi=dpi)
+    png = render_cache.get(key) or render_engine.pending_png(key)
+
+    if png is None:
+        pngs = render_pngs(spec, theme=theme, dpis=VISUAL_DPIS)
+        for visual_dpi, visual_png in zip(VISUAL_DPIS, pngs):
+            render_cache.put(get_visual_key(content_hash, x_col, y_col, spec, theme, dpi=visual_dpi), visual_png)
+        png = pngs[VISUAL_DPIS.index(dpi)]
+
+    return png
+
+
+def prefetch_visual_pngs(content_hash, x_col, y_col, specs, theme=DEFAULT_THEME):
+    """
+    starts drawing planned visuals in parallel in the background, so they are in the render cache by the time they are
+    requested. each visual is drawn once for all the sizes in VISUAL_DPIS, visuals that are already cached are skipped
+
+    Args:
+    content_hash -> str: the hash of the dataset file the visuals are planned from
+    x_col, y_col -> str: the selected column names
+    specs -> list: the visual specs, see functions.plan_visuals
+    theme -> str: the name of the theme to draw the visuals with, see functions.THEMES
+    """
+    keyed_specs = []
+    for spec in specs:
+        keys = tuple(get_visual_key(content_hash, x_col, y_col, spec, theme, dpi=dpi) for dpi in VISUAL_DPIS)
+        if any(render_cache.get(key) is None for key in keys):
+            keyed_specs.append((keys, spec))
+
+    render_engine.prefetch(keyed_specs, on_rendered=render_cache.put, theme=theme, dpis=VISUAL_DPIS)
+
+
+def find_session_visual(visual_id, theme=DEFAULT_THEME):
+    """
+    finds which of the visuals planned for the current dashboard a visual id belongs to, so a visual that isnt
+    in the render cache can be drawn again
+
+    Args:
+    visual_id -> str: the id of the visual, see get_visual_key
+    theme -> str: the name of the theme the visuals are drawn with, see functions.THEMES
+
+    Returns:
+    content_hash -> str: the hash of the dataset file the visual is planned from
+    spec -> dict: the visual spec, see functions.plan_visuals
+    dpi -> int: the resolution of the visual, None for the full size visual
+    all three are None if the visual isnt one of the current dashboard visuals
+    """
+    if not session.get('dataset_id'):
+        return None, None, None
+
+    data_set_entry, data = load_data_set(session['dataset_id'])
+    if data is None:
+        return None, None, None
+
+    # plan the visuals again from the columns selected in the dashboard, planning is cheap compared to drawing
+    x_col, y_col = session.get('x_col'), session.get('y_col')
+    for spec in plan_visuals(data, x_col=x_col, y_col=y_col, row_budget=row_budget) or []:
+        for dpi in VISUAL_DPIS:
+            if get_visual_key(data_set_entry['content_hash'], x_col, y_col, spec, theme, dpi=dpi) == visual_id:
+                return data_set_entry['content_hash'], spec, dpi
+
+    return None, None, None
 
 
 
@@ -53,6 +307,16 @@ scheduler.start()
 routes
 """
 
+# requests over MAX_CONTENT_LENGTH, werkzeug stops reading them as soon as the limit is passed. only uploads
+# get the visualize page with the error, other routes get the plain 413 response
+@app.errorhandler(413)
+def request_too_large(e):
+    if request.endpoint == 'upload':
+        return render_template('visualize.html', error_message=file_too_large_message), 413
+    return e
+
+
+
 # initial route
 @app.route("/")
 def layout():
@@ -64,6 +328,9 @@ def layout():
 @app.route("/clear")
 def delete_database():
     db.clear_database()
+    data_frame_cache.clear()
+    sort_order_cache.clear()
+    collect_blob_garbage(grace_seconds=0)
     session.clear()
     return render_template("layout.html")
 
@@ -187,26 +454,32 @@ def upload():
     # get user_id, or a user_id_private, to add to the data base
     user_id = session.get('user_id') or session.get('user_id_private')
 
-    # get file size in bytes
-    file_size = len(uploaded_file.read())
-    uploaded_file.seek(0) # reset file pointer, so that later file reading does not output something empty
-
-    # define the max file size allowed
-    max_file_size = 2**20 / 2 # file_size is in Bytes, so 2**20 / 2 would represent 500 kb
-
     # add this to the session as the users max server storage size for later
     session['user_max_server_storage'] = max_file_size
-    if file_size > max_file_size:
-        error_message = "File size to large, max file size: 500 kb"
-        return render_template('visualize.html', error_message=error_message)
 
     # try to add data set to db
     try:
-        # reads file as binary
-        data_set = uploaded_file.read()
-
-        # upload file data to temp db table and record dataset id in session
-        session['dataset_id'] = db.add_data_set(user_id, filename, 'csv' if filename.endswith('.csv') else 'xlsx', file_size, data_set)
+        # stream the file into the blob store a chunk at a time, it is hashed and written as it is read so it is never
+        # held in memory whole, and reading stops as soon as it is larger than the max file size.
+        # a file that was already uploaded isnt written again
+        blob_hash, file_size = blob_store.put_stream(uploaded_file.stream, max_bytes=max_file_size)
+        if blob_hash is None:
+            return render_template('visualize.html', error_message=file_too_large_message)
+
+        # add the file to temp db table and record dataset id in session
+        file_type = 'csv' if filename.endswith('.csv') else 'xlsx'
+        session['dataset_id'] = db.add_data_set(user_id, filename, file_type, file_size, blob_hash)
+
+        # parse and process the file once now and store the processed frame beside it, so the dashboard never parses it.
+        # a file that cant be parsed is still added, the dashboard shows the error when it tries to read it again
+        if not processed_frames.exists(blob_hash):
+            try:
+                data = parse_data_set(blob_store.path(blob_hash), file_type)
+                processed_frames.put(blob_hash, data)
+                data_frame_cache.put(blob_hash, data)
+                column_profiles.get(blob_hash, data, blob_hash=blob_hash)
+            except Exception as e:
+                print(f"Error processing the uploaded dataset: {e}")
 
         # show save request form when rendering, this will only show if the user is logged in (due to the jinja if condition in the template)
         session['show-save-request-form'] = True        
@@ -246,7 +519,8 @@ def dashboard():
         # get db entries from the temp dataset table as a dictionary
         # session['dataset_id'] is define in the upload and history route, and represents the current dataset being used
         # from the temporary datasets table
-        data_set_entry = db.get_data_set_by_id(session['dataset_id'])
+        # along with the processed dataset
+        data_set_entry, data = load_data_set(session['dataset_id'])
 
         # if dataset was not found, prompt the user that a file was not uploaded
         if not data_set_entry:
@@ -256,20 +530,11 @@ def dashboard():
         # define dataset data obtained from the db
         file_name = data_set_entry['file_name']
         file_type = data_set_entry['file_type']
-        file_data = data_set_entry['data_set']
         file_size = data_set_entry['file_size']
 
-        # read the binary file_data using pandas
-        if file_type == 'xlsx':
-            data = pd.read_excel(BytesIO(file_data))
-        elif file_type == 'csv':
-            data = pd.read_csv(BytesIO(file_data))
-        else:
-            # render an error if somehow the user managed to upload a file that was xlsx or csv
-            return render_template("error.html", error_message = "Unsupported file format")
-        
-        # process the data to prepare it for visualization
-        data = process_data(data)
+    except ValueError:
+        # render an error if somehow the user managed to upload a file that was xlsx or csv
+        return render_template("error.html", error_message = "Unsupported file format")
 
     except Exception as e:
         # if something goes wrong in this step render the error page with the prompt
@@ -277,16 +542,20 @@ def dashboard():
     
     # Data Report data, to show in the data report section
     file_name = file_name
-    data_report = get_data_report_data(data)
+    # the column profiles are computed the first time a dataset is shown (if not when it was uploaded) and reused after
+    profiles = column_profiles.get(data_set_entry['content_hash'], data, blob_hash=data_set_entry['blob_hash'])
+    data_report = get_data_report_data(data, profiles)
 
-    # convert the dataset to a html table for to show in the Data section
-    table_html = data.to_html(classes="html-table")
+    # the Data section table loads its rows a page at a time from this url, instead of the whole dataset being
+    # converted to a html table here
+    rows_url = url_for('dataset_rows', dataset_id=session['dataset_id'])
     # convert the col data section to a html table as well to show in the Data Report section
-    col_data_html = data_report['col data'].to_html(classes="html-table", index=False)
+    col_data_html = data_report['col data'].to_html(classes="html-table", index=False, na_rep="")
 
     # prefine these variables as None before POST request, this prevents and error from occuring and instead renders nothing for
     # the visuals section
     x_col = y_col = z_col = None
+    visual_url = other_visuals = None
     
     # handle user form submissions
     if request.method == 'POST':
@@ -299,9 +568,11 @@ def dashboard():
             # stop showing save request form
             session['show-save-request-form'] = False
 
-            # save the dataset to user_data_sets table
+            # save the dataset to user_data_sets table, the file is already in the blob store (unless it was uploaded
+            # before the blob store) so only its hash is saved
+            blob_hash = data_set_entry['blob_hash'] or blob_store.put(data_set_entry['data_set'])
             db.save_user_data_set(user_id=session['user_id'], 
-                                  data_set=file_data, 
+                                  blob_hash=blob_hash, 
                                   file_name=file_name,
                                   file_type=file_type, 
                                   file_size=file_size, 
@@ -326,46 +597,47 @@ def dashboard():
                     allow_saving = allow_saving if session.get('user_id') else False, 
                     error_message=error_message, 
                     data_report=data_report, 
-                    table_html=table_html, 
+                    rows_url=rows_url, 
                     col_data_html=col_data_html)
         
-        # beging generation visuals
-        visuals, recommended_visual_name = generate_and_recommend_WIP(
+        # begin planning visuals, nothing is drawn yet
+        visual_plan = plan_visuals(
             data,        # dataset
             x_col=x_col, # x axis column name
             y_col=y_col, # y axis column name
+            row_budget=row_budget, # large datasets are reduced to this many rows per visual, when it is drawn
         )
-        # if any visual was generated
-        if recommended_visual_name:
-            # get the recommended visual blob, the recommended visual is just the first visual the function plotted
-            recommended_visual = visuals[recommended_visual_name] 
-
-            # converts the visual to base64, complicated but this simply allows the visual
-            # to be sent to the template as a png image
-            img_stream = BytesIO()
-            recommended_visual.savefig(img_stream, format='png')
-            img_stream.seek(0)
-            img_base64 = base64.b64encode(img_stream.read()).decode('utf-8')
-
-        # if their are any visuals plotted, also complicated this allows me to send a list of all visuals plotted
-        # to html as png images    
-        if visuals:
-            # encode visuals into base64
-            encoded_visuals = []
-            for visual_name, fig in visuals.items():
-                buf = io.BytesIO()
-                fig.savefig(buf, format='png')
-                buf.seek(0)
-                encoded_visual = base64.b64encode(buf.getvalue()).decode('utf-8')
-                buf.close()
-                encoded_visuals.append(f"data:image/png;base64,{encoded_visual}")
+
+        # remember the selected columns, so the visual route can draw visuals that arent cached anymore
+        session['x_col'], session['y_col'] = x_col, y_col
+
+        # if any visual was planned
+        if visual_plan:
+            content_hash = data_set_entry['content_hash']
+
+            # only the recommended visual (the first visual planned) is drawn now, so it is cached by the time the
+            # browser requests it
+            get_visual_png(content_hash, x_col, y_col, visual_plan[0])
+
+            # the other visuals and their thumbnails are drawn in parallel in the background
+            prefetch_visual_pngs(content_hash, x_col, y_col, visual_plan[1:])
+
+            # the visuals are sent to the template as urls, so the browser can cache the pngs
+            def visual_url_for(spec, dpi=None):
+                return url_for('visual', visual_id=get_visual_key(content_hash, x_col, y_col, spec, DEFAULT_THEME, dpi=dpi))
+
+            visual_url = visual_url_for(visual_plan[0])
+            other_visuals = [
+                (spec['title'], visual_url_for(spec), visual_url_for(spec, dpi=THUMBNAIL_DPI))
+                for spec in visual_plan
+            ]
 
     return render_template(
         # template to render
         'dashboard.html',
 
         # html table data to send
-        table_html=table_html,
+        rows_url=rows_url,
         col_data_html = col_data_html,
 
         # general data to send
@@ -373,13 +645,84 @@ def dashboard():
         data_report = data_report,
         allow_saving = allow_saving if session.get('user_id') else False,
 
-        # visual pngs to send
-        visual=img_base64 if (request.method == 'POST' and recommended_visual_name) else None,
-        encoded_visuals=encoded_visuals if (request.method == 'POST' and visuals) else None
+        # recommended visual url and the other visuals (title, visual url, thumbnail url) to send
+        visual=visual_url,
+        other_visuals=other_visuals
     )
 
 
 
+# route that serves a page of the dashboard dataset rows as json, for the dashboard data table
+@app.route('/dataset/<int:dataset_id>/rows')
+def dataset_rows(dataset_id):
+
+    # only the dataset open in the users dashboard can be read
+    if dataset_id != session.get('dataset_id'):
+        abort(404)
+
+    # page of rows requested, limited so a single request cant convert the whole dataset
+    max_rows_per_page = 500
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    limit = min(max(request.args.get('limit', 50, type=int), 1), max_rows_per_page)
+    sort = request.args.get('sort') or None
+
+    try:
+        data_set_entry, data = load_data_set(dataset_id)
+    except Exception as e:
+        abort(500)
+
+    if data is None:
+        abort(404)
+
+    try:
+        order = None
+        if sort:
+            order = sort_order_cache.get(data_set_entry['content_hash'], sort)
+            if order is None:
+                order = get_sort_order(data, sort)
+                sort_order_cache.put(data_set_entry['content_hash'], sort, order)
+
+        page = get_data_rows(data, offset=offset, limit=limit, sort=sort, order=order)
+    except KeyError:
+        # sort column not in the dataset
+        abort(400)
+
+    return jsonify(page)
+
+
+
+# route that serves the dashboard visuals as pngs, visual ids are content addressed (see get_visual_key) so the
+# png behind a url never changes and browsers can cache it for good
+@app.route('/visual/<visual_id>')
+def visual(visual_id):
+
+    # the browser already has this visual
+    if visual_id in request.if_none_match:
+        response = Response(status=304)
+    else:
+        # usually the visual was already drawn when the dashboard was rendered
+        png = render_cache.get(visual_id) or render_engine.pending_png(visual_id)
+
+        # if not (evicted from the cache, or a visual of an earlier dashboard), draw it again
+        if png is None:
+            try:
+                content_hash, spec, dpi = find_session_visual(visual_id)
+            except Exception as e:
+                abort(500)
+            if spec is None:
+                abort(404)
+            png = get_visual_png(content_hash, session.get('x_col'), session.get('y_col'), spec, dpi=dpi)
+
+        response = Response(png, mimetype='image/png')
+
+    response.set_etag(visual_id)
+    response.cache_control.private = True # the visuals show the users data, so only the users browser should cache them
+    response.cache_control.max_age = 60 * 60 * 24 * 365
+    response.cache_control.immutable = True
+    return response
+
+
+
 # home page routes
 @app.route("/continue_without_account", methods=["POST"])
 def continue_without_account():
@@ -439,10 +782,18 @@ def history():
                 file_name = data_set_data['file_name']
                 file_type = data_set_data['file_type']
                 file_size = data_set_data['file_size']
-                data_set = data_set_data['data_set']
+
+                # the file is already in the blob store, so only its hash is read and the new dataset entry refers to it.
+                # its processed frame, profiles and visuals are all keyed by the hash too, so they are reused as well
+                blob_hash = data_set_data['blob_hash']
+
+                # unless it was saved before the blob store, then its file is moved there once, and never copied again
+                if blob_hash is None:
+                    blob_hash = blob_store.put(data_set_data['data_set'])
+                    db.move_saved_user_data_set_to_blob_store(saved_data_set_id, blob_hash)
 
                 # add the data set to the temporary dataset table and set the session dataset_id to its incremented id
-                session['dataset_id'] = db.add_data_set(user_id, file_name, file_type, file_size, data_set)
+                session['dataset_id'] = db.add_data_set(user_id, file_name, file_type, file_size, blob_hash)
 
                 # redirect to dashboard, using the new dataset_id
                 return redirect(url_for('dashboard'))
@@ -452,28 +803,33 @@ def history():
                 error_message = f"Error in sending dataset to visualizer"
                 return render_template('error.html', error_message=error_message)
 
-    # connect to the users_data_sets table based on the session id, and display their saved datasets in a html table
-    with db.get_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM users_data_sets WHERE user_id=?", (session['user_id'],))
-        
-        # table column names from the db
-        table_columns = ['file_name', 'file_size_bytes', 'saved_at']
-        
-        # rename the column headers for the table
-        header_names = {
-            'file_name': 'File Name',
-            'file_size_bytes': 'File Size (bytes)',
-            'saved_at': 'Saved At'
-        }
-        
-        # get all rows
-        saved_data_set_rows = cursor.fetchall()
+    # the page of saved datasets to display, after the last dataset of the previous page (see list_saved_user_data_sets).
+    # both halves of the position are needed, with only one of them the first page is shown
+    after = None
+    after_saved_at = request.args.get('after_saved_at')
+    after_id = request.args.get('after_id', type=int)
+    if after_saved_at and after_id is not None:
+        after = (after_saved_at, after_id)
+
+    # only the metadata of the users saved datasets is read, the files are read when one is sent to the visualizer
+    page = db.list_saved_user_data_sets(session['user_id'], limit=history_page_size, after=after, include_total=True)
+
+    # table column names from the db
+    table_columns = ['file_name', 'file_size_bytes', 'saved_at']
+
+    # rename the column headers for the table
+    header_names = {
+        'file_name': 'File Name',
+        'file_size_bytes': 'File Size (bytes)',
+        'saved_at': 'Saved At'
+    }
 
     # if there are entries in the table pass it to the template, else pass an empty data table message
-    if saved_data_set_rows:
+    if page['total']:
         return render_template("history.html", 
-                               saved_data_set_rows=saved_data_set_rows, 
+                               saved_data_set_rows=page['data_sets'], 
+                               next_page=page['next'],
+                               total=page['total'],
                                table_columns=table_columns, 
                                header_names=header_names)
     else:
@@ -501,5 +857,17 @@ def error():
     return render_template("error.html")
 
 
+
+# route that serves the timing and last run status of the maintenance jobs as json, from whichever worker runs them.
+# the status has process ids and errors in it, so it is only served to requests made on the host itself. requests
+# forwarded by a proxy on the host come from a local address too, so any with a forwarding header are refused
+@app.route("/maintenance")
+def maintenance_status():
+    forwarded = 'X-Forwarded-For' in request.headers or 'Forwarded' in request.headers
+    if request.remote_addr not in ('127.0.0.1', '::1') or forwarded:
+        abort(404)
+    return jsonify(maintenance.status())
+
+
 if __name__ == '__main__':
     app.run()
\ No newline at end of file
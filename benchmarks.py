@@ -0,0 +1,618 @@
+"""
+benchmarks for the slow paths of visualizze, these arent unit tests so they arent run by pytest
+
+run in terminal to benchmark everything:
+
+python benchmarks.py
+
+or only some benchmarks by name:
+
+python benchmarks.py theme
+
+the suite benchmark times every hot path on synthetic datasets, its dataset sizes can be picked with --rows:
+
+python benchmarks.py suite --rows 1000 10000
+
+the default sizes are small so the suite runs in a few minutes, a million rows is opt-in:
+
+python benchmarks.py suite --rows 100000 1000000
+
+results can be saved as a baseline, and later runs compared against it:
+
+python benchmarks.py suite --save baseline.json
+python benchmarks.py suite --compare baseline.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import re
+import sqlite3
+import itertools
+import tempfile
+import multiprocessing
+import numpy as np
+import matplotlib
+import matplotlib.style
+import pandas as pd
+
+from database import Database
+from ingestion import ingest_csv
+from profiling import profile_data_set
+from functions import (
+    THEMES,
+    theme_context,
+    process_data,
+    get_data_report_data,
+    plan_visuals,
+    render_visual,
+    render_png,
+    figure_to_png,
+    ROW_BUDGET,
+    )
+
+# xlsx files are read with openpyxl, which is optional, the xlsx benchmarks are skipped without it
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+
+# benchmark names -> result names -> measurements of this run, such as {'best': seconds, 'mean': seconds}, see record
+RESULTS = {}
+
+# name of the benchmark that is running, its results are recorded under it
+running_benchmark = None
+
+
+"""
+helper functions
+"""
+
+def time_call(func, repeat=20):
+    """
+    times a function
+
+    Args:
+    func -> function: function to time, called without arguments
+    repeat -> int: number of times to call the function
+
+    Returns:
+    best -> float: the fastest call in seconds
+    mean -> float: the mean call in seconds
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times), sum(times) / len(times)
+
+
+def _read_status_kb(field):
+    # reads a memory field (such as VmRSS or VmHWM) of this process from /proc, in kb
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1])
+
+
+def _measure_peak_rss(func, conn):
+    # runs in the child process, the peak rss is reset to the current rss first so only func is measured
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+    baseline = _read_status_kb('VmRSS')
+    func()
+    conn.send(_read_status_kb('VmHWM') - baseline)
+    conn.close()
+
+
+def peak_rss_kb(func):
+    """
+    measures how much the peak resident memory of a fresh process grows while running a function, only
+    works on linux since it reads /proc
+
+    Args:
+    func -> function: function to measure, called without arguments
+
+    Returns:
+    peak -> int: the growth of the peak rss in kb
+    """
+    context = multiprocessing.get_context('fork')
+    parent_conn, child_conn = context.Pipe()
+    process = context.Process(target=_measure_peak_rss, args=(func, child_conn))
+    process.start()
+    peak = parent_conn.recv()
+    process.join()
+    return peak
+
+
+def record(name, **measurements):
+    # keeps a result of this run, so it can be saved as a baseline or compared against one
+    RESULTS.setdefault(running_benchmark, {}).setdefault(name, {}).update(measurements)
+
+
+def print_result(name, best, mean):
+    record(name, best=best, mean=mean)
+    print(f"  {name:<45} best {best * 1000:9.3f} ms   mean {mean * 1000:9.3f} ms")
+
+
+def print_memory(name, peak_kb):
+    record(name, peak_kb=peak_kb)
+    print(f"  {name:<45} {peak_kb / 1024:9.1f} mb")
+
+
+"""
+benchmarks
+"""
+
+def benchmark_theme():
+    """
+    per figure cost of applying the visual theme, the way render_visual did before the theme was compiled once
+    (a style lookup and an 11 key rcParams update validated on every figure) against the compiled theme
+    """
+    print("theme application per figure")
+
+    # the theme as it used to be applied on every figure
+    overrides = {
+        "axes.facecolor": "#2B2B2B",
+        "axes.edgecolor": "#5A5A5A",
+        "axes.labelcolor": "white",
+        "grid.color": "#444444",
+        "xtick.color": "lightgray",
+        "ytick.color": "lightgray",
+        "figure.facecolor": "#1E1E1E",
+        "text.color": "white",
+        "legend.frameon": True,
+        "legend.facecolor": "#2E2E2E",
+        "legend.edgecolor": "#5A5A5A",
+    }
+    def per_figure_theme():
+        with matplotlib.style.context("dark_background"), matplotlib.rc_context(overrides):
+            pass
+
+    def compiled_theme():
+        with theme_context(THEMES['dark']):
+            pass
+
+    print_result("style.context + rc_context (per figure)", *time_call(per_figure_theme, repeat=2000))
+    print_result("theme_context (compiled once)", *time_call(compiled_theme, repeat=2000))
+
+    # the whole draw for scale, the theme is a small part of it
+    data = process_data(pd.DataFrame({'int_col': range(100)}))
+    spec = plan_visuals(data, 'int_col', None)[0]
+    print_result(f"render_visual ({spec['title']})", *time_call(lambda: render_visual(spec)))
+
+
+def benchmark_row_budget(rows=100000):
+    """
+    time to plan and draw the visuals that scale with the number of rows, drawn from every row against drawn from
+    data reduced to the row budget (see functions.reduce_plot_data)
+    """
+    print(f"drawing visuals of {rows} rows, every row against the row budget of {ROW_BUDGET}")
+
+    rng = np.random.default_rng(0)
+    data = process_data(pd.DataFrame({
+        'int_col': rng.integers(0, 1000, rows),
+        'float_col': rng.normal(size=rows),
+        'float_col2': rng.normal(size=rows),
+    }))
+    columns = [('int_col', 'float_col'), ('float_col', 'float_col2'), ('float_col', None)]
+    kinds = ('Scatter', 'Hexbin', 'KDE', 'Density', 'Line', 'Regression', 'Histogram')
+
+    for x_col, y_col in columns:
+        for row_budget in (None, ROW_BUDGET):
+            for spec in plan_visuals(data, x_col, y_col, row_budget=row_budget):
+                if spec['title'].startswith(kinds):
+                    label = f"{'budget' if row_budget else 'every row':<10}{spec['title']}"
+                    print_result(label[:45], *time_call(lambda: render_png(spec), repeat=1))
+
+
+class UnpooledDatabase(Database):
+    """
+    the database the way it was before connections were pooled, a new connection for every query and the default
+    rollback journal
+    """
+    journal_mode = 'DELETE'
+
+    def get_connection(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+
+def _db_worker(db, duration, write_every, queue):
+    # runs in a forked worker process, like a gunicorn worker, and counts the queries it gets through
+    queries = 0
+    end = time.perf_counter() + duration
+    for step in itertools.count():
+        if time.perf_counter() >= end:
+            break
+        if write_every and step % write_every == 0:
+            db.add_data_set(1, 'data.csv', 'csv', 1024, b'x' * 1024)
+            queries += 1
+        else:
+            db.get_user('user')
+            db.get_data_set_by_id(1)
+            queries += 2
+    queue.put(queries)
+
+
+def queries_per_second(db, workers, duration=2, write_every=10):
+    """
+    runs a mixed read and write workload in parallel worker processes
+
+    Args:
+    db -> Database: the database to query
+    workers -> int: number of worker processes
+    duration -> float: seconds to run the workload for
+    write_every -> int: one in this many steps is a write (the other steps are two reads), 0 for reads only
+
+    Returns:
+    qps -> float: the queries per second of all the workers together
+    """
+    context = multiprocessing.get_context('fork')
+    queue = context.Queue()
+    processes = [context.Process(target=_db_worker, args=(db, duration, write_every, queue)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    total = sum(queue.get() for _ in processes)
+    for process in processes:
+        process.join()
+    return total / duration
+
+
+def benchmark_db_qps():
+    """
+    queries per second of concurrent worker processes, with a new connection per query and the rollback journal
+    against pooled connections with write ahead logging
+    """
+    print("database queries per second, 1 in 10 steps writes and the rest read twice")
+
+    with tempfile.TemporaryDirectory() as directory:
+        for name, db_class in (('connection per query', UnpooledDatabase), ('pooled, wal', Database)):
+            db = db_class(os.path.join(directory, f"{db_class.__name__}.db"))
+            db.add_user('user', 'hash')
+            db.add_data_set(1, 'data.csv', 'csv', 1024, b'x' * 1024)
+
+            for workers in (1, 4):
+                qps = queries_per_second(db, workers)
+                record(f"{name} ({workers} workers)", qps=qps)
+                print(f"  {f'{name} ({workers} workers)':<45} {qps:9.0f} queries/s")
+
+
+def write_csv(path, size_bytes, seed=0):
+    """
+    writes a synthetic csv file of about size_bytes, with integer, float, bool and text columns, some of the text
+    padded with spaces the way hand made csv files often are
+
+    Args:
+    path -> str: path of the file to write
+    size_bytes -> int: approximate size of the file
+    seed -> int: seed of the random data
+    """
+    rng = np.random.default_rng(seed)
+    rows = max(1, size_bytes // 60) # a row of these columns is about 60 bytes
+    pd.DataFrame({
+        'id': [f"row{i}" for i in range(rows)],
+        'int_col': rng.integers(0, 1000, rows),
+        'float_col': rng.normal(size=rows).round(4),
+        'whole_float_col': rng.integers(0, 10, rows).astype(float),
+        'str_col': rng.choice(['red', ' green', 'blue ', ' yellow '], rows),
+        'bool_col': rng.choice([True, False], rows),
+    }).to_csv(path, index=False)
+
+
+def benchmark_csv():
+    """
+    time to read and process csv files, pd.read_csv then process_data (the way datasets used to be read) against
+    ingest_csv
+    """
+    print("reading and processing csv files")
+
+    with tempfile.TemporaryDirectory() as directory:
+        for label, size_bytes, repeat in (('100 kb', 100 * 2**10, 20), ('10 mb', 10 * 2**20, 3), ('100 mb', 100 * 2**20, 1)):
+            path = os.path.join(directory, f"{label}.csv")
+            write_csv(path, size_bytes)
+
+            print_result(f"read_csv + process_data ({label})", *time_call(lambda: process_data(pd.read_csv(path)), repeat=repeat))
+            print_result(f"ingest_csv ({label})", *time_call(lambda: ingest_csv(path), repeat=repeat))
+
+
+def _process_data_copying(df):
+    # process_data the way it used to be, a full copy from convert_dtypes then a reassigned column per string column
+    df = df.convert_dtypes()
+    for column in df.columns:
+        if df[column].dtype == 'string':
+            df[column] = df[column].str.strip()
+    return df
+
+
+def wide_string_frame(rows, columns, seed=0):
+    """
+    Args:
+    rows -> int: number of rows
+    columns -> int: number of columns, every fourth column is numeric and the rest are padded strings
+    seed -> int: seed of the random data
+
+    Returns:
+    df -> DataFrame: the unprocessed data frame, the way pd.read_csv returns it
+    """
+    rng = np.random.default_rng(seed)
+    words = np.array([f" word{i} " for i in range(500)], dtype=object)
+    data = {}
+    for i in range(columns):
+        if i % 4 == 3:
+            data[f"num_{i}"] = rng.normal(size=rows)
+        elif i % 4 == 2:
+            # mostly unique values, such as names or ids
+            data[f"str_{i}"] = [f" value {i} {j} " for j in rng.integers(0, rows, rows)]
+        else:
+            data[f"str_{i}"] = words[rng.integers(0, len(words), rows)]
+    return pd.DataFrame(data)
+
+
+def benchmark_process_memory(rows=100000, columns=40):
+    """
+    peak memory of processing a wide string heavy dataset, the copying process_data against the single pass
+    process_data, as a multiple of the memory used by the raw frame. the raw frame is built in the measured process
+    so the peak includes it
+    """
+    print(f"peak memory of process_data on {rows} rows x {columns} columns, mostly strings")
+
+    raw_mb = wide_string_frame(rows, columns).memory_usage(deep=True).sum() / 2**20
+    print(f"  {'raw frame':<45} {raw_mb:9.1f} mb")
+
+    variants = (
+        ('copying process_data', _process_data_copying),
+        ('process_data', process_data),
+        ('process_data inplace', lambda df: process_data(df, inplace=True)),
+    )
+    for name, func in variants:
+        peak_kb = peak_rss_kb(lambda: func(wide_string_frame(rows, columns)))
+        record(name, peak_kb=peak_kb)
+        peak_mb = peak_kb / 1024
+        print(f"  {name:<45} {peak_mb:9.1f} mb   {peak_mb / raw_mb:5.2f}x raw")
+
+    column_times = {}
+    process_data(wide_string_frame(rows, columns), inplace=True, column_times=column_times)
+    slowest = sorted(column_times.items(), key=lambda item: item[1], reverse=True)[:5]
+    print("  slowest columns: " + ", ".join(f"{column} {seconds * 1000:.1f} ms" for (_, column), seconds in slowest))
+
+
+# rows of the synthetic datasets the suite is run on by default, larger sizes (such as 1000000) take minutes and
+# are picked with --rows
+SUITE_ROWS = (1000, 10000, 100000)
+
+# xlsx files are slow to write and read, only datasets up to this many rows are also benchmarked as xlsx
+XLSX_MAX_ROWS = 100000
+
+# column types plan_visuals has visuals for, make_data_set has two columns of each
+COLUMN_TYPES = ('int', 'float', 'str', 'bool')
+
+
+def make_data_set(rows, seed=0):
+    """
+    makes a synthetic dataset with two columns of every column type plan_visuals has visuals for, some of the text
+    padded with spaces the way hand made files often are
+
+    Args:
+    rows -> int: number of rows
+    seed -> int: seed of the random data
+
+    Returns:
+    df -> DataFrame: the unprocessed data frame, the way pd.read_csv returns it
+    """
+    rng = np.random.default_rng(seed)
+    words = np.array([f" word{i} " for i in range(200)], dtype=object)
+    return pd.DataFrame({
+        'int_col': rng.integers(0, 100, rows),
+        'int_col2': rng.integers(0, 1000, rows),
+        'float_col': rng.normal(size=rows).round(4),
+        'float_col2': rng.exponential(size=rows).round(4),
+        'str_col': words[rng.integers(0, 8, rows)],
+        'str_col2': words[rng.integers(0, len(words), rows)],
+        'bool_col': rng.random(rows) < 0.5,
+        'bool_col2': rng.random(rows) < 0.2,
+    })
+
+
+def plot_branches():
+    """
+    Returns:
+    branches -> list: (x column, y column) of every branch of plan_visuals for make_data_set, each column type on
+    its own and every pair of column types
+    """
+    branches = [(f"{column_type}_col", None) for column_type in COLUMN_TYPES]
+    for i, x_type in enumerate(COLUMN_TYPES):
+        for y_type in COLUMN_TYPES[i:]:
+            # the second column of the same type, so a column isnt plotted against itself
+            branches.append((f"{x_type}_col", f"{y_type}_col2" if x_type == y_type else f"{y_type}_col"))
+    return branches
+
+
+def _time_dashboard(path, rows, repeat):
+    # imported here since importing app opens the database, blob store and render cache in the working directory,
+    # and starts the maintenance scheduler
+    import app as visualizze
+
+    visualizze.app.config['SECRET_KEY'] = visualizze.app.config['SECRET_KEY'] or 'benchmark'
+    client = visualizze.app.test_client()
+    client.post('/continue_without_account')
+
+    def request(method, url, **kwargs):
+        # an error page is fast, so a failed request would look like a speed up
+        response = client.open(url, method=method, **kwargs)
+        if response.status_code >= 400 or b'class="error-page"' in response.data:
+            raise RuntimeError(f"{method} {url} failed with {response.status_code}")
+        return response
+
+    # larger datasets than the upload limit are benchmarked too
+    visualizze.max_file_size = os.path.getsize(path)
+    visualizze.app.config['MAX_CONTENT_LENGTH'] = None
+
+    def upload():
+        with open(path, 'rb') as f:
+            request('POST', '/visualize', data={'file': (f, 'data.csv')}, content_type='multipart/form-data')
+    print_result(f"upload ({rows} rows)", *time_call(upload, repeat=1))
+    print_result(f"dashboard GET ({rows} rows)", *time_call(lambda: request('GET', '/dashboard'), repeat=repeat))
+
+    for x_col, y_col in (('int_col', 'float_col'), ('str_col', None)):
+        form = {'columnx': x_col, 'columny': y_col or '', 'visualize': ''}
+        def post():
+            # nothing is reused from the render cache, the recommended visual is drawn on every POST
+            visualizze.render_cache.clear()
+            return request('POST', '/dashboard', data=form)
+
+        print_result(f"dashboard POST {x_col}, {y_col} ({rows} rows)", *time_call(post, repeat=repeat))
+
+        # the whole page, the POST and every visual the browser then requests
+        def page():
+            html = post().get_data(as_text=True)
+            for url in sorted(set(re.findall(r'"(/visual/[0-9a-f]+)"', html))):
+                request('GET', url)
+        print_result(f"dashboard page {x_col}, {y_col} ({rows} rows)", *time_call(page, repeat=1))
+
+
+def benchmark_suite(rows_list=SUITE_ROWS):
+    """
+    times the hot paths of visualizze on synthetic datasets of every size in rows_list: reading csv (and xlsx) files,
+    process_data, the column profiles and data report, planning, drawing and png encoding the visuals of every plot
+    branch, and the dashboard end to end through the flask test client. the peak memory of reading, processing and
+    drawing is measured too.
+
+    the dashboard is run with render workers turned off, so every visual of a page is drawn in the request that asks
+    for it instead of in the background
+    """
+    os.environ['VISUALIZZE_RENDER_WORKERS'] = '0'
+    working_directory = os.getcwd()
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            for rows in rows_list:
+                print(f"suite, {rows} rows")
+                repeat = 5 if rows <= 10000 else 1
+                raw = make_data_set(rows)
+
+                # reading and processing
+                csv_path = os.path.join(directory, f"{rows}.csv")
+                raw.to_csv(csv_path, index=False)
+                print_result(f"ingest_csv ({rows} rows)", *time_call(lambda: ingest_csv(csv_path), repeat=repeat))
+                print_memory(f"ingest_csv peak ({rows} rows)", peak_rss_kb(lambda: ingest_csv(csv_path)))
+
+                if openpyxl is not None and rows <= XLSX_MAX_ROWS:
+                    xlsx_path = os.path.join(directory, f"{rows}.xlsx")
+                    raw.to_excel(xlsx_path, index=False)
+                    print_result(f"read_excel + process_data ({rows} rows)", *time_call(lambda: process_data(pd.read_excel(xlsx_path)), repeat=1))
+
+                print_result(f"process_data ({rows} rows)", *time_call(lambda: process_data(raw), repeat=repeat))
+                print_memory(f"process_data peak ({rows} rows)", peak_rss_kb(lambda: process_data(raw)))
+
+                # data report
+                data = ingest_csv(csv_path)
+                profiles = profile_data_set(data)
+                print_result(f"profile_data_set ({rows} rows)", *time_call(lambda: profile_data_set(data), repeat=repeat))
+                print_result(f"get_data_report_data ({rows} rows)", *time_call(lambda: get_data_report_data(data, profiles), repeat=repeat))
+
+                # every plot branch, planned then each visual drawn and encoded
+                for x_col, y_col in plot_branches():
+                    branch = f"{x_col}, {y_col} ({rows} rows)"
+                    print_result(f"plan {branch}", *time_call(lambda: plan_visuals(data, x_col, y_col), repeat=repeat))
+                    plan = plan_visuals(data, x_col, y_col)
+
+                    figures = []
+                    def draw():
+                        figures.extend(render_visual(spec) for spec in plan)
+                    def encode():
+                        for fig in figures:
+                            figure_to_png(fig)
+                    print_result(f"draw {branch}", *time_call(draw, repeat=1))
+                    print_result(f"png {branch}", *time_call(encode, repeat=1))
+                    del figures[:]
+                    print_memory(f"draw + png peak {branch}", peak_rss_kb(lambda: [render_png(spec) for spec in plan]))
+
+                # end to end, last since the app stays imported
+                _time_dashboard(csv_path, rows, repeat)
+                print()
+        finally:
+            os.chdir(working_directory)
+
+
+def compare_results(baseline, tolerance=0.1):
+    """
+    prints how the results of this run compare to a saved baseline, results more than tolerance slower (or more
+    memory, or fewer queries per second) are marked as regressions
+
+    Args:
+    baseline -> dict: results of an earlier run, see RESULTS
+    tolerance -> float: relative change that is still taken as noise
+
+    Returns:
+    regressions -> int: number of regressed results
+    """
+    # measurement -> whether higher is better
+    measurements = {'best': False, 'peak_kb': False, 'qps': True}
+    regressions = 0
+
+    print(f"compared to the baseline (tolerance {tolerance:.0%})")
+    for benchmark, results in RESULTS.items():
+        for name, result in results.items():
+            base = baseline.get(benchmark, {}).get(name)
+            if base is None:
+                continue
+            for measurement, higher_is_better in measurements.items():
+                if not base.get(measurement) or measurement not in result:
+                    continue
+                change = result[measurement] / base[measurement] - 1
+                regressed = -change > tolerance if higher_is_better else change > tolerance
+                regressions += regressed
+                marker = "REGRESSION" if regressed else ""
+                print(f"  {benchmark}: {name:<55} {measurement:<8} {change:+8.1%} {marker}")
+    print(f"  {regressions} regressions")
+    return regressions
+
+
+# benchmark names -> benchmark functions
+BENCHMARKS = {
+    'theme': benchmark_theme,
+    'row_budget': benchmark_row_budget,
+    'db_qps': benchmark_db_qps,
+    'csv': benchmark_csv,
+    'process_memory': benchmark_process_memory,
+    'suite': benchmark_suite,
+}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="benchmarks for the slow paths of visualizze")
+    parser.add_argument('names', nargs='*', metavar='name', help=f"benchmarks to run, all of them by default: {', '.join(BENCHMARKS)}")
+    parser.add_argument('--rows', nargs='+', type=int, default=SUITE_ROWS, help="dataset sizes of the suite benchmark")
+    parser.add_argument('--save', help="path to save the results to, as a baseline for later runs")
+    parser.add_argument('--compare', help="path of a saved baseline to compare the results to")
+    parser.add_argument('--tolerance', type=float, default=0.1, help="relative change compared to the baseline taken as noise")
+    args = parser.parse_args()
+
+    # the names are checked here instead of with choices, which shows an empty choice in --help for nargs='*'
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(unknown)} (choose from {', '.join(BENCHMARKS)})")
+
+    for running_benchmark in args.names or list(BENCHMARKS):
+        if running_benchmark == 'suite':
+            benchmark_suite(args.rows)
+        else:
+            BENCHMARKS[running_benchmark]()
+        print()
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(RESULTS, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare_results(json.load(f), tolerance=args.tolerance)
+        sys.exit(1 if regressions else 0)
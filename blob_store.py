@@ -0,0 +1,122 @@
+import os
+import time
+import hashlib
+import threading
+from io import BytesIO
+
+
+class BlobStore:
+    """
+    content addressed file store for uploaded datasets, every file is stored once under the sha256 of its
+    contents (the same hash as cache.hash_data_set), so the same upload saved and sent to the visualizer any number of times
+    is written to disk once.
+
+    the database keeps the hashes and counts the rows referencing each blob (see the blobs table in database.py),
+    blobs that are no longer referenced are removed by collect_garbage.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, blob_hash):
+        """
+        Args:
+        blob_hash -> str: the hash of the blob
+
+        Returns:
+        path -> str: the path of the blob file, blobs are spread over 256 sub directories by their first two characters
+        """
+        return os.path.join(self.directory, blob_hash[:2], blob_hash)
+
+    def put(self, data):
+        """
+        stores a blob, if the same contents are already stored nothing is written
+
+        Args:
+        data -> bytes: the contents of the blob
+
+        Returns:
+        blob_hash -> str: the hash of the blob, used to read it back
+        """
+        return self.put_stream(BytesIO(data))[0]
+
+    def put_stream(self, stream, max_bytes=None, chunk_size=2**16):
+        """
+        stores a blob from a file like object, such as an uploaded file, a chunk at a time. the chunks are hashed and
+        written as they are read, so the whole blob is never held in memory
+
+        Args:
+        stream -> file: the contents of the blob, read until the end
+        max_bytes -> int: max size of the blob, reading stops and nothing is stored once the stream is larger
+        chunk_size -> int: number of bytes read at a time
+
+        Returns:
+        blob_hash -> str: the hash of the blob, used to read it back. None if the stream was larger than max_bytes
+        size -> int: the size of the blob in bytes, or the number of bytes read before reading stopped
+        """
+        # write to a temporary file first, so a half written blob is never read
+        tmp_path = os.path.join(self.directory, f"upload.{os.getpid()}.{threading.get_ident()}.tmp")
+        hasher = hashlib.sha256()
+        size = 0
+        try:
+            with open(tmp_path, 'wb') as f:
+                while chunk := stream.read(chunk_size):
+                    size += len(chunk)
+                    if max_bytes is not None and size > max_bytes:
+                        break
+                    hasher.update(chunk)
+                    f.write(chunk)
+
+            if max_bytes is not None and size > max_bytes:
+                os.remove(tmp_path)
+                return None, size
+
+            blob_hash = hasher.hexdigest()
+            path = self.path(blob_hash)
+            try:
+                # already stored, refresh the modification time so collect_garbage doesnt remove the blob before
+                # it is referenced
+                os.utime(path)
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        return blob_hash, size
+
+    def exists(self, blob_hash):
+        return os.path.exists(self.path(blob_hash))
+
+    def collect_garbage(self, referenced_hashes, grace_seconds=60 * 60):
+        """
+        removes the blobs that arent referenced by the database anymore
+
+        Args:
+        referenced_hashes -> set: hashes of every blob still referenced, see Database.get_referenced_blob_hashes
+        grace_seconds -> int: blobs written or put more recently than this are kept, since an upload stores its blob
+        before it adds the row that references it
+
+        Returns:
+        removed -> int: number of blobs removed
+        """
+        removed = 0
+        cutoff = time.time() - grace_seconds
+        for sub_directory in os.scandir(self.directory):
+            if not sub_directory.is_dir():
+                continue
+            for entry in os.scandir(sub_directory.path):
+                blob_hash = entry.name.split('.')[0]
+                if blob_hash in referenced_hashes:
+                    continue
+                try:
+                    if entry.stat().st_mtime > cutoff:
+                        continue
+                    os.remove(entry.path)
+                    removed += 1
+                except OSError:
+                    pass # already removed by another worker
+        return removed
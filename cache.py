@@ -0,0 +1,239 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+def hash_data_set(data_set):
+    """
+    hashes the raw bytes of an uploaded dataset, used as part of cache keys so a cached result
+    can never be returned for different file contents
+
+    Args:
+    data_set -> bytes: the binary data of the dataset file
+
+    Returns:
+    content_hash -> str: the sha256 hex digest of the data
+    """
+    return hashlib.sha256(data_set).hexdigest()
+
+
+class BoundedLRUCache:
+    """
+    process-local LRU cache bounded by the total size of its values, the least recently used values are evicted
+    first once the bound is passed. the caches below are built on it, each with its own size function
+
+    Args:
+    max_bytes -> int: max total size of the cached values, a value larger than this on its own is not cached
+    size -> function: takes a value and returns its size in bytes
+    """
+    def __init__(self, max_bytes, size):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._size = size
+        self._entries = OrderedDict() # key -> (value, size in bytes)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Returns:
+        value -> the cached value, or None if it is not cached
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            # mark as most recently used
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value):
+        """
+        adds a value to the cache, evicting the least recently used values until the cache fits in max_bytes
+        """
+        # sized outside the lock, measuring a value (such as the memory of a DataFrame) can be slow
+        size = self._size(value)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            # replace an existing entry for the same key
+            if key in self._entries:
+                self.total_bytes -= self._entries.pop(key)[1]
+
+            self._entries[key] = (value, size)
+            self.total_bytes += size
+
+            # evict least recently used entries until the cache is within its bound
+            while self.total_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.total_bytes -= evicted_size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DataFrameCache(BoundedLRUCache):
+    """
+    process-local LRU cache of parsed and processed DataFrames, keyed by the content hash of the dataset file (see
+    hash_data_set), so every dataset with the same file (such as a saved dataset sent back to the visualizer) shares
+    one cached frame. the cache is bounded by the total memory used by the cached DataFrames.
+
+    cached DataFrames are shared between requests, so they should be treated as read only.
+    """
+    def __init__(self, max_bytes):
+        super().__init__(max_bytes, size=lambda df: int(df.memory_usage(index=True, deep=True).sum()))
+
+
+class SortOrderCache(BoundedLRUCache):
+    """
+    process-local LRU cache of the sorted row orders of the dashboard data table, keyed by the content hash of the
+    dataset file and the sort column (see functions.get_sort_order), so paging through a sorted dataset sorts it once
+    instead of on every page. the cache is bounded by the total memory used by the cached orders.
+    """
+    def __init__(self, max_bytes):
+        super().__init__(max_bytes, size=lambda order: order.nbytes)
+
+    def get(self, content_hash, sort):
+        return super().get((content_hash, sort))
+
+    def put(self, content_hash, sort, order):
+        super().put((content_hash, sort), order)
+
+
+def render_cache_key(content_hash, x_col, y_col, plot_title, theme, style_version, dpi=None, row_budget=None):
+    """
+    builds the render cache key of a visual, any change to the dataset contents, the selected columns,
+    the plot or the styling of the visuals gives a different key
+
+    Args:
+    content_hash -> str: the hash of the dataset file, see hash_data_set
+    x_col, y_col -> str: the selected column names, None if not selected
+    plot_title -> str: the title of the planned visual
+    theme -> str: the name of the theme the visual is drawn with, see functions.THEMES
+    style_version -> int: version of the visual styling, see functions.STYLE_VERSION
+    dpi -> int: the resolution the visual is rasterized at, None for the full size visual
+    row_budget -> int: the max number of rows the visual is drawn from, see functions.reduce_plot_data
+
+    Returns:
+    key -> str: a sha256 hex digest, safe to use as a file name
+    """
+    parts = [content_hash, repr(x_col), repr(y_col), plot_title, theme, str(style_version), repr(dpi), repr(row_budget)]
+    return hashlib.sha256("\0".join(parts).encode('utf-8')).hexdigest()
+
+
+class RenderCache:
+    """
+    size bounded cache of encoded png visuals, see render_cache_key for the keys.
+
+    pngs are kept in a process-local LRU memory cache and, if a directory is given, also written to disk
+    so every gunicorn worker on the machine can share hits. the disk cache is bounded by evicting the
+    least recently used files (by modification time, which is refreshed on every disk hit), after every put or,
+    with evict_on_put=False, only when evict_disk is called (such as by a maintenance job, see maintenance.Maintenance).
+    """
+    def __init__(self, max_memory_bytes, directory=None, max_disk_bytes=0, evict_on_put=True):
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self.evict_on_put = evict_on_put
+        self._memory = BoundedLRUCache(max_memory_bytes, size=len) # key -> png bytes
+
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.png")
+
+    def get(self, key):
+        """
+        Args:
+        key -> str: the render cache key, see render_cache_key
+
+        Returns:
+        png -> bytes: the cached png, or None if it is not cached
+        """
+        png = self._memory.get(key)
+        if png is not None or not self.directory:
+            return png
+
+        # fall back to the disk cache, which may have been filled by another worker
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                png = f.read()
+            os.utime(path) # mark as recently used for disk eviction
+        except OSError:
+            return None
+
+        self._memory.put(key, png)
+        return png
+
+    def put(self, key, png):
+        """
+        Args:
+        key -> str: the render cache key, see render_cache_key
+        png -> bytes: the encoded png
+        """
+        self._memory.put(key, png)
+
+        if self.directory and len(png) <= self.max_disk_bytes:
+            # write to a temporary file first, so other workers never read a half written png
+            tmp_path = f"{self._path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                with open(tmp_path, 'wb') as f:
+                    f.write(png)
+                os.replace(tmp_path, self._path(key))
+            except OSError as e:
+                print(f"Error writing to the render cache: {e}")
+                return
+            if self.evict_on_put:
+                self.evict_disk()
+
+    def evict_disk(self):
+        """
+        removes the least recently used files of the disk cache until it fits in max_disk_bytes
+
+        Returns:
+        removed -> int: number of files removed
+        """
+        if not self.directory:
+            return 0
+
+        # list the cached files oldest first
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.png'):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue # removed by another worker
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+
+        removed = 0
+        disk_bytes = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if disk_bytes <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                pass # already removed by another worker
+            disk_bytes -= size
+        return removed
+
+    def clear(self):
+        self._memory.clear()
+
+        if self.directory:
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith('.png'):
+                    try:
+                        os.remove(entry.path)
+                    except OSError:
+                        pass
@@ -1,71 +1,94 @@
+import os
 import sqlite3
+import threading
+import time
 from werkzeug.security import check_password_hash
 
 
 class Database:
+    # seconds a query waits for another connection to release its lock before failing with "database is locked"
+    busy_timeout = 5
+    # number of prepared statements each connection keeps, every query in this class fits easily
+    cached_statements = 256
+    # write ahead logging lets readers keep reading while a write (such as expire_data_sets) is in progress
+    journal_mode = 'WAL'
+    # pages freed by deletes are given back to the file system a few at a time by PRAGMA incremental_vacuum, see
+    # expire_data_sets. it only applies to database files created with it, older files switch on their next VACUUM
+    auto_vacuum = 'INCREMENTAL'
+
     def __init__(self, db_path):
         self.db_path = db_path
-        self.create_users_table()
-        self.create_data_sets_table()
-        self.create_users_data_sets_table()
+        self._local = threading.local() # the connection of each thread, see get_connection
 
-    def get_connection(self):
-        conn = sqlite3.connect(self.db_path)
+        # the auto vacuum and journal modes are stored in the database file so they only have to be set once, auto
+        # vacuum first since it can only be set before the first table is created
+        with self.get_connection() as conn:
+            conn.execute(f"PRAGMA auto_vacuum={self.auto_vacuum}")
+            conn.execute(f"PRAGMA journal_mode={self.journal_mode}")
+
+        self.migrate()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout, cached_statements=self.cached_statements)
         conn.row_factory = sqlite3.Row
+        # with WAL, NORMAL only syncs at checkpoints, a power loss can lose the last commits but never corrupts the db
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def get_connection(self):
+        """
+        gets the connection of the current thread, each thread keeps one open connection and reuses it (along with
+        its cached prepared statements) for every query, instead of opening a new connection per query.
+
+        sqlite connections cant be shared between processes, so a process forked after the connection was opened
+        (such as a gunicorn worker) opens its own
+
+        Returns:
+        conn -> sqlite3.Connection: the connection, using it in a with block commits or rolls back like before
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = self._local.conn = self._connect()
+            self._local.pid = os.getpid()
         return conn
 
+    def close_connection(self):
+        # closes the connection of the current thread, the next query opens a new one
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            conn.close()
+        self._local.conn = None
+
     """
-    table initializations
+    schema migrations
     """
-    def create_users_table(self):
-        with self.get_connection() as conn:
-            conn.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT NOT NULL UNIQUE,
-                password_hash TEXT NOT NULL,
-                email TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            conn.commit()
+    def migrate(self):
+        """
+        brings the schema of the database up to date by applying every migration in MIGRATIONS it doesnt have yet.
+        the version of the database (the number of migrations applied to it) is stored in the file as PRAGMA user_version
 
-    def create_data_sets_table(self):
-         with self.get_connection() as conn:
-            conn.execute("""
-            CREATE TABLE IF NOT EXISTS data_sets (
-                data_set_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                file_name TEXT NOT NULL,
-                file_type TEXT NOT NULL,
-                file_size_bytes INTEGER NOT NULL,
-                uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                data_set BLOB NOT NULL,
-                         
-                -- ON DELETE CASCADE, deletes all user_id entries in this table when user_id is removed from users
-                FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
-            )
-            """)
-            conn.commit()
+        each migration runs in its own write transaction along with the version update, so a migration is applied
+        completely or not at all, and worker processes starting at the same time wait for each other instead of
+        applying a migration twice
 
-    def create_users_data_sets_table(self):
-        with self.get_connection() as conn:
-            conn.execute("""
-            CREATE TABLE IF NOT EXISTS users_data_sets (
-                saved_data_set_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id,
-                data_set BLOB NOT NULL,
-                file_name TEXT NOT NULL,
-                file_type TEXT NOT NULL,
-                file_size_bytes INTEGER NOT NULL,
-                user_max_server_storage_bytes INTEGER NOT NULL,
-                saved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                
-                -- ON DELETE CASCADE, deletes all user_id entries in this table when user_id is removed from users
-                FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
-            )
-            """)
-            conn.commit()
+        Returns:
+        version -> int: the version of the database
+        """
+        conn = self.get_connection()
+        for version, migration in enumerate(MIGRATIONS, start=1):
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # read inside the transaction, another process may have just applied it
+                if conn.execute("PRAGMA user_version").fetchone()[0] >= version:
+                    conn.rollback()
+                    continue
+                migration(conn)
+                conn.execute(f"PRAGMA user_version = {version}")
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+        return conn.execute("PRAGMA user_version").fetchone()[0]
 
     """
     user table functions
@@ -128,15 +151,15 @@ class Database:
     """
     data_sets table functions
     """ 
-    def add_data_set(self, user_id, file_name, file_type, file_size, data_set):
+    def add_data_set(self, user_id, file_name, file_type, file_size, blob_hash):
         with self.get_connection() as conn:
             try:
-                # add new dataset to data_sets table
+                # add new dataset to data_sets table, the file itself is in the blob store
                 cursor = conn.cursor()
                 cursor.execute("""
-                    INSERT INTO data_sets (user_id, file_name, file_type, file_size_bytes, uploaded_at, data_set)
-                    VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP, ?)
-                """, (user_id, file_name, file_type, file_size, data_set))
+                    INSERT INTO data_sets (user_id, file_name, file_type, file_size_bytes, uploaded_at, last_accessed_at, data_set, blob_hash)
+                    VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP, X'', ?)
+                """, (user_id, file_name, file_type, file_size, blob_hash))
 
                 dataset_id = cursor.lastrowid
                 conn.commit()
@@ -150,8 +173,10 @@ class Database:
         try:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
+                # the data_set blob is only read for rows from before the blob store
                 cursor.execute('''
-                    SELECT file_name, file_type, data_set, file_size_bytes
+                    SELECT file_name, file_type, CASE WHEN blob_hash IS NULL THEN data_set END, file_size_bytes, blob_hash,
+                        CAST(strftime('%s', 'now') - strftime('%s', last_accessed_at) AS INTEGER)
                     FROM data_sets
                     WHERE data_set_id = ?
                 ''', (dataset_id,))
@@ -161,8 +186,10 @@ class Database:
                     return {
                         'file_name': result[0],
                         'file_type': result[1],
-                        'data_set': result[2],  # binary data of the dataset file
-                        'file_size': result [3]
+                        'data_set': result[2],  # binary data of the dataset file, None if it is in the blob store
+                        'file_size': result [3],
+                        'blob_hash': result[4], # hash of the dataset file in the blob store
+                        'idle_seconds': result[5], # seconds since the dataset was last accessed, see touch_data_set
                     }
                 else:
                     return None
@@ -171,30 +198,147 @@ class Database:
             print(f"Error retrieving dataset: {str(e)}")
             return None
 
+    def touch_data_set(self, dataset_id):
+        # marks a dataset as accessed now, so it isnt expired while it is in use (see expire_data_sets)
+        with self.get_connection() as conn:
+            conn.execute("UPDATE data_sets SET last_accessed_at = CURRENT_TIMESTAMP WHERE data_set_id = ?", (dataset_id,))
+            conn.commit()
+
+    def expire_data_sets(self, idle_seconds, max_age_seconds, batch_size=500, vacuum_pages=1000):
+        """
+        deletes the datasets that werent accessed for idle_seconds, or were uploaded over max_age_seconds ago.
+        they are deleted in batches of batch_size rows, each in its own short write transaction, so other writes only
+        ever wait for one batch. the pages freed are then given back to the file system with an incremental vacuum.
+
+        the files of the deleted datasets stay in the blob store until BlobStore.collect_garbage
+
+        Args:
+        idle_seconds -> int: datasets last accessed longer ago than this are deleted
+        max_age_seconds -> int: datasets uploaded longer ago than this are deleted even if they are in use
+        batch_size -> int: max number of rows deleted per transaction
+        vacuum_pages -> int: max number of pages given back to the file system per transaction
+
+        Returns:
+        metrics -> dictionary: number of 'rows' deleted, 'batches', 'file_bytes' of the deleted datasets, 'db_bytes'
+        reclaimed from the database file, 'lock_seconds' the write lock was held in total and 'max_lock_seconds'
+        held by the longest transaction
+        """
+        metrics = {'rows': 0, 'batches': 0, 'file_bytes': 0, 'db_bytes': 0, 'lock_seconds': 0.0, 'max_lock_seconds': 0.0}
+        conn = self.get_connection()
+
+        def write(sql, params=()):
+            # runs a write in its own transaction, timing how long it holds the write lock
+            conn.execute("BEGIN IMMEDIATE")
+            start = time.perf_counter()
+            try:
+                result = conn.execute(sql, params).fetchall()
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            held = time.perf_counter() - start
+            metrics['lock_seconds'] += held
+            metrics['max_lock_seconds'] = max(metrics['max_lock_seconds'], held)
+            return result
+
+        while True:
+            deleted = write("""
+                DELETE FROM data_sets WHERE data_set_id IN (
+                    SELECT data_set_id FROM data_sets
+                    WHERE last_accessed_at < datetime('now', ?) OR uploaded_at < datetime('now', ?)
+                    LIMIT ?
+                )
+                RETURNING file_size_bytes
+            """, (f"{-int(idle_seconds)} seconds", f"{-int(max_age_seconds)} seconds", batch_size))
+            if not deleted:
+                break
+            metrics['rows'] += len(deleted)
+            metrics['batches'] += 1
+            metrics['file_bytes'] += sum(row[0] for row in deleted)
+            if len(deleted) < batch_size:
+                break
+
+        # no-op for database files without incremental auto vacuum
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        while conn.execute("PRAGMA freelist_count").fetchone()[0]:
+            pages = conn.execute("PRAGMA page_count").fetchone()[0]
+            write(f"PRAGMA incremental_vacuum({int(vacuum_pages)})")
+            freed = pages - conn.execute("PRAGMA page_count").fetchone()[0]
+            if not freed:
+                break
+            metrics['db_bytes'] += freed * page_size
+
+        return metrics
+
     """
     users_data_sets table functions
     """ 
-    def save_user_data_set(self, user_id, data_set, file_name, file_type, file_size, user_max_server_storage_bytes):
+    def save_user_data_set(self, user_id, blob_hash, file_name, file_type, file_size, user_max_server_storage_bytes):
         with self.get_connection() as conn:
             try:
-                # add new dataset to data_sets table
+                # add new dataset to users_data_sets table, the file itself is in the blob store
                 cursor = conn.cursor()
                 cursor.execute("""
-                    INSERT INTO users_data_sets (user_id, data_set, file_name, file_type, file_size_bytes, user_max_server_storage_bytes, saved_at)
-                    VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-                """, (user_id, data_set, file_name, file_type, file_size, user_max_server_storage_bytes))
+                    INSERT INTO users_data_sets (user_id, data_set, blob_hash, file_name, file_type, file_size_bytes, user_max_server_storage_bytes, saved_at)
+                    VALUES (?, X'', ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+                """, (user_id, blob_hash, file_name, file_type, file_size, user_max_server_storage_bytes))
                 conn.commit()
 
             except sqlite3.IntegrityError:
                 # incase of a strange error
                 print(f"Error: Failed to save the dataset for user ID {user_id} and file '{file_name}'.")
 
+    def list_saved_user_data_sets(self, user_id, limit=50, after=None, include_total=False):
+        """
+        lists the saved datasets of a user newest first, one page at a time. only the metadata is read, from the
+        users_data_sets_listing index, the files are read by get_saved_user_dataset_data_by_id when one is opened.
+
+        pages are found by keyset instead of OFFSET, so a later page costs the same as the first
+
+        Args:
+        user_id -> int: the id of the user
+        limit -> int: max number of saved datasets in the page
+        after -> tuple: (saved_at, saved_data_set_id) of the last saved dataset of the previous page, None for the first page
+        include_total -> bool: also counts every saved dataset of the user
+
+        Returns:
+        page -> dictionary: 'data_sets' a list of dictionaries of saved_data_set_id, file_name, file_type,
+        file_size_bytes and saved_at, 'next' the after of the next page (None if this is the last page), and 'total'
+        the number of saved datasets of the user (None unless include_total)
+        """
+        query = """
+            SELECT saved_data_set_id, file_name, file_type, file_size_bytes, saved_at
+            FROM users_data_sets
+            WHERE user_id = ?
+        """
+        params = [user_id]
+        if after is not None:
+            query += " AND (saved_at, saved_data_set_id) < (?, ?)"
+            params.extend(after)
+        query += " ORDER BY saved_at DESC, saved_data_set_id DESC LIMIT ?"
+        # one extra row tells if there is a next page
+        params.append(limit + 1)
+
+        with self.get_connection() as conn:
+            rows = [dict(row) for row in conn.execute(query, params)]
+            total = None
+            if include_total:
+                total = conn.execute("SELECT COUNT(*) FROM users_data_sets WHERE user_id = ?", (user_id,)).fetchone()[0]
+
+        next_after = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_after = (rows[-1]['saved_at'], rows[-1]['saved_data_set_id'])
+
+        return {'data_sets': rows, 'next': next_after, 'total': total}
+
     def get_saved_user_dataset_data_by_id(self, saved_data_set_id):
         try:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
+                # the data_set blob is only read for rows from before the blob store
                 cursor.execute('''
-                    SELECT user_id, file_name, file_type, data_set, file_size_bytes
+                    SELECT user_id, file_name, file_type, CASE WHEN blob_hash IS NULL THEN data_set END, file_size_bytes, blob_hash
                     FROM users_data_sets
                     WHERE saved_data_set_id = ?
                 ''', (saved_data_set_id,))
@@ -205,8 +349,9 @@ class Database:
                         'user_id': result[0],
                         'file_name': result[1],
                         'file_type': result[2],
-                        'data_set': result[3],  # binary data of the dataset file
-                        'file_size': result [4]
+                        'data_set': result[3],  # binary data of the dataset file, None if it is in the blob store
+                        'file_size': result [4],
+                        'blob_hash': result[5], # hash of the dataset file in the blob store
                     }
                 else:
                     return None
@@ -215,6 +360,30 @@ class Database:
             print(f"Error retrieving dataset: {str(e)}")
             return None
         
+    def move_saved_user_data_set_to_blob_store(self, saved_data_set_id, blob_hash):
+        """
+        replaces the file of a saved dataset from before the blob store with its hash, once the file was put in the
+        blob store. the blob reference is counted here, the triggers only count inserted and deleted rows
+
+        Args:
+        saved_data_set_id -> int: the id of the saved dataset
+        blob_hash -> str: the hash of its file in the blob store
+        """
+        with self.get_connection() as conn:
+            cursor = conn.execute("""
+                UPDATE users_data_sets SET blob_hash = ?, data_set = X''
+                WHERE saved_data_set_id = ? AND blob_hash IS NULL
+            """, (blob_hash, saved_data_set_id))
+
+            # nothing to count if it was already moved
+            if cursor.rowcount:
+                conn.execute("""
+                    INSERT INTO blobs (blob_hash, size_bytes, ref_count)
+                    SELECT blob_hash, file_size_bytes, 1 FROM users_data_sets WHERE saved_data_set_id = ?
+                    ON CONFLICT (blob_hash) DO UPDATE SET ref_count = ref_count + 1
+                """, (saved_data_set_id,))
+            conn.commit()
+
     def delete_saved_user_dataset_by_id(self, saved_data_set_id):
         try:
             with self.get_connection() as conn:
@@ -240,6 +409,25 @@ class Database:
             print(f"Error fetching row count for user_id {user_id}: {str(e)}")
             return 0
 
+    """
+    blobs table functions
+    """
+    def delete_unreferenced_blobs(self):
+        # removes the rows of blobs no dataset references anymore, their files are removed by BlobStore.collect_garbage
+        with self.get_connection() as conn:
+            conn.execute("DELETE FROM blobs WHERE ref_count <= 0")
+            conn.commit()
+
+    def get_referenced_blob_hashes(self):
+        """
+        Returns:
+        blob_hashes -> set: the hashes of every blob referenced by data_sets or users_data_sets
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT blob_hash FROM blobs WHERE ref_count > 0")
+            return {row[0] for row in cursor.fetchall()}
+
     """
     generic database helper functions
     """
@@ -269,15 +457,179 @@ class Database:
             conn.commit()
             print("All tables and sequences cleared")
 
-    def clear_data_sets(self):
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            
-            # deltes all rows in the data_sets table
-            cursor.execute("DELETE FROM data_sets")
-            # reset data_set_id sequence
-            cursor.execute("DELETE FROM sqlite_sequence WHERE name='data_sets'")
-            conn.commit()
-            print("data_sets data cleared")
+
+"""
+schema migrations, see Database.migrate
+
+each migration takes the connection and brings the schema from the previous version to the next. a migration is never
+changed once it is released, changes to the schema are added as new migrations at the end of MIGRATIONS
+"""
+
+def _add_column_if_missing(conn, table, column, column_type):
+    # adds a column to a table of a database created before the column existed
+    columns = [row['name'] for row in conn.execute(f"PRAGMA table_info({table})")]
+    if column not in columns:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+
+
+def _create_blob_ref_triggers(conn, table):
+    # keeps the ref_count of each blob up to date as rows of the table are added and deleted, so no insert or delete
+    # can forget to update them
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS {table}_add_blob_ref AFTER INSERT ON {table}
+    WHEN NEW.blob_hash IS NOT NULL
+    BEGIN
+        INSERT INTO blobs (blob_hash, size_bytes, ref_count)
+        VALUES (NEW.blob_hash, NEW.file_size_bytes, 1)
+        ON CONFLICT (blob_hash) DO UPDATE SET ref_count = ref_count + 1;
+    END
+    """)
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS {table}_remove_blob_ref AFTER DELETE ON {table}
+    WHEN OLD.blob_hash IS NOT NULL
+    BEGIN
+        UPDATE blobs SET ref_count = ref_count - 1 WHERE blob_hash = OLD.blob_hash;
+    END
+    """)
+
+
+def _migrate_initial_schema(conn):
+    """
+    the schema from before migrations, databases created before then already have some or all of it so every
+    statement only adds what is missing.
+
+    the dataset files are stored in the blob store (see blob_store.BlobStore) under the hash of their contents,
+    data_sets and users_data_sets only keep the blob_hash. the blobs table counts the rows of both tables referencing
+    each blob. the data_set column of both tables is left empty for rows with a blob_hash, it only holds the files of
+    rows saved before the blob store
+    """
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT NOT NULL UNIQUE,
+        password_hash TEXT NOT NULL,
+        email TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS data_sets (
+        data_set_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        file_name TEXT NOT NULL,
+        file_type TEXT NOT NULL,
+        file_size_bytes INTEGER NOT NULL,
+        uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        data_set BLOB NOT NULL,
+        blob_hash TEXT,
+
+        -- ON DELETE CASCADE, deletes all user_id entries in this table when user_id is removed from users
+        FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+    )
+    """)
+    _add_column_if_missing(conn, 'data_sets', 'blob_hash', 'TEXT')
+
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS users_data_sets (
+        saved_data_set_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id,
+        data_set BLOB NOT NULL,
+        file_name TEXT NOT NULL,
+        file_type TEXT NOT NULL,
+        file_size_bytes INTEGER NOT NULL,
+        user_max_server_storage_bytes INTEGER NOT NULL,
+        saved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        blob_hash TEXT,
+
+        -- ON DELETE CASCADE, deletes all user_id entries in this table when user_id is removed from users
+        FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+    )
+    """)
+    _add_column_if_missing(conn, 'users_data_sets', 'blob_hash', 'TEXT')
+
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS blobs (
+        blob_hash TEXT PRIMARY KEY,
+        size_bytes INTEGER NOT NULL,
+        ref_count INTEGER NOT NULL DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    for table in ('data_sets', 'users_data_sets'):
+        _create_blob_ref_triggers(conn, table)
+
+
+def _migrate_users_data_sets_user_id_type(conn):
+    """
+    users_data_sets.user_id had no type, so an id given as text ('1') was stored as text and never matched an
+    integer id (or the index of the next migration). sqlite cant change the type of a column, so the table is
+    rebuilt with user_id INTEGER and the rows copied over, which converts text ids to integers
+    """
+    conn.execute("""
+    CREATE TABLE users_data_sets_new (
+        saved_data_set_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        data_set BLOB NOT NULL,
+        file_name TEXT NOT NULL,
+        file_type TEXT NOT NULL,
+        file_size_bytes INTEGER NOT NULL,
+        user_max_server_storage_bytes INTEGER NOT NULL,
+        saved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        blob_hash TEXT,
+
+        -- ON DELETE CASCADE, deletes all user_id entries in this table when user_id is removed from users
+        FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+    )
+    """)
+    columns = "saved_data_set_id, user_id, data_set, file_name, file_type, file_size_bytes, user_max_server_storage_bytes, saved_at, blob_hash"
+    conn.execute(f"INSERT INTO users_data_sets_new ({columns}) SELECT {columns} FROM users_data_sets")
+
+    # keep the id sequence, so ids of deleted rows arent given out again. copying the rows already added a sequence
+    # row of the highest copied id, which is replaced so the table isnt left with two
+    conn.execute("DELETE FROM sqlite_sequence WHERE name = 'users_data_sets_new'")
+    conn.execute("""
+        INSERT INTO sqlite_sequence (name, seq)
+        SELECT 'users_data_sets_new', seq FROM sqlite_sequence WHERE name = 'users_data_sets'
+    """)
+
+    # the triggers are dropped first so the copied rows keep their blob references
+    conn.execute("DROP TRIGGER IF EXISTS users_data_sets_add_blob_ref")
+    conn.execute("DROP TRIGGER IF EXISTS users_data_sets_remove_blob_ref")
+    conn.execute("DROP TABLE users_data_sets")
+    conn.execute("ALTER TABLE users_data_sets_new RENAME TO users_data_sets")
+    _create_blob_ref_triggers(conn, 'users_data_sets')
+
+
+def _migrate_indexes(conn):
+    """
+    indexes for the per user lookups, so they stay O(log n) as the tables grow. the users_data_sets index covers the
+    saved dataset listing of the history page, which is ordered by saved_at and then id (see
+    Database.list_saved_user_data_sets), so pages are read in index order without sorting and without touching the
+    rows (and the data_set blobs of rows from before the blob store)
+    """
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS users_data_sets_listing
+        ON users_data_sets (user_id, saved_at, saved_data_set_id, file_name, file_type, file_size_bytes)
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS data_sets_user_id ON data_sets (user_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS data_sets_uploaded_at ON data_sets (uploaded_at)")
+
+
+def _migrate_data_sets_last_accessed_at(conn):
+    """
+    datasets expire once they havent been accessed for a while (see Database.expire_data_sets) instead of all at
+    midnight. sqlite cant add a column defaulting to CURRENT_TIMESTAMP, so existing rows start from their uploaded_at
+    """
+    _add_column_if_missing(conn, 'data_sets', 'last_accessed_at', 'TIMESTAMP')
+    conn.execute("UPDATE data_sets SET last_accessed_at = uploaded_at WHERE last_accessed_at IS NULL")
+    conn.execute("CREATE INDEX IF NOT EXISTS data_sets_last_accessed_at ON data_sets (last_accessed_at)")
 
 
+# every migration in order, the version of a database is the number of these applied to it
+MIGRATIONS = (
+    _migrate_initial_schema,
+    _migrate_users_data_sets_user_id_type,
+    _migrate_indexes,
+    _migrate_data_sets_last_accessed_at,
+)
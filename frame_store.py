@@ -0,0 +1,80 @@
+import os
+import threading
+import pandas as pd
+
+# feather files are memory mapped when they are read, pyarrow is optional and pickle files are used without it
+try:
+    import pyarrow.feather as feather
+except ImportError:
+    feather = None
+
+
+# version of functions.process_data and ingestion.ingest_csv, bump this whenever either changes so previously processed
+# frames are not reused
+PROCESS_VERSION = 2
+
+
+class ProcessedFrameStore:
+    """
+    stores the processed DataFrame of each dataset file beside its blob (see blob_store.BlobStore), so a dataset is
+    parsed and processed once when it is uploaded, and every later load reads the typed columns back directly.
+
+    frames are stored as feather files when pyarrow is installed, which are memory mapped when read, and as pickle
+    files otherwise. either way the dtypes from process_data are kept exactly, so they are the same on every request.
+    the files are named after the blob hash, so BlobStore.collect_garbage removes them along with their blob
+    """
+    def __init__(self, blob_store):
+        self.blob_store = blob_store
+
+    def _paths(self, blob_hash):
+        # feather first, a frame feather cant store (such as one with non string column names) is pickled instead
+        path = f"{self.blob_store.path(blob_hash)}.processed-v{PROCESS_VERSION}"
+        return f"{path}.feather", f"{path}.pkl"
+
+    def exists(self, blob_hash):
+        return any(os.path.exists(path) for path in self._paths(blob_hash))
+
+    def get(self, blob_hash):
+        """
+        Args:
+        blob_hash -> str: the hash of the dataset file in the blob store
+
+        Returns:
+        df -> DataFrame: the processed DataFrame, None if it wasnt stored
+        """
+        feather_path, pickle_path = self._paths(blob_hash)
+        try:
+            if feather is not None and os.path.exists(feather_path):
+                return feather.read_table(feather_path, memory_map=True).to_pandas()
+            if os.path.exists(pickle_path):
+                return pd.read_pickle(pickle_path)
+        except Exception as e:
+            print(f"Error reading processed dataset {blob_hash}: {e}")
+        return None
+
+    def put(self, blob_hash, df):
+        """
+        Args:
+        blob_hash -> str: the hash of the dataset file in the blob store
+        df -> DataFrame: the processed DataFrame, see functions.process_data
+        """
+        feather_path, pickle_path = self._paths(blob_hash)
+        suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+
+        # write to a temporary file first, so a half written frame is never read
+        if feather is not None:
+            try:
+                feather.write_feather(df, feather_path + suffix)
+                os.replace(feather_path + suffix, feather_path)
+                return
+            except Exception:
+                try:
+                    os.remove(feather_path + suffix)
+                except OSError:
+                    pass
+
+        try:
+            df.to_pickle(pickle_path + suffix)
+            os.replace(pickle_path + suffix, pickle_path)
+        except OSError as e:
+            print(f"Error writing processed dataset {blob_hash}: {e}")
@@ -1,13 +1,100 @@
+import numpy as np
 import pandas as pd
 import matplotlib
 # prevents GUI output from matlab, since it causes errors and isnt needed
 matplotlib.use('Agg')
-import matplotlib.pyplot as plt
+import matplotlib.style
+from matplotlib.figure import Figure
 import seaborn as sns
-import pandas as pd
+import json
+import time
+import threading
+from contextlib import contextmanager
+from io import BytesIO
+from ingestion import strip_strings
+from reduction import to_float_array, is_numeric_column, grid_strata, stratified_sample, lttb, bin_counts, bin_counts_2d
+
+
+# version of the styling applied in render_visual, bump this whenever the look of the visuals changes
+# so previously cached pngs are not reused
+STYLE_VERSION = 3
 
+# held while a visual is drawn with the visual styling applied, see render_visual
+_render_lock = threading.RLock()
 
-def process_data(df):
+
+"""
+visual themes
+"""
+
+def compile_theme(*styles):
+    """
+    combines and validates matplotlib styles into a theme once, so the theme can be applied to every
+    visual without looking up and validating the styles again
+
+    Args:
+    *styles -> str or dict: matplotlib style names or dictionaries of rcParams, later styles override earlier ones
+
+    Returns:
+    theme -> dict: the validated rcParams of the theme
+    """
+    theme = matplotlib.RcParams()
+    for style in styles:
+        if isinstance(style, str):
+            style = matplotlib.style.library[style]
+        theme.update(style) # validates every value
+    return dict(theme)
+
+
+@contextmanager
+def theme_context(theme):
+    """
+    applies a compiled theme to rcParams for the duration of the with block, only the keys of the theme are
+    saved and restored, and the values arent validated again
+
+    Args:
+    theme -> dict: a theme from compile_theme
+    """
+    rc = matplotlib.rcParams
+    original = {key: dict.__getitem__(rc, key) for key in theme}
+    dict.update(rc, theme)
+    try:
+        yield
+    finally:
+        dict.update(rc, original)
+
+
+# themes the visuals can be drawn with, compiled once when this module is imported
+THEMES = {
+    # styling for the visual, written by chatgpt to not waste time on python art
+    'dark': compile_theme("dark_background", { # Base dark background style
+        "axes.facecolor": "#2B2B2B",  # Dark gray for plot background
+        "axes.edgecolor": "#5A5A5A",  # Light gray for axis edges
+        "axes.labelcolor": "white",   # White labels for better readability
+        "grid.color": "#444444",      # Medium gray for grid lines
+        "xtick.color": "lightgray",   # Light gray for x-tick labels
+        "ytick.color": "lightgray",   # Light gray for y-tick labels
+        "figure.facecolor": "#1E1E1E",  # Deep gray for figure background
+        "text.color": "white",        # White for all text
+        "legend.frameon": True,       # Enable legend frame
+        "legend.facecolor": "#2E2E2E",  # Dark gray for legend background
+        "legend.edgecolor": "#5A5A5A",  # Light gray for legend border
+    }),
+}
+DEFAULT_THEME = 'dark'
+
+# resolution the visual thumbnails are rasterized at, the full size visuals use the figure dpi (100)
+THUMBNAIL_DPI = 30
+
+# resolutions every visual of the dashboard is rasterized at, the full size visual and its thumbnail are rasterized
+# from the same drawing, see render_pngs
+VISUAL_DPIS = (None, THUMBNAIL_DPI)
+
+# max number of rows a visual is drawn from, larger datasets are reduced first, see reduce_plot_data
+ROW_BUDGET = 20000
+
+
+def process_data(df, inplace=False, column_times=None):
     """
     applies the new method from pandas which is very usefull for data processing, 
     documentation:
@@ -16,31 +103,51 @@ def process_data(df):
 
     this method is still experimental so it is not the most accurate.
 
+    each column is converted and stripped in one pass and put straight into the result, so the frame is never
+    copied as a whole in between
+
     Args:
     df -> DataFrame: the data set to be processed
+    inplace -> bool: replace the columns of df itself instead of a shallow copy of it, each unprocessed column can
+    then be freed as soon as it is replaced
+    column_times -> dict: if given, filled with the seconds spent processing each column, keyed by (position, name)
+    so columns with the same name are timed separately
 
     Returns:
     df -> DataFrame: the processed data frame
     """
+    if not inplace:
+        # shares the column data with df, only the replaced columns are new
+        df = df.copy(deep=False)
+
+    for position, column in enumerate(df.columns):
+        start = time.perf_counter()
+
+        # new convenient pandas method
+        col = df.iloc[:, position].convert_dtypes()
+
+        # remove leading spaces from string columns
+        if col.dtype == 'string':
+            col = strip_strings(col)
 
-    # new convenient pandas method
-    df = df.convert_dtypes()
+        # by position, so columns with the same name are processed separately
+        df.isetitem(position, col)
 
-    # remove leading spaces from string columns
-    for column in df.columns:
-        if df[column].dtype == 'string':
-            df[column] = df[column].str.strip()
+        if column_times is not None:
+            column_times[(position, column)] = time.perf_counter() - start
 
     return df
 
 
-def get_data_report_data(data):
+def get_data_report_data(data, profiles=None):
     """
     analyses the data set and outputs relevant information about the data set to be reported in the
     dashboard
 
     Args:
     data -> DataFrame: the data set
+    profiles -> list: the profile of every column by position, see profiling.ColumnProfileStore. if given the
+    column data also has the nulls, distinct values, range, median, top values and memory of every column
 
     Retruns:
     data_report -> dictionary: a dictionary containing  relevant information about the data set
@@ -53,425 +160,755 @@ def get_data_report_data(data):
         'Column Name': data_report['col names'],
         'Data Type': data_report['col types']
     })
-    
+
+    # column profiles, estimated values are marked with ~
+    if profiles is not None:
+        column_profiles = profiles
+        def estimated(profile, value):
+            return f"~{value}" if profile['approximate'] else value
+
+        data_report['col data']['Nulls'] = [profile['nulls'] for profile in column_profiles]
+        data_report['col data']['Distinct'] = [estimated(profile, profile['distinct']) for profile in column_profiles]
+        data_report['col data']['Min'] = [profile['min'] for profile in column_profiles]
+        data_report['col data']['Max'] = [profile['max'] for profile in column_profiles]
+        data_report['col data']['Median'] = [
+            estimated(profile, profile['quantiles']['50%']) if profile['quantiles'] else None
+            for profile in column_profiles
+        ]
+        data_report['col data']['Top Values'] = [
+            ", ".join(f"{value} ({estimated(profile, count)})" for value, count in profile['top'])
+            for profile in column_profiles
+        ]
+        data_report['col data']['Memory (bytes)'] = [profile['memory'] for profile in column_profiles]
+        data_report['memory'] = sum(profile['memory'] for profile in column_profiles)
+
     # colum and row numbers
     data_report['row num'], data_report['col num'] = data.shape
     
     return data_report
 
 
-def generate_and_recommend_WIP(dataset, x_col=None, y_col=None):
+def get_sort_order(data, sort):
     """
-    using the dataset and the column names, this function will generate every hard coded plot code for each situation,
-    such as attempting a scatter plot when both columns are int, or a bar plot when one is int and one is str, etc...
+    gets the order of the data set rows sorted by a column, for get_data_rows. the order only depends on the data set
+    and the sort column, so it can be cached and reused for every page of the same sort
 
-    so far only 4 column types are supported:
-    int
-    float
-    str
-    bool
+    Args:
+    data -> DataFrame: the data set
+    sort -> str: column name to sort by, prefixed with '-' to sort in descending order
 
-    I tried my best to order the code optimally, whilest keeping it as simple as possible
+    Returns:
+    order -> numpy array: the positions of the rows in sorted order
+
+    Raises:
+    KeyError: if the sort column is not in the data set
+    """
+    # a column whose name starts with '-' is sorted ascending
+    if sort in data.columns:
+        column, ascending = sort, True
+    elif sort.startswith('-') and sort[1:] in data.columns:
+        column, ascending = sort[1:], False
+    else:
+        raise KeyError(sort)
+
+    # stable sort so rows with equal values keep their file order, missing values are always last
+    values = data[column].reset_index(drop=True)
+    return values.sort_values(ascending=ascending, kind='stable', na_position='last').index.to_numpy()
+
+
+def get_data_rows(data, offset=0, limit=50, sort=None, order=None):
+    """
+    gets one page of the data set rows for the dashboard data table, only the rows of the page are converted so
+    the cost of a page doesnt grow with the number of rows (other than sorting, see get_sort_order)
 
     Args:
-        dataset (pandas.DataFrame): dataset to visualize.
-        x_col, y_col: column names to visualize.
+    data -> DataFrame: the data set
+    offset -> int: position of the first row of the page
+    limit -> int: max number of rows in the page
+    sort -> str: column name to sort by, prefixed with '-' to sort in descending order. None keeps the file order
+    order -> numpy array: the row order of sort from get_sort_order, if already known. None sorts the data set
 
     Returns:
-        visuals (dict): A dictionary with visual names as keys and figure objects as values.
-        recommended (str): A recommended visual's key in the visuals dictionary. (The first visual created in a case)
+    page -> dictionary: the 'columns' names, the 'index' labels and the json safe 'rows' values of the page,
+    along with the 'total' number of rows, and the 'offset', 'limit' and 'sort' used
+
+    Raises:
+    KeyError: if the sort column is not in the data set
     """
-    # at least x_col or y_col should be selected
-    if x_col not in dataset.columns and y_col not in dataset.columns:
-        return None, None
+    if sort:
+        if order is None:
+            order = get_sort_order(data, sort)
+        page = data.iloc[order[offset:offset + limit]]
+    else:
+        page = data.iloc[offset:offset + limit]
+
+    # to_json converts missing values to null and numpy types to plain json types
+    page_json = json.loads(page.to_json(orient='split', date_format='iso', default_handler=str))
+
+    return {
+        'columns': page_json['columns'],
+        'index': page_json['index'],
+        'rows': page_json['data'],
+        'total': len(data),
+        'offset': offset,
+        'limit': limit,
+        'sort': sort,
+    }
+
+
+"""
+plotting functions without an ax argument of their own, wrapped so every plotting function can be given the ax to draw on
+"""
+
+def pie_chart(ax, **kwargs):
+    ax.pie(**kwargs)
+
 
-    x = dataset[x_col] if x_col in dataset.columns else None
-    y = dataset[y_col] if y_col in dataset.columns else None
-    visuals, recommendations = {}, []
+def hexbin_plot(ax, **kwargs):
+    ax.hexbin(**kwargs)
 
-    # helper sub functions
-    def create_visual(plot_title, plot_func, **kwargs):
-        """ 
-        plotting function to that will be run a lot, so it is used to simplify the code to just one line
 
-        Args:
-        plot_title -> str: The title of the plot
+def frame_plot(ax, data, **kwargs):
+    # draws a DataFrame, such as a crosstab, with the pandas plotting method
+    data.plot(ax=ax, **kwargs)
 
-        plot_func -> function: the plotting function this function will use
 
-        **kwargs -> dictionary of arguments: 
-        **kwargs allows me to input any number of arguments I want, these
-        arguments will the arguements for the plotting function. Since there are many different plotting functions
+"""
+reducing the data of a visual to the row budget, each kind of plot has its own way to shrink its data without changing its look
+"""
+
+# number of points lines are downsampled to, a full size visual is only 1000 pixels wide
+LINE_POINTS = 2000
+
+# number of bins the data of kde plots is counted into, the kde is then estimated from the bins
+KDE_BINS = 1024
+KDE_BINS_2D = 64
+
+# number of bins along each axis the data of hexbin plots is counted into, much finer than the hexagons
+HEXBIN_BINS = 128
+
+
+def plot_vectors(kwargs):
+    """
+    gets the x and y data of a visual as Series, whether they were given as column names or as the columns themselves
+
+    Args:
+    kwargs -> dict: the arguments of the plotting function
+
+    Returns:
+    vectors -> dict: 'x' and 'y' -> Series, only for the ones the visual has
+    """
+    data = kwargs.get('data')
+    vectors = {}
+    for axis in ('x', 'y'):
+        value = kwargs.get(axis)
+        if isinstance(value, pd.Series):
+            vectors[axis] = value
+        elif isinstance(value, str) and isinstance(data, pd.DataFrame) and value in data.columns:
+            vectors[axis] = data[value]
+    return vectors
+
+
+def _take_rows(kwargs, positions):
+    # keeps only the rows at positions of the data and of every column given as a Series
+    kwargs = dict(kwargs)
+    for name, value in kwargs.items():
+        if isinstance(value, (pd.DataFrame, pd.Series)):
+            kwargs[name] = value.iloc[positions]
+    return kwargs
+
+
+def _reduce_by_sample(kwargs, row_budget):
+    # scatter, rug, violin and regression plots are drawn from a stratified sample, stratified over a grid of
+    # the x and y values so the sample keeps the shape and the outliers of the data
+    vectors = list(plot_vectors(kwargs).values())
+    positions = stratified_sample(grid_strata(vectors), row_budget)
+    return _take_rows(kwargs, positions)
+
+
+def _reduce_regression(kwargs, row_budget):
+    # the confidence band of a regression is bootstrapped, which is the slow part of the plot, so it is skipped
+    return dict(_reduce_by_sample(kwargs, row_budget), ci=None)
+
+
+def _reduce_line(kwargs, row_budget):
+    # seaborn draws the mean y of each x with a bootstrapped confidence band, the means are computed here instead
+    # and the band is skipped, then the line is downsampled with lttb which keeps its peaks
+    vectors = plot_vectors(kwargs)
+    if not all(axis in vectors and is_numeric_column(vectors[axis]) for axis in ('x', 'y')):
+        return dict(_reduce_by_sample(kwargs, row_budget), errorbar=None)
+
+    x, y = vectors['x'], vectors['y']
+    means = pd.Series(to_float_array(y), index=to_float_array(x)).groupby(level=0).mean().dropna()
+    positions = lttb(means.index.to_numpy(), means.to_numpy(), min(row_budget, LINE_POINTS))
+    means = means.iloc[positions]
+
+    kwargs = {name: value for name, value in kwargs.items() if name not in ('data', 'x', 'y')}
+    return dict(kwargs, x=pd.Series(means.index, name=x.name), y=pd.Series(means.to_numpy(), name=y.name), errorbar=None)
+
+
+def _reduce_histogram(kwargs, row_budget):
+    # the values are counted into the same bins seaborn would use, and the histogram is drawn from the counts
+    vectors = plot_vectors(kwargs)
+    x = vectors.get('x')
+    if x is None or 'y' in vectors or not is_numeric_column(x):
+        return kwargs
+
+    centers, counts, edges = bin_counts(to_float_array(x), bins=kwargs.get('bins', 'auto'))
+    kwargs = {name: value for name, value in kwargs.items() if name not in ('data', 'x')}
+    return dict(kwargs, x=pd.Series(centers, name=x.name), weights=counts, bins=edges.tolist())
+
+
+def _reduce_kde(kwargs, row_budget):
+    # the values are counted into a fixed number of bins and the kde is estimated from the weighted bin centers,
+    # so the cost of the kde doesnt grow with the number of rows
+    vectors = plot_vectors(kwargs)
+    if not vectors or not all(is_numeric_column(vector) for vector in vectors.values()):
+        return _reduce_by_sample(kwargs, row_budget)
+
+    kwargs = {name: value for name, value in kwargs.items() if name not in ('data', 'x', 'y')}
+    if len(vectors) == 1:
+        (axis, col), = vectors.items()
+        centers, counts, _ = bin_counts(to_float_array(col), bins=KDE_BINS)
+        reduced = {axis: pd.Series(centers, name=col.name)}
+    else:
+        x, y = vectors['x'], vectors['y']
+        x_centers, y_centers, counts, _ = bin_counts_2d(to_float_array(x), to_float_array(y), bins=KDE_BINS_2D)
+        reduced = {'x': pd.Series(x_centers, name=x.name), 'y': pd.Series(y_centers, name=y.name)}
+
+    # empty bins add nothing to the kde
+    nonempty = counts > 0
+    reduced = {axis: center[nonempty].reset_index(drop=True) for axis, center in reduced.items()}
+
+    # scipy picks the bandwidth from the effective number of weighted points, which is far lower for a few heavy bins
+    # than for the rows they count, so the bandwidth is given as scotts factor of the row count instead
+    kwargs.setdefault('bw_method', counts.sum() ** (-1 / (len(reduced) + 4)))
+    return dict(kwargs, weights=counts[nonempty], **reduced)
+
+
+def _reduce_hexbin(kwargs, row_budget):
+    # the points are counted into a fine grid and each hexagon sums the counts of the grid cells inside it, every
+    # cell is kept (even empty ones) so empty hexagons are still drawn like they are without the grid
+    x, y = kwargs['x'], kwargs['y']
+    x_centers, y_centers, counts, extent = bin_counts_2d(to_float_array(x), to_float_array(y), bins=HEXBIN_BINS)
+    return dict(
+        kwargs,
+        x=pd.Series(x_centers, name=x.name),
+        y=pd.Series(y_centers, name=y.name),
+        C=counts,
+        reduce_C_function=np.sum,
+        extent=extent,
+    )
+
+
+def _reduce_bar(kwargs, row_budget):
+    # the bar heights are means, which stay exact, only the bootstrapped error bars are skipped
+    return dict(kwargs, errorbar=None)
+
+
+# plotting functions -> how their data is reduced, plotting functions that arent here are drawn from every row,
+# they are cheap for any number of rows (such as count plots) or are given already aggregated data (such as heatmaps)
+REDUCERS = {
+    sns.scatterplot: _reduce_by_sample,
+    sns.rugplot: _reduce_by_sample,
+    sns.violinplot: _reduce_by_sample,
+    sns.regplot: _reduce_regression,
+    sns.lineplot: _reduce_line,
+    sns.histplot: _reduce_histogram,
+    sns.kdeplot: _reduce_kde,
+    hexbin_plot: _reduce_hexbin,
+    sns.barplot: _reduce_bar,
+}
+
+
+def reduce_plot_data(plot_func, kwargs, row_budget=ROW_BUDGET):
+    """
+    reduces the data of a visual to the row budget before it is drawn, so drawing time stays about the same as
+    datasets grow. visuals within the budget are left as they are
+
+    Args:
+    plot_func -> function: the plotting function of the visual
+    kwargs -> dict: the arguments for the plotting function
+    row_budget -> int: max number of rows to draw the visual from, None to never reduce
+
+    Returns:
+    kwargs -> dict: the arguments for the plotting function, with the data reduced
+    """
+    reducer = REDUCERS.get(plot_func)
+    if reducer is None or row_budget is None:
+        return kwargs
+
+    vectors = plot_vectors(kwargs)
+    data = kwargs.get('data')
+    rows = len(data) if isinstance(data, pd.DataFrame) else max((len(vector) for vector in vectors.values()), default=0)
+    if rows <= row_budget:
+        return kwargs
+
+    return reducer(kwargs, row_budget)
+
+
+def render_visual(spec, theme=DEFAULT_THEME):
+    """
+    draws a single planned visual, see plan_visuals for how the visuals are planned
+
+    Args:
+    spec -> dict: a visual spec from plan_visuals, with the keys:
+        'title' -> str: the title of the plot
+        'plot_func' -> function: the plotting function to draw the visual with, it must accept an ax argument
+        'kwargs' -> dict: the arguments for the plotting function. Since there are many different plotting functions
         they dont all use the same args, some want x as a column name, some what x as a column itself, some plots
-        want unusal args. this allows me to just keep everything within this create visual function and simplify
-        the codes readability.
-        """
+        want unusal args.
+        'row_budget' -> int: max number of rows the visual is drawn from, see reduce_plot_data. None or missing to
+        draw from every row
+    theme -> str: the name of the theme in THEMES to draw the visual with
+
+    Returns:
+    fig -> Figure: the drawn visual
+    """
+    plot_title, plot_func = spec['title'], spec['plot_func']
+
+    # large datasets are reduced here, when the visual is drawn (in the render worker if there is one), instead of
+    # when it is planned, so planning stays cheap and only the visuals that are drawn are ever reduced
+    kwargs = reduce_plot_data(plot_func, spec['kwargs'], row_budget=spec.get('row_budget'))
+
+    # rcParams are shared by every thread, so the theme is only applied inside theme_context while holding the
+    # render lock, this keeps visuals drawn from different threads at once from restyling each others figures
+    with _render_lock, theme_context(THEMES[theme]):
+        # initialize size of the plot, the Figure is created directly instead of through pyplot so it is never
+        # registered in pyplot's global figure state, and it is freed once it is no longer referenced
+        fig = Figure(figsize=(10, 6))
+        ax = fig.subplots()
 
-        # styling for the visual, written by chatgpt to not waste time on python art
-        plt.style.use("dark_background")  # Base dark background style
-        plt.rcParams.update({
-            "axes.facecolor": "#2B2B2B",  # Dark gray for plot background
-            "axes.edgecolor": "#5A5A5A",  # Light gray for axis edges
-            "axes.labelcolor": "white",   # White labels for better readability
-            "grid.color": "#444444",      # Medium gray for grid lines
-            "xtick.color": "lightgray",   # Light gray for x-tick labels
-            "ytick.color": "lightgray",   # Light gray for y-tick labels
-            "figure.facecolor": "#1E1E1E",  # Deep gray for figure background
-            "text.color": "white",        # White for all text
-            "legend.frameon": True,       # Enable legend frame
-            "legend.facecolor": "#2E2E2E",  # Dark gray for legend background
-            "legend.edgecolor": "#5A5A5A",  # Light gray for legend border
-        })
-
-        # initialize size of the plot
-        plt.figure(figsize=(10, 6))
-
-        # run the plot function with its arguments
-        plot_func(**kwargs)
-
-        # set the columns names as the labels if applicable
+        # run the plot function with its arguments, on this visuals axes
+        plot_func(ax=ax, **kwargs)
+
+        # set the columns names as the labels if applicable, the label and title colors come from the theme
         if 'x' in kwargs:
             # if kwargs has a col name as input
             if isinstance(kwargs['x'], str):
-                plt.xlabel(kwargs['x'], fontsize=12, color='white')
+                ax.set_xlabel(kwargs['x'], fontsize=12)
 
             # if kawrgs has the panda series column itself as input
             elif isinstance(kwargs['x'], pd.Series) and kwargs['x'].name:
-                plt.xlabel(kwargs['x'].name, fontsize=12, color='white')
+                ax.set_xlabel(kwargs['x'].name, fontsize=12)
 
         if 'y' in kwargs:
             if isinstance(kwargs['y'], str):
-                plt.ylabel(kwargs['y'], fontsize=12, color='white')
+                ax.set_ylabel(kwargs['y'], fontsize=12)
             elif isinstance(kwargs['y'], pd.Series) and kwargs['y'].name:
-                plt.ylabel(kwargs['y'].name, fontsize=12, color='white')
+                ax.set_ylabel(kwargs['y'].name, fontsize=12)
 
 
         # set the title with some styling
-        plt.title(plot_title.replace("_", " ").title(), fontsize=14, color="white", pad=15)
+        ax.set_title(plot_title.replace("_", " ").title(), fontsize=14, pad=15)
 
-        # add the created visual to the visuals dictionary to send to the route server
-        visuals[plot_title] = plt.gcf()
-        recommendations.append(plot_title) # append it to the recomendations list, the first plot in this list will be "recommended"
-        plt.close()
+    return fig
 
-    # 1 dimension type checking functions
-    def is_integer_column(col):
-        return pd.api.types.is_integer_dtype(col)
-    
-    def is_string_column(col):
-        return pd.api.types.is_string_dtype(col)
-    
-    def is_float_column(col):
-        return pd.api.types.is_float_dtype(col)
-    
-    def is_bool_column(col):
-        return pd.api.types.is_bool(col)
-    
-    def is_date_time_column(col):
-        return pd.api.types.is_datetime64_any_dtype(col)
-    
-    # 2 dimension seperate type checking functions
-    def is_int_str(col1, col2):
-        if is_integer_column(col1) and is_string_column(col2):
-            return True
-        elif is_integer_column(col2) and is_string_column(col1):
-            return True
-        return False
-    
-    def is_int_float(col1, col2):
-        if is_integer_column(col1) and is_float_column(col2):
-            return True
-        elif is_integer_column(col2) and is_float_column(col1):
-            return True
-        return False
-
-    def is_int_bool(col1, col2):
-        if is_integer_column(col1) and is_bool_column(col2):
-            return True
-        elif is_integer_column(col2) and is_bool_column(col1):
-            return True
-        return False
-    
-    def is_str_float(col1, col2):
-        if is_string_column(col1) and is_float_column(col2):
-            return True
-        elif is_string_column(col2) and is_float_column(col1):
-            return True
-        return False
 
-    def is_str_bool(col1, col2):
-        if is_string_column(col1) and is_bool_column(col2):
-            return True
-        elif is_string_column(col2) and is_bool_column(col1):
-            return True
-        return False
+def figure_to_png(fig, dpi=None):
+    """
+    rasterizes a figure into png bytes, which can then be sent to the browser
 
-    def is_float_bool(col1, col2):
-        if is_float_column(col1) and is_bool_column(col2):
-            return True
-        elif is_float_column(col2) and is_bool_column(col1):
-            return True
-        return False
+    Args:
+    fig -> Figure: the figure to rasterize
+    dpi -> int: resolution to rasterize at, such as THUMBNAIL_DPI. None uses the figure dpi
+
+    Returns:
+    png -> bytes: the png image data
+    """
+    img_stream = BytesIO()
+    if dpi:
+        fig.savefig(img_stream, format='png', dpi=dpi)
+    else:
+        fig.savefig(img_stream, format='png')
+    return img_stream.getvalue()
 
 
+def render_pngs(spec, theme=DEFAULT_THEME, dpis=(None,)):
     """
-    1 dimensional cases
+    draws a planned visual once and rasterizes it into png bytes at each resolution, such as the full size visual and
+    its thumbnail. the figure is cleared as soon as it is rasterized, figures reference themselves so they would
+    otherwise hold on to their artists until the garbage collector runs
+
+    Args:
+    spec -> dict: a visual spec from plan_visuals
+    theme -> str: the name of the theme in THEMES to draw the visual with
+    dpis -> tuple: resolutions to rasterize at, such as THUMBNAIL_DPI. None uses the figure dpi
+
+    Returns:
+    pngs -> tuple: the png image data at each resolution, in the same order as dpis
     """
-    if (y_col == None) or (x_col == None) :
-        """
-        x_col or y_col is an interger
-        """
-        # histogram
-        if x_col and is_integer_column(x):
-            create_visual(f"Histogram of {x_col}", sns.histplot, data=dataset, x=x_col)
-        if y_col and is_integer_column(y):
-            create_visual(f"Histogram of {y_col}", sns.histplot, data=dataset, x=y_col)
-
-        # violin Plot
-        if x_col and is_integer_column(x):
-            create_visual(f"Violin Plot of {x_col}", sns.violinplot, data=dataset, x=x_col)
-        if y_col and is_integer_column(y):
-            create_visual(f"Violin Plot of {y_col}", sns.violinplot, data=dataset, x=y_col)
-
-        # count plot (more suitable for categorical values but can be applied to integers as well)
-        if x_col and is_integer_column(x):
-            create_visual(f"Count Plot of {x_col}", sns.countplot, data=dataset, x=x_col)
-        if y_col and is_integer_column(y):
-            create_visual(f"Count Plot of {y_col}", sns.countplot, data=dataset, x=y_col)
-
-        # box plot
-        if x_col and is_integer_column(x):
-            create_visual(f"Box Plot of {x_col}", sns.boxplot, data=dataset, x=x_col)
-        if y_col and is_integer_column(y):
-            create_visual(f"Box Plot of {y_col}", sns.boxplot, data=dataset, x=y_col)
-
-        # KDE (Kernel Density Estimator)
-        if x_col and is_integer_column(x):
-            create_visual(f"KDE Plot of {x_col}", sns.kdeplot, data=dataset, x=x_col)
-        if y_col and is_integer_column(y):
-            create_visual(f"KDE Plot of {y_col}", sns.kdeplot, data=dataset, x=y_col)
-
-        # rug plot
-        if x_col and is_integer_column(x):
-            create_visual(f"Rug Plot of {x_col}", sns.rugplot, data=dataset, x=x_col)
-        if y_col and is_integer_column(y):
-            create_visual(f"Rug Plot of {y_col}", sns.rugplot, data=dataset, x=y_col)
-
-        # ECDF plot (Empirical Cumulative Distribution Function)
-        if x_col and is_integer_column(x):
-            create_visual(f"ECDF Plot of {x_col}", sns.ecdfplot, data=dataset, x=x_col)
-        if y_col and is_integer_column(y):
-            create_visual(f"ECDF Plot of {y_col}", sns.ecdfplot, data=dataset, x=y_col)
+    fig = render_visual(spec, theme=theme)
+    pngs = tuple(figure_to_png(fig, dpi=dpi) for dpi in dpis)
+    fig.clear()
+    return pngs
 
 
-        """
-        x_col or y_col is a string
-        """
-        # pie chart
-        if x_col and is_string_column(x):
-            create_visual(f"Pie Chart of {x_col}", plt.pie, x=x.value_counts(), labels = x.value_counts().index, autopct='%1.1f%%', startangle=90, wedgeprops={'edgecolor': 'black'}, textprops={'color': 'gray'})
-        if y_col and is_string_column(y):
-            create_visual(f"Pie Chart of {y_col}", plt.pie, x=y.value_counts(), labels = y.value_counts().index, autopct='%1.1f%%', startangle=90, wedgeprops={'edgecolor': 'black'}, textprops={'color': 'gray'})
-        
-        # countplot
-        if x_col and is_string_column(x):
-            create_visual(f"Count Plot of {x_col}", sns.countplot, data=dataset, x=x_col)
-        if y_col and is_string_column(y):
-            create_visual(f"Count Plot of {y_col}", sns.countplot, data=dataset, x=y_col)
+def render_png(spec, theme=DEFAULT_THEME, dpi=None):
+    """
+    draws a planned visual straight into png bytes, see render_pngs
 
+    Args:
+    spec -> dict: a visual spec from plan_visuals
+    theme -> str: the name of the theme in THEMES to draw the visual with
+    dpi -> int: resolution to rasterize at, such as THUMBNAIL_DPI. None uses the figure dpi
 
-        """
-        x_col or y_col is a float
-        """
-        # histogram
-        if x_col and is_float_column(x):
-            create_visual(f"Histogram of {x_col}", sns.histplot, data=dataset, x=x_col)
-        if y_col and is_integer_column(y):
-            create_visual(f"Histogram of {y_col}", sns.histplot, data=dataset, x=y_col)
-
-        # boxplot
-        if x_col and is_float_column(x):
-            create_visual(f"Boxplot of {x_col}", sns.boxplot, data=dataset, x=x_col)
-        if y_col and is_integer_column(y):
-            create_visual(f"Boxplot of {y_col}", sns.boxplot, data=dataset, x=y_col)
-
-        # violin plot
-        if x_col and is_float_column(x):
-            create_visual(f"Violin Plot of {x_col}", sns.violinplot, data=dataset, x=x_col)
-        if y_col and is_float_column(y):
-            create_visual(f"Violin Plot of {y_col}", sns.violinplot, data=dataset, x=y_col)
-
-        # KDE plot
-        if x_col and is_float_column(x):
-            create_visual(f"Density Plot of {x_col}", sns.kdeplot, data=dataset, x=x_col)
-        if y_col and is_float_column(y):
-            create_visual(f"KDE Plot of {y_col}", sns.kdeplot, data=dataset, x=y_col)
-
-        # barplot
-        if x_col and is_float_column(x):
-            create_visual(f"Bar Plot of {x_col} against the mean", sns.barplot, data=dataset, x=x_col, y=dataset[x_col].mean())
-        if y_col and is_float_column(y):
-            create_visual(f"Bar Plot of {y_col}", sns.barplot, data=dataset, x=y_col, y=dataset[y_col].mean())
+    Returns:
+    png -> bytes: the png image data
+    """
+    return render_pngs(spec, theme=theme, dpis=(dpi,))[0]
 
-        """
-        x_col or y_col is a bool
-        """
-        # count Plot
-        if x_col and is_bool_column(x):
-            create_visual(f"Count Plot of {x_col}", sns.countplot, data=dataset, x=x_col)
-        if y_col and is_integer_column(y):
-            create_visual(f"Count Plot of {y_col}", sns.countplot, data=dataset, x=y_col)
 
-        # histogram
-        if x_col and is_bool_column(x):
-            create_visual(f"Historgram of {x_col}", sns.histplot, data=dataset, x=x_col)
-        if y_col and is_integer_column(y):
-            create_visual(f"Histogram of {y_col}", sns.histplot, data=dataset, x=y_col)
+"""
+visual registry, the visuals planned for each type of column (or pair of column types)
+"""
+
+# column type names -> dtype checks, checked in this order so bool columns arent taken as numbers
+COLUMN_TYPES = (
+    ('bool', pd.api.types.is_bool_dtype),
+    ('int', pd.api.types.is_integer_dtype),
+    ('float', pd.api.types.is_float_dtype),
+    ('str', pd.api.types.is_string_dtype),
+)
 
-        # piechart
-        if x_col and is_bool_column(x):
-            create_visual(f"Piechart of {x_col}", plt.pie, data=dataset, x=x_col)
-        if y_col and is_integer_column(y):
-            create_visual(f"Piechart of {y_col}", plt.pie, data=dataset, x=y_col)
 
+def column_type(col):
     """
-    2 dimensional same type cases (4 cases) and 2 dimensional different type cases (6 cases)
+    Args:
+    col -> Series: a processed column, see process_data
+
+    Returns:
+    type -> str: the name of the column type in COLUMN_TYPES, None if it is none of them
     """
-    if x_col and y_col:
-        """
-        x_col and y_col is interger
-        """
-        if is_integer_column(x) and is_integer_column(y):
-            # scatter plot
-            create_visual(f"Scatter plot of {x_col} against {y_col}", plot_func=sns.scatterplot, data=dataset, x=x_col, y=y_col)
-            # line plot
-            create_visual(f"Line plot of {x_col} against {y_col}", plot_func=sns.lineplot, data=dataset, x=x, y=y)
-            # bar plot
-            create_visual(f"Bar plot of {x_col} against {y_col}", plot_func=sns.barplot, data=dataset, x=x, y=y)
-            # correlation matrix heatmap
-            correlation_matrix = dataset[[x_col, y_col]].corr()
-            create_visual(f"correlation matrix heatmap of {x_col} and {y_col}", sns.heatmap, data=correlation_matrix, annot=True, cmap='coolwarm', linewidths=0.5)
-            # box plot
-            create_visual(f"Boxplot of {x_col} and {y_col}", sns.boxplot, data=dataset, x=x_col, y=y_col)
-            # violin plot
-            create_visual(f"Violin Plot of {x_col} and {y_col}", sns.violinplot, data=dataset, x=x_col, y=y_col)
-            # linear regression plot
-            create_visual(f"Linear Regression Plot of {x_col} and {y_col}", sns.regplot, data=dataset, x=x_col, y=y_col)
+    for name, is_type in COLUMN_TYPES:
+        if is_type(col):
+            return name
+    return None
 
-        """
-        x_col and y_col is float
-        """
-        if is_float_column(x) and is_float_column(y):
-            # scatter plot
-            create_visual(f"Scatter plot of {x_col} against {y_col}", plot_func=sns.scatterplot, data=dataset, x=x_col, y=y_col)
-            # hexbin plot
-            create_visual(f"Hexbin plot of {x_col} against {y_col}", plot_func=plt.hexbin, x=x, y=y, gridsize=30, cmap='viridis')
-            # KDE plot (kernal density estimator)
-            create_visual(f"KDE plot of {x_col} against {y_col}", plot_func=sns.kdeplot, x=x, y=y, cmap="Blues", fill=True, thresh=0, levels=100)
-            # correlation matrix heatmap
-            correlation_matrix = dataset[[x_col, y_col]].corr()
-            create_visual(f"Correlation Matrix Heatmap of {x_col} and {y_col}", sns.heatmap, data=correlation_matrix, annot=True, cmap='coolwarm', linewidths=0.5)
-            # line plot
-            create_visual(f"Line Plot of {x_col} against {y_col}", plot_func=sns.lineplot, data=dataset, x=x_col, y=y_col)
-            # linear regression plot
-            create_visual(f"Linear Regression Plot of {x_col} and {y_col}", sns.regplot, data=dataset, x=x_col, y=y_col)
-            # violin plot
-            create_visual(f"Violin Plot of {x_col} and {y_col}", sns.violinplot, data=dataset, x=x_col, y=y_col)
-            # boxplot
-            create_visual(f"Boxplot of {x_col} and {y_col}", sns.boxplot, data=dataset, x=x_col, y=y_col)
 
+class PlotAggregates:
+    """
+    aggregates of a dataset that more than one visual is drawn from, such as the value counts of a column. each is
+    computed the first time a visual asks for it and reused by every other visual, memoized by the operation and the
+    column names. made for the visuals of one plan (one request), the dataset isnt watched for changes
+    """
+    def __init__(self, dataset):
+        self.dataset = dataset
+        self.computed = [] # (operation, column names) of every aggregate computed, in order
+        self._aggregates = {} # (operation, column names) -> aggregate
+
+    def _get(self, operation, columns, compute):
+        key = (operation, columns)
+        if key not in self._aggregates:
+            self._aggregates[key] = compute()
+            self.computed.append(key)
+        return self._aggregates[key]
+
+    def value_counts(self, col):
         """
-        x_col and y_col is string
+        Returns:
+        counts -> Series: the number of rows of each value of the column, in the order the values first appear.
+        missing values arent counted
         """
-        if is_string_column(x) and is_string_column(y):
-            # stacked bar plot, very hard to think of any other plots with just two string columns
-            cross_tab = pd.crosstab(x, y)
-            cross_tab.plot(kind='bar', stacked=True, colormap='viridis')
-            create_visual(f"Stacked bar plot of {x_col} against {y_col}", plot_func=cross_tab.plot, kind='bar', stacked=True, colormap='viridis')
-            # hue count plot
-            create_visual(f"Count Plot of {x_col} with {y_col} as Hue", sns.countplot, data=dataset, x=x_col, hue=y_col)
-            # heatmap categorical correlation
-            cross_tab = pd.crosstab(x, y)
-            create_visual(f"Heatmap of Categorical Correlation between {x_col} and {y_col}", sns.heatmap, data=cross_tab, annot=True, cmap='Blues')
-            # stacked area plot
-            cross_tab = pd.crosstab(x, y)
-            create_visual(f"Stacked Area Plot of {x_col} against {y_col}", plot_func=cross_tab.plot, kind='area', stacked=True, colormap='viridis')
+        return self._get('value_counts', (col,), lambda: self.dataset[col].value_counts(sort=False))
 
+    def crosstab(self, x_col, y_col):
         """
-        x_col and y_col is bool
+        Returns:
+        cross_tab -> DataFrame: the number of rows of each pair of values, x values as rows and y values as columns
         """
-        if is_bool_column(x) and is_bool_column(y):
-            # couldnt think of or find any relevant plots for two booleans
-            pass
-    
+        return self._get('crosstab', (x_col, y_col), lambda: pd.crosstab(self.dataset[x_col], self.dataset[y_col]))
 
+    def corr(self, x_col, y_col):
         """
-        x_col and y_col are int and str non-respectufully or float and str non respectfully
+        Returns:
+        correlation_matrix -> DataFrame: the correlation matrix of the two columns
         """
-        if is_int_str(x, y) or is_str_float(x, y):
-            # bar plot
-            create_visual(f"Bar plot of {x_col} against {y_col}", plot_func=sns.barplot, data=dataset, x=x_col, y=y_col)
-            # box plot
-            create_visual(f"Box plot of {x_col} against {y_col}", plot_func=sns.boxplot, data=dataset, x=x_col, y=y_col)
-            # violin plot
-            create_visual(f"violin plot of {x_col} against {y_col}", plot_func=sns.violinplot, data=dataset, x=x_col, y=y_col)
-            # line plot
-            create_visual(f"Line Plot of {x_col} against {y_col}", sns.lineplot, data=dataset, x=x_col, y=y_col)
-            
+        return self._get('corr', (x_col, y_col), lambda: self.dataset[[x_col, y_col]].corr())
+
+
+# one column visuals, each builder takes the dataset, its PlotAggregates and the column name and returns the title,
+# plotting function and arguments of a visual, or None if the visual doesnt apply to the column
+def histogram(dataset, aggregates, col):
+    return f"Histogram of {col}", sns.histplot, {'data': dataset, 'x': col}
+
+def violin_plot(dataset, aggregates, col):
+    return f"Violin Plot of {col}", sns.violinplot, {'data': dataset, 'x': col}
+
+def count_plot(dataset, aggregates, col):
+    # more suitable for categorical values but can be applied to integers as well.
+    # drawn as bars of the value counts, the same bars sns.countplot would count from every row
+    counts = aggregates.value_counts(col)
+    return f"Count Plot of {col}", sns.barplot, {
+        'x': pd.Series(counts.index, name=col), 'y': pd.Series(counts.to_numpy(), name='count'), 'errorbar': None,
+    }
+
+def box_plot(dataset, aggregates, col):
+    return f"Box Plot of {col}", sns.boxplot, {'data': dataset, 'x': col}
+
+def kde_plot(dataset, aggregates, col):
+    # KDE (Kernel Density Estimator)
+    return f"KDE Plot of {col}", sns.kdeplot, {'data': dataset, 'x': col}
+
+def rug_plot(dataset, aggregates, col):
+    return f"Rug Plot of {col}", sns.rugplot, {'data': dataset, 'x': col}
+
+def ecdf_plot(dataset, aggregates, col):
+    # ECDF plot (Empirical Cumulative Distribution Function)
+    return f"ECDF Plot of {col}", sns.ecdfplot, {'data': dataset, 'x': col}
+
+def pie_chart_of_counts(dataset, aggregates, col):
+    counts = aggregates.value_counts(col).sort_values(ascending=False, kind='stable')
+    return f"Pie Chart of {col}", pie_chart, {
+        'x': counts, 'labels': counts.index, 'autopct': '%1.1f%%', 'startangle': 90,
+        'wedgeprops': {'edgecolor': 'black'}, 'textprops': {'color': 'gray'},
+    }
+
+
+# two column visuals, each builder takes the dataset, its PlotAggregates and the x and y column names
+def scatter_plot(dataset, aggregates, x_col, y_col):
+    return f"Scatter plot of {x_col} against {y_col}", sns.scatterplot, {'data': dataset, 'x': x_col, 'y': y_col}
+
+def line_plot(dataset, aggregates, x_col, y_col):
+    return f"Line Plot of {x_col} against {y_col}", sns.lineplot, {'data': dataset, 'x': x_col, 'y': y_col}
+
+def _grouped_kwargs(dataset, x_col, y_col):
+    # bar, box and violin plots group the values by the categories along x, so when x is the float column the plot is
+    # turned on its side and grouped along y instead of making a group of every float
+    kwargs = {'data': dataset, 'x': x_col, 'y': y_col}
+    if pd.api.types.is_float_dtype(dataset[x_col]) and not pd.api.types.is_float_dtype(dataset[y_col]):
+        kwargs['orient'] = 'h'
+    return kwargs
+
+def bar_plot(dataset, aggregates, x_col, y_col):
+    return f"Bar plot of {x_col} against {y_col}", sns.barplot, _grouped_kwargs(dataset, x_col, y_col)
+
+def box_plot_2d(dataset, aggregates, x_col, y_col):
+    return f"Box plot of {x_col} against {y_col}", sns.boxplot, _grouped_kwargs(dataset, x_col, y_col)
+
+def violin_plot_2d(dataset, aggregates, x_col, y_col):
+    return f"violin plot of {x_col} against {y_col}", sns.violinplot, _grouped_kwargs(dataset, x_col, y_col)
+
+def regression_plot(dataset, aggregates, x_col, y_col):
+    return f"Regression plot of {x_col} against {y_col}", sns.regplot, {
+        'data': dataset, 'x': x_col, 'y': y_col, 'line_kws': {'color': 'red'},
+    }
+
+def hexbin_plot_2d(dataset, aggregates, x_col, y_col):
+    return f"Hexbin plot of {x_col} against {y_col}", hexbin_plot, {
+        'x': dataset[x_col], 'y': dataset[y_col], 'gridsize': 30, 'cmap': 'viridis',
+    }
+
+def kde_plot_2d(dataset, aggregates, x_col, y_col):
+    # the density of a column against itself is a line, which the kde cant be estimated for
+    if x_col == y_col:
+        return None
+    return f"KDE plot of {x_col} against {y_col}", sns.kdeplot, {
+        'x': dataset[x_col], 'y': dataset[y_col], 'cmap': 'Blues', 'fill': True, 'thresh': 0, 'levels': 100,
+    }
+
+def correlation_heatmap(dataset, aggregates, x_col, y_col):
+    correlation_matrix = aggregates.corr(x_col, y_col)
+    return f"Correlation Heatmap of {x_col} and {y_col}", sns.heatmap, {
+        'data': correlation_matrix, 'annot': True, 'cmap': 'coolwarm',
+    }
+
+def hue_count_plot(dataset, aggregates, x_col, y_col):
+    # a bar of each y value for every x value, the counts are the crosstab
+    return f"Count Plot of {x_col} with {y_col} as Hue", frame_plot, {
+        'data': aggregates.crosstab(x_col, y_col), 'kind': 'bar', 'colormap': 'viridis',
+    }
+
+def bool_hue_count_plot(dataset, aggregates, x_col, y_col):
+    # the bool column is always the hue, whichever column is x
+    if pd.api.types.is_bool_dtype(dataset[x_col]):
+        cross_tab = aggregates.crosstab(y_col, x_col)
+    else:
+        cross_tab = aggregates.crosstab(x_col, y_col)
+    return f"Count plot of {x_col} against {y_col}", frame_plot, {
+        'data': cross_tab, 'kind': 'bar', 'colormap': 'viridis',
+    }
+
+def stacked_bar_plot(dataset, aggregates, x_col, y_col):
+    cross_tab = aggregates.crosstab(x_col, y_col)
+    return f"Stacked bar plot of {x_col} against {y_col}", frame_plot, {
+        'data': cross_tab, 'kind': 'bar', 'stacked': True, 'colormap': 'viridis',
+    }
+
+def stacked_area_plot(dataset, aggregates, x_col, y_col):
+    cross_tab = aggregates.crosstab(x_col, y_col)
+    return f"Stacked Area Plot of {x_col} against {y_col}", frame_plot, {
+        'data': cross_tab, 'kind': 'area', 'stacked': True, 'colormap': 'viridis',
+    }
+
+def categorical_heatmap(dataset, aggregates, x_col, y_col):
+    cross_tab = aggregates.crosstab(x_col, y_col)
+    return f"Heatmap of Categorical Correlation between {x_col} and {y_col}", sns.heatmap, {
+        'data': cross_tab, 'annot': True, 'cmap': 'Blues',
+    }
+
+
+def restyled(builder, title=None, **style):
+    """
+    makes a variant of a visual builder with another title or styling, for the column types whose visual has always
+    been titled or styled differently
 
-        """
-        x_col and y_col are int and float non-respectufully
-        """
-        if is_int_float(x, y):
-            # scatter plot
-            create_visual(f"Scatter plot of {x_col} against {y_col}", plot_func=sns.scatterplot, data=dataset, x=x_col, y=y_col)
-            # hexbin plot
-            create_visual(f"Hexbin plot of {x_col} against {y_col}", plot_func=plt.hexbin, x=x, y=y, gridsize=30, cmap='Blues')
-            # regression plot
-            create_visual(f"Regression plot of {x_col} against {y_col}", plot_func=sns.regplot, data=dataset, x=x_col, y=y_col, line_kws={'color': 'red'})
-            # line plot
-            create_visual(f"Line Plot of {x_col} against {y_col}", plot_func=sns.lineplot, data=dataset, x=x_col, y=y_col)
-            # heatmap
-            correlation = dataset[[x_col, y_col]].corr()
-            create_visual(f"Correlation Heatmap of {x_col} and {y_col}", plot_func=sns.heatmap, data=correlation, annot=True, cmap='coolwarm')
-            # violin plot
-            create_visual(f"Violin Plot of {x_col} against {y_col}", plot_func=sns.violinplot, data=dataset, x=x_col, y=y_col)
-            # boxplot
-            create_visual(f"Boxplot of {x_col} against {y_col}", plot_func=sns.boxplot, data=dataset, x=x_col, y=y_col)
+    Args:
+    builder -> function: the visual builder
+    title -> str: the title of the variant, formatted with the column names in order ({0}, {1}). None keeps the title
+    **style -> the plotting function arguments to replace, an argument set to None is removed instead
 
+    Returns:
+    builder -> function: the variant visual builder
+    """
+    def variant(dataset, aggregates, *columns):
+        visual = builder(dataset, aggregates, *columns)
+        if visual is None:
+            return None
+        plot_title, plot_func, kwargs = visual
+        kwargs = {key: value for key, value in {**kwargs, **style}.items() if value is not None}
+        return title.format(*columns) if title else plot_title, plot_func, kwargs
+    return variant
+
+
+# (column type,) or (x column type, y column type) -> visual builders, in the order the visuals are planned, the first
+# is the recommended visual. add to this with register_visual
+VISUALS = {
+    ('int',): [histogram, violin_plot, count_plot, box_plot, kde_plot, rug_plot, ecdf_plot],
+    ('float',): [histogram, restyled(box_plot, "Boxplot of {0}"), violin_plot, restyled(kde_plot, "Density Plot of {0}")],
+    ('str',): [pie_chart_of_counts, count_plot],
+    ('bool',): [count_plot, histogram, pie_chart_of_counts],
+
+    ('int', 'int'): [
+        scatter_plot,
+        restyled(line_plot, "Line plot of {0} against {1}"),
+        bar_plot,
+        restyled(correlation_heatmap, "correlation matrix heatmap of {0} and {1}", linewidths=0.5),
+        restyled(box_plot_2d, "Boxplot of {0} and {1}"),
+        restyled(violin_plot_2d, "Violin Plot of {0} and {1}"),
+        restyled(regression_plot, "Linear Regression Plot of {0} and {1}", line_kws=None),
+    ],
+    ('float', 'float'): [
+        scatter_plot,
+        hexbin_plot_2d,
+        kde_plot_2d,
+        restyled(correlation_heatmap, "Correlation Matrix Heatmap of {0} and {1}", linewidths=0.5),
+        line_plot,
+        restyled(regression_plot, "Linear Regression Plot of {0} and {1}", line_kws=None),
+    ],
+    # very hard to think of any other plots with just two string columns
+    ('str', 'str'): [stacked_bar_plot, hue_count_plot, categorical_heatmap, stacked_area_plot],
+    # couldnt think of or find any relevant plots for two booleans
+    ('bool', 'bool'): [],
+}
+
+
+def register_visual(column_types, builder):
+    """
+    adds a visual to the plan of a column type, or of a pair of column types in either order
 
-        """
-        x_col and y_col are int and bool non-respectufully
-        """
-        if is_int_bool(x, y):
-            # bar plot
-            create_visual(f"Bar plot of {x_col} against {y_col}", plot_func=sns.barplot, data=dataset, x=x_col, y=y_col)
-            # box plot
-            create_visual(f"Box plot of {x_col} against {y_col}", plot_func=sns.boxplot, data=dataset, x=x_col, y=y_col)
-            # violin plot
-            create_visual(f"violin plot of {x_col} against {y_col}", plot_func=sns.violinplot, data=dataset, x=x_col, y=y_col)
+    Args:
+    column_types -> tuple: (column type,) or (x column type, y column type), see COLUMN_TYPES
+    builder -> function: takes the dataset, its PlotAggregates and the column name (or x and y column names), and
+    returns the title, plotting function and arguments of the visual, or None if the visual doesnt apply to the columns
+    """
+    keys = {column_types, column_types[::-1]}
+    for key in keys:
+        VISUALS.setdefault(key, []).append(builder)
+
+
+# the pairs of different types, planned the same whichever column is x
+for builder in (bar_plot, box_plot_2d, violin_plot_2d, line_plot):
+    register_visual(('int', 'str'), builder)
+    register_visual(('str', 'float'), builder)
+for builder in (
+    scatter_plot,
+    restyled(hexbin_plot_2d, cmap='Blues'),
+    regression_plot,
+    line_plot,
+    correlation_heatmap,
+    restyled(violin_plot_2d, "Violin Plot of {0} against {1}"),
+    restyled(box_plot_2d, "Boxplot of {0} against {1}"),
+):
+    register_visual(('int', 'float'), builder)
+for builder in (bar_plot, box_plot_2d, violin_plot_2d):
+    register_visual(('int', 'bool'), builder)
+    register_visual(('float', 'bool'), builder)
+for builder in (bool_hue_count_plot, restyled(stacked_bar_plot, "Bar plot of {0} against {1}", colormap=None)):
+    register_visual(('str', 'bool'), builder)
+
+
+def plan_visuals(dataset, x_col=None, y_col=None, row_budget=ROW_BUDGET, aggregates=None):
+    """
+    using the dataset and the column names, this function will plan every registered plot for the types of the
+    columns, such as a scatter plot when both columns are int, or a bar plot when one is int and one is str, etc...
+    nothing is drawn here, which keeps planning cheap, the visuals are drawn one at a time with render_visual
 
-        """
-        x_col and y_col are string and bool non-respectufully
-        """
-        if is_str_bool(x, y):
-            # count plot
-            create_visual(f"Count plot of {x_col} against {y_col}", plot_func=sns.countplot, data=dataset, x=x_col, y=y_col)
-            # bar plot
-            create_visual(f"Bar plot of {x_col} against {y_col}", plot_func=sns.barplot, data=dataset, x=x_col, y=y_col)
-            # stacked bar plot
-            crosstab = pd.crosstab(x, y)
-            create_visual(f"Bar plot of {x_col} against {y_col}", plot_func=crosstab.plot.bar, stacked=True)
+    each column is classified once (see column_type) and the visuals are looked up in VISUALS, so far these column
+    types have visuals:
+    int
+    float
+    str
+    bool
 
-        """
-        x_col and y_col are float and bool non-respectufully
-        """
-        if is_float_bool(x, y):
-            # bar plot
-            create_visual(f"Bar plot of {x_col} against {y_col}", plot_func=sns.barplot, data=dataset, x=x_col, y=y_col)
-            # box plot
-            create_visual(f"Box plot of {x_col} against {y_col}", plot_func=sns.boxplot, data=dataset, x=x_col, y=y_col)
-            # violin plot
-            create_visual(f"violin plot of {x_col} against {y_col}", plot_func=sns.violinplot, data=dataset, x=x_col, y=y_col)
-        
-    return visuals, recommendations[0] if recommendations else None
\ No newline at end of file
+    Args:
+        dataset (pandas.DataFrame): dataset to visualize.
+        x_col, y_col: column names to visualize.
+        row_budget (int): max number of rows each visual is drawn from, see reduce_plot_data. None to draw from every row.
+        the data is only reduced when a visual is drawn, see render_visual.
+        aggregates (PlotAggregates): aggregates of the dataset to reuse, such as from an earlier plan of the same request.
+        by default each plan computes its own.
+
+    Returns:
+        plan (list): A list of visual specs (see render_visual), the first spec is the "recommended" visual.
+        None if neither column is in the dataset.
+    """
+    # at least x_col or y_col should be selected
+    if x_col not in dataset.columns and y_col not in dataset.columns:
+        return None
+
+    if x_col is None or y_col is None:
+        # 1 dimensional case, the selected column is plotted along x
+        columns = (x_col if y_col is None else y_col,)
+    else:
+        # 2 dimensional case, nothing is planned if either column isnt in the dataset
+        columns = (x_col, y_col)
+    column_types = tuple(column_type(dataset[col]) if col in dataset.columns else None for col in columns)
+
+    # the specs only need the selected columns, so only those are kept in the data they carry (and that is pickled to
+    # the render workers), not the whole dataset
+    if all(col in dataset.columns for col in columns):
+        dataset = dataset[list(dict.fromkeys(columns))]
+
+    # visual titles -> visual specs, a repeated title replaces the earlier spec but keeps its place in the order
+    planned = {}
+    # the visuals share aggregates, such as value counts, so each is only computed once
+    aggregates = aggregates or PlotAggregates(dataset)
+    for builder in VISUALS.get(column_types, ()):
+        visual = builder(dataset, aggregates, *columns)
+        if visual is None:
+            continue
+        plot_title, plot_func, kwargs = visual
+        planned[plot_title] = {'title': plot_title, 'plot_func': plot_func, 'kwargs': kwargs, 'row_budget': row_budget}
+
+    return list(planned.values())
+
+
+def generate_and_recommend_WIP(dataset, x_col=None, y_col=None):
+    """
+    plans and draws every visual for the selected columns, see plan_visuals
+
+    Args:
+        dataset (pandas.DataFrame): dataset to visualize.
+        x_col, y_col: column names to visualize.
+
+    Returns:
+        visuals (dict): A dictionary with visual names as keys and figure objects as values.
+        recommended (str): A recommended visual's key in the visuals dictionary. (The first visual created in a case)
+    """
+    plan = plan_visuals(dataset, x_col=x_col, y_col=y_col)
+    if plan is None:
+        return None, None
+
+    visuals = {spec['title']: render_visual(spec) for spec in plan}
+    return visuals, plan[0]['title'] if plan else None
\ No newline at end of file
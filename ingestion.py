@@ -0,0 +1,96 @@
+import csv
+import numpy as np
+import pandas as pd
+
+
+# the start of a csv file used to sniff its delimiter, at most SNIFF_LINES lines of the first SNIFF_BYTES bytes
+SNIFF_BYTES = 2**16
+SNIFF_LINES = 20
+
+# delimiters sniff_csv can detect, anything else is read as a comma separated file
+DELIMITERS = ',;\t|'
+
+
+def sniff_csv(sample):
+    """
+    guesses the delimiter of a csv file from the start of the file. the first row is always read as the header, the
+    same as pd.read_csv, guessing whether a row of numbers is a header or data loses real headers (such as years)
+
+    Args:
+    sample -> str: the start of the csv file
+
+    Returns:
+    delimiter -> str: the delimiter, ',' if it couldnt be detected
+    """
+    try:
+        return csv.Sniffer().sniff(sample, delimiters=DELIMITERS).delimiter
+    except csv.Error:
+        return ','
+
+
+def strip_strings(col):
+    """
+    removes leading and trailing spaces from a string column, only the unique values are stripped so columns with
+    repeated values (most text columns in a dataset) are stripped faster than value by value
+
+    Args:
+    col -> Series: a string column
+
+    Returns:
+    col -> Series: the stripped column
+    """
+    # columns of mostly unique values (such as ids) are faster to strip value by value
+    sample = col.iloc[:1000]
+    if sample.nunique() > len(sample) // 2:
+        return col.str.strip()
+
+    codes, uniques = pd.factorize(col)
+    stripped = pd.Series(uniques, dtype=col.dtype).str.strip().array
+    # missing values have the code -1, which take fills with a missing value
+    return pd.Series(stripped.take(codes, allow_fill=True), index=col.index, name=col.name)
+
+
+def ingest_csv(file):
+    """
+    reads a csv file into a processed DataFrame in one step, the result is the same as
+    functions.process_data(pd.read_csv(file)) (other than the sniffed delimiter) without the second pass of
+    convert_dtypes:
+
+    the delimiter is sniffed from the start of the file (see sniff_csv), the columns are parsed straight into pandas
+    nullable dtypes with the pandas c engine, and string columns are stripped by their unique values (see
+    strip_strings). the column names are kept exactly as they are in the file, spaces included, like pd.read_csv
+
+    Args:
+    file -> str or file: the path of the csv file, or the file itself
+
+    Returns:
+    df -> DataFrame: the processed data frame
+    """
+    # sniff the start of the file
+    if isinstance(file, str):
+        with open(file, 'rb') as f:
+            sample = f.read(SNIFF_BYTES)
+    else:
+        position = file.tell()
+        sample = file.read(SNIFF_BYTES)
+        file.seek(position)
+    # only the first lines are sniffed, csv.Sniffer is slow on long samples
+    sample = "\n".join(sample.decode('utf-8', errors='replace').splitlines()[:SNIFF_LINES])
+    delimiter = sniff_csv(sample)
+
+    df = pd.read_csv(file, sep=delimiter, dtype_backend='numpy_nullable', memory_map=isinstance(file, str))
+
+    for column in df.columns:
+        if df[column].dtype == 'string':
+            df[column] = strip_strings(df[column])
+        elif pd.api.types.is_float_dtype(df[column]):
+            # floats that are all whole numbers are integers to convert_dtypes, such as an integer column written as 1.0,
+            # checked the same way convert_dtypes does for numpy floats
+            mask = df[column].isna().to_numpy()
+            values = df[column].to_numpy(dtype='float64', na_value=0.0)
+            with np.errstate(invalid='ignore'):
+                integers = values.astype(np.int64)
+            if (integers == values).all():
+                df[column] = pd.Series(pd.arrays.IntegerArray(integers, mask), index=df.index)
+
+    return df
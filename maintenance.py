@@ -0,0 +1,146 @@
+import os
+import json
+import time
+import threading
+from datetime import datetime, timezone
+from apscheduler.schedulers.background import BackgroundScheduler
+
+# file locks are only available on unix, without them every process runs the jobs
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class Maintenance:
+    """
+    runs the periodic maintenance jobs of the app (such as expiring datasets and evicting caches) once per host,
+    however many worker processes there are.
+
+    every worker process schedules the jobs, but a job only runs in the process holding an exclusive lock on
+    lock_path, the others skip it without touching the database. the first process to take the lock keeps it until
+    it exits, then the next job of another process takes it over.
+
+    the timing and status of the last run of every job is written to status_path by the process running the jobs,
+    so every process can report it, see status
+    """
+    def __init__(self, lock_path, status_path):
+        self.lock_path = lock_path
+        self.status_path = status_path
+        self.scheduler = BackgroundScheduler()
+        self._lock_file = None
+        self._lock_pid = None
+        self._lock = threading.Lock() # status updates of jobs finishing at the same time
+
+    def add_job(self, name, func, seconds):
+        """
+        Args:
+        name -> str: the name of the job in the status
+        func -> function: runs the job, returns a json safe result (such as a dictionary of metrics) or None
+        seconds -> int: seconds between runs of the job
+        """
+        # a run that is still going when the next one is due isnt started twice
+        self.scheduler.add_job(func=self.run, args=(name, func), trigger='interval', seconds=seconds, id=name,
+                               max_instances=1, coalesce=True)
+
+    def start(self):
+        self.scheduler.start()
+
+    def shutdown(self):
+        self.scheduler.shutdown(wait=False)
+
+    def is_owner(self):
+        """
+        takes the maintenance lock if no other process holds it
+
+        Returns:
+        owner -> bool: True if this process holds the lock, and runs the jobs
+        """
+        if fcntl is None:
+            return True
+
+        # a process forked after the lock was taken shares it with its parent, so it takes its own
+        if self._lock_file is not None and self._lock_pid == os.getpid():
+            return True
+
+        lock_file = open(self.lock_path, 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+
+        self._lock_file = lock_file
+        self._lock_pid = os.getpid()
+        return True
+
+    def run(self, name, func):
+        """
+        runs a job if this process holds the maintenance lock, and records its status
+
+        Args:
+        name -> str: the name of the job in the status
+        func -> function: runs the job, see add_job
+
+        Returns:
+        ran -> bool: False if another process runs the jobs
+        """
+        if not self.is_owner():
+            return False
+
+        started_at = datetime.now(timezone.utc).isoformat(timespec='seconds')
+        start = time.perf_counter()
+        try:
+            result, error = func(), None
+        except Exception as e:
+            result, error = None, repr(e)
+            print(f"Error in maintenance job {name}: {error}")
+        seconds = time.perf_counter() - start
+
+        with self._lock:
+            status = self.status()
+            job = status.setdefault(name, {'runs': 0, 'errors': 0, 'totals': {}})
+            job['runs'] += 1
+            job['errors'] += error is not None
+            job.update({
+                'last_started_at': started_at,
+                'last_seconds': seconds,
+                'last_status': 'ok' if error is None else 'error',
+                'last_error': error,
+                'last_result': result,
+                'pid': os.getpid(),
+            })
+
+            # numbers in the results are added up over every run, or the largest kept for max_ ones
+            if isinstance(result, dict):
+                for key, value in result.items():
+                    if isinstance(value, (int, float)) and not isinstance(value, bool):
+                        total = job['totals'].get(key, 0)
+                        job['totals'][key] = max(total, value) if key.startswith('max_') else total + value
+
+            self._write_status(status)
+
+        return True
+
+    def _write_status(self, status):
+        # write to a temporary file first, so a half written status is never read
+        tmp_path = f"{self.status_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(status, f)
+            os.replace(tmp_path, self.status_path)
+        except OSError as e:
+            print(f"Error writing maintenance status: {e}")
+
+    def status(self):
+        """
+        Returns:
+        status -> dictionary: job name -> number of 'runs' and 'errors', and the 'last_started_at' time (utc),
+        'last_seconds' it took, 'last_status' ('ok' or 'error'), 'last_error', 'last_result' and 'pid' of the process
+        that ran it, and the 'totals' of the numbers in its results. jobs that never ran arent included
+        """
+        try:
+            with open(self.status_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
@@ -0,0 +1,255 @@
+import os
+import json
+import threading
+import numpy as np
+import pandas as pd
+from collections import OrderedDict
+
+from frame_store import PROCESS_VERSION
+from reduction import to_float_array, is_numeric_column
+
+
+# version of profile_column, bump this whenever the profiles change so previously stored profiles are not reused
+PROFILE_VERSION = 1
+
+# columns with more values than this are profiled approximately: the cardinality is estimated with a hyperloglog
+# sketch and the quantiles, top values and memory are taken from a random sample of this many values
+EXACT_ROWS = 100000
+
+# number of registers of the hyperloglog sketch is 2**HLL_PRECISION, the standard error is about 1.04 / sqrt(2**HLL_PRECISION)
+HLL_PRECISION = 14
+
+QUANTILES = (0.25, 0.5, 0.75)
+TOP_K = 5
+
+
+"""
+column profiling
+"""
+
+def hyperloglog_count(col, precision=HLL_PRECISION):
+    """
+    estimates the number of distinct values of a column with a hyperloglog sketch, the values are hashed once and
+    the sketch is built with numpy instead of a hash table of every distinct value
+
+    https://algo.inria.fr/flajolet/Publications/FlFuGaMe07.pdf
+
+    Args:
+    col -> Series: the column, without missing values
+    precision -> int: the first precision bits of each hash pick its register
+
+    Returns:
+    count -> int: the estimated number of distinct values
+    """
+    if len(col) == 0:
+        return 0
+
+    hashes = pd.util.hash_pandas_object(col, index=False).to_numpy()
+    registers_count = 1 << precision
+    rest_bits = 64 - precision
+
+    registers = (hashes >> np.uint64(rest_bits)).astype(np.int64)
+    rest = hashes & np.uint64((1 << rest_bits) - 1)
+    # position of the first 1 bit of the rest of the hash, frexp gives the bit length (exact since rest < 2**53)
+    ranks = rest_bits - np.frexp(rest.astype(np.float64))[1] + 1
+
+    sketch = np.zeros(registers_count, dtype=np.int64)
+    np.maximum.at(sketch, registers, ranks)
+
+    alpha = 0.7213 / (1 + 1.079 / registers_count)
+    estimate = alpha * registers_count ** 2 / np.sum(np.exp2(-sketch.astype(np.float64)))
+
+    # small cardinalities are estimated from the number of empty registers instead
+    empty = int(np.count_nonzero(sketch == 0))
+    if estimate <= 2.5 * registers_count and empty:
+        estimate = registers_count * np.log(registers_count / empty)
+
+    return min(int(round(estimate)), len(col))
+
+
+def _json_value(value):
+    # profiles are stored as json, numpy and pandas scalars are converted to plain json types
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)):
+        return value if np.isfinite(value) else None
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    return str(value)
+
+
+def profile_column(col, seed=0):
+    """
+    profiles a column with vectorized reductions, large columns are profiled approximately (see EXACT_ROWS)
+
+    Args:
+    col -> Series: a processed column, see functions.process_data
+    seed -> int: seed of the random sample of large columns, fixed so the same column always gets the same profile
+
+    Returns:
+    profile -> dictionary: json safe 'dtype', 'count' of values, 'nulls', 'distinct' values, 'min', 'max',
+    'quantiles' (numeric columns only, None otherwise), 'top' values as [value, count] pairs, 'memory' in bytes,
+    and 'approximate' which is True if distinct, quantiles, top and memory were estimated
+    """
+    values = col.dropna()
+    count = len(values)
+    approximate = count > EXACT_ROWS
+
+    if approximate:
+        distinct = hyperloglog_count(values)
+        positions = np.sort(np.random.default_rng(seed).choice(count, EXACT_ROWS, replace=False))
+        sample = values.iloc[positions]
+    else:
+        distinct = int(values.nunique())
+        sample = values
+
+    try:
+        low, high = values.min(), values.max()
+    except TypeError:
+        # columns of mixed types cant be compared
+        low = high = None
+
+    quantiles = None
+    if is_numeric_column(col) and len(sample):
+        quantiles = dict(zip(
+            (f"{q:.0%}" for q in QUANTILES),
+            (_json_value(v) for v in np.quantile(to_float_array(sample), QUANTILES)),
+        ))
+
+    # counts from the sample are scaled up to the whole column, values seen once in the sample arent known to be
+    # common so they are left out
+    top_counts = sample.value_counts().head(TOP_K)
+    if approximate:
+        top_counts = top_counts[top_counts > 1]
+    scale = count / len(sample) if len(sample) else 1
+    top = [[_json_value(value), int(round(n * scale))] for value, n in top_counts.items()]
+
+    # the memory of python strings is counted string by string, so large columns are counted from the sample
+    if approximate:
+        memory = sample.memory_usage(index=False, deep=True) * len(col) / len(sample)
+    else:
+        memory = col.memory_usage(index=False, deep=True)
+
+    return {
+        'dtype': str(col.dtype),
+        'count': count,
+        'nulls': int(len(col) - count),
+        'distinct': distinct,
+        'min': _json_value(low),
+        'max': _json_value(high),
+        'quantiles': quantiles,
+        'top': top,
+        'memory': int(memory),
+        'approximate': approximate,
+    }
+
+
+def profile_data_set(data, profiles=None):
+    """
+    profiles every column of a dataset that isnt profiled yet
+
+    Args:
+    data -> DataFrame: the processed dataset
+    profiles -> list: the already profiled columns by position, see below. a profile is kept as it is if the column
+    at its position still has the same name
+
+    Returns:
+    profiles -> list: the profile of every column by position (so columns with the same name each get their own),
+    see profile_column, along with the 'column' name it was profiled as
+    """
+    profiles = list(profiles or [])
+    for position, column in enumerate(data.columns):
+        if not _is_profiled(profiles, position, column):
+            profile = dict(profile_column(data.iloc[:, position]), column=str(column))
+            if position < len(profiles):
+                profiles[position] = profile
+            else:
+                profiles.append(profile)
+    return profiles[:len(data.columns)]
+
+
+def _is_profiled(profiles, position, column):
+    return position < len(profiles) and profiles[position].get('column') == str(column)
+
+
+class ColumnProfileStore:
+    """
+    column profiles of each dataset, computed once and stored as json beside the dataset blob (see
+    blob_store.BlobStore), then kept in a process-local LRU cache so later dashboard loads dont read the file either.
+
+    the files are named after the blob hash, so BlobStore.collect_garbage removes them along with their blob
+    """
+    def __init__(self, blob_store, max_entries=256):
+        self.blob_store = blob_store
+        self.max_entries = max_entries
+        self._entries = OrderedDict() # content hash -> profiles
+        self._lock = threading.Lock()
+
+    def _path(self, blob_hash):
+        # the profiles are of the processed frame, so they change with process_data too
+        return f"{self.blob_store.path(blob_hash)}.profile-v{PROCESS_VERSION}.{PROFILE_VERSION}.json"
+
+    def _read(self, blob_hash):
+        try:
+            with open(self._path(blob_hash)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            print(f"Error reading column profiles {blob_hash}: {e}")
+            return None
+
+    def _write(self, blob_hash, profiles):
+        # write to a temporary file first, so a half written file is never read
+        path = self._path(blob_hash)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(profiles, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Error writing column profiles {blob_hash}: {e}")
+
+    def get(self, content_hash, data, blob_hash=None):
+        """
+        gets the column profiles of a dataset, only the columns that were never profiled are profiled
+
+        Args:
+        content_hash -> str: the hash of the dataset file, see cache.hash_data_set
+        data -> DataFrame: the processed dataset
+        blob_hash -> str: the hash of the dataset file in the blob store, None for datasets from before the blob store
+        whose profiles are only kept in memory
+
+        Returns:
+        profiles -> list: the profile of every column by position, see profile_data_set
+        """
+        with self._lock:
+            profiles = self._entries.get(content_hash)
+            if profiles is not None:
+                self._entries.move_to_end(content_hash)
+
+        if profiles is None and blob_hash:
+            profiles = self._read(blob_hash)
+
+        complete = profiles is not None and len(profiles) == len(data.columns) and \
+            all(_is_profiled(profiles, position, column) for position, column in enumerate(data.columns))
+        if not complete:
+            profiles = profile_data_set(data, profiles)
+            if blob_hash:
+                self._write(blob_hash, profiles)
+
+        with self._lock:
+            self._entries[content_hash] = profiles
+            self._entries.move_to_end(content_hash)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+        return profiles
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,165 @@
+import numpy as np
+import pandas as pd
+
+
+"""
+data reduction, used to shrink large datasets to a row budget before they are plotted, see functions.reduce_plot_data
+"""
+
+def to_float_array(col):
+    """
+    Args:
+    col -> Series: a numeric column, nullable pandas dtypes are supported
+
+    Returns:
+    values -> ndarray: the values as floats, with missing values as nan
+    """
+    return col.to_numpy(dtype=float, na_value=np.nan)
+
+
+def is_numeric_column(col):
+    # bool columns are numeric to pandas, but they are plotted as categories
+    return pd.api.types.is_numeric_dtype(col) and not pd.api.types.is_bool_dtype(col)
+
+
+def grid_strata(cols, bins=32):
+    """
+    assigns every row to a stratum, numeric columns are cut into equal width bins and every other column
+    is split by its values, so the strata of two columns are the cells of a grid over both
+
+    Args:
+    cols -> list: Series of the same length
+    bins -> int: number of bins numeric columns are cut into
+
+    Returns:
+    strata -> ndarray: the stratum of every row as an int
+    """
+    strata = np.zeros(len(cols[0]), dtype=np.int64)
+    for col in cols:
+        if is_numeric_column(col):
+            values = to_float_array(col)
+            low, high = np.nanmin(values), np.nanmax(values)
+            scale = bins / (high - low) if high > low else 0
+            with np.errstate(invalid='ignore'):
+                codes = np.clip(np.floor((values - low) * scale), 0, bins - 1)
+            codes = np.where(np.isnan(codes), -1, codes).astype(np.int64)
+            count = bins
+        else:
+            codes, uniques = pd.factorize(col)
+            count = len(uniques)
+
+        # missing values (-1) get a stratum of their own
+        strata = strata * (count + 1) + codes + 1
+
+    return strata
+
+
+def stratified_sample(strata, size, seed=0):
+    """
+    randomly samples rows, each stratum keeps its share of the rows and at least one row, so sparse
+    regions of a plot (such as outliers) arent lost the way they would be with a plain random sample
+
+    Args:
+    strata -> ndarray: the stratum of every row, see grid_strata
+    size -> int: number of rows to sample, the sample can be larger by up to one row per stratum
+    seed -> int: seed of the random sample, fixed so the same data always gives the same plot
+
+    Returns:
+    positions -> ndarray: the sorted positions of the sampled rows
+    """
+    n = len(strata)
+    if n <= size:
+        return np.arange(n)
+
+    _, inverse, counts = np.unique(strata, return_inverse=True, return_counts=True)
+    quotas = np.maximum(1, counts * size // n)
+
+    # shuffle, then group the shuffled rows by stratum and keep the first rows of each group
+    shuffled = np.random.default_rng(seed).permutation(n)
+    grouped = shuffled[np.argsort(inverse[shuffled], kind='stable')]
+    starts = np.cumsum(counts) - counts
+    ranks = np.arange(n) - np.repeat(starts, counts)
+
+    return np.sort(grouped[ranks < np.repeat(quotas, counts)])
+
+
+def lttb(x, y, size):
+    """
+    largest triangle three buckets downsampling of a line, the points are split into buckets and the point of
+    each bucket that makes the largest triangle with its neighbours is kept, which keeps the peaks and
+    shape of the line
+
+    https://skemman.is/bitstream/1946/15343/3/SS_MSthesis.pdf
+
+    Args:
+    x, y -> ndarray: the points of the line sorted by x, without nan values
+    size -> int: number of points to keep
+
+    Returns:
+    positions -> ndarray: the sorted positions of the kept points, the first and last point are always kept
+    """
+    n = len(x)
+    if size >= n or size < 3:
+        return np.arange(n)
+
+    # every point other than the first and last falls into one of size - 2 buckets
+    edges = (np.arange(size - 1) * (n - 2) / (size - 2)).astype(np.int64) + 1
+    edges[-1] = n - 1
+
+    positions = np.empty(size, dtype=np.int64)
+    positions[0], positions[-1] = 0, n - 1
+    previous = 0
+    for bucket in range(size - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+
+        # the third point of the triangle is the average of the next bucket (the last point for the last bucket)
+        next_end = edges[bucket + 2] if bucket + 2 < len(edges) else n
+        next_x, next_y = x[end:next_end].mean(), y[end:next_end].mean()
+
+        areas = np.abs(
+            (x[previous] - next_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (next_y - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        positions[bucket + 1] = previous
+
+    return positions
+
+
+def bin_counts(values, bins):
+    """
+    counts the values in each bin, so a plot can be drawn from the bins instead of every value
+
+    Args:
+    values -> ndarray: the values, nan values are skipped
+    bins -> int, str or ndarray: the bins, anything np.histogram_bin_edges accepts
+
+    Returns:
+    centers -> ndarray: the center of every bin
+    counts -> ndarray: the number of values in every bin
+    edges -> ndarray: the edges of the bins
+    """
+    values = values[~np.isnan(values)]
+    edges = np.histogram_bin_edges(values, bins=bins)
+    counts, _ = np.histogram(values, bins=edges)
+    return (edges[:-1] + edges[1:]) / 2, counts, edges
+
+
+def bin_counts_2d(x, y, bins):
+    """
+    counts the points in each cell of a bins x bins grid
+
+    Args:
+    x, y -> ndarray: the coordinates of the points, points with a nan coordinate are skipped
+    bins -> int: number of bins along each axis
+
+    Returns:
+    x_centers, y_centers -> ndarray: the center of every cell, flattened
+    counts -> ndarray: the number of points in every cell, flattened
+    extent -> tuple: (x min, x max, y min, y max) of the points
+    """
+    valid = ~(np.isnan(x) | np.isnan(y))
+    x, y = x[valid], y[valid]
+    counts, x_edges, y_edges = np.histogram2d(x, y, bins=bins)
+    x_centers, y_centers = np.meshgrid((x_edges[:-1] + x_edges[1:]) / 2, (y_edges[:-1] + y_edges[1:]) / 2, indexing='ij')
+    return x_centers.ravel(), y_centers.ravel(), counts.ravel(), (x.min(), x.max(), y.min(), y.max())
@@ -0,0 +1,133 @@
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functions import DEFAULT_THEME, render_pngs
+
+
+"""
+worker process functions
+"""
+
+def _init_worker():
+    # preload matplotlib (with the Agg backend, set when functions is imported) and the plotting libraries,
+    # so the first visual a worker draws doesnt pay for the imports
+    import functions
+
+
+def _render_pngs(spec, theme, dpis):
+    return render_pngs(spec, theme=theme, dpis=dpis)
+
+
+class RenderEngine:
+    """
+    draws planned visuals (see functions.plan_visuals) into png bytes using a pool of worker processes,
+    so independent visuals are drawn in parallel instead of one after another.
+
+    the pool is created lazily in the process that first uses it, and recreated if the engine is used from a
+    different process, so it stays correct when gunicorn forks its workers after the app is imported. worker
+    processes are started with forkserver (or spawn where that is not available) so they never inherit the
+    threads or pyplot state of the web worker.
+
+    with workers set to 0 nothing is drawn in the background, every visual is drawn in the calling process instead.
+    """
+    def __init__(self, workers, timeout=30):
+        self.workers = workers
+        self.timeout = timeout # default max seconds pending_png waits for a visual, see pending_png
+        self._pool = None
+        self._pool_pid = None
+        self._pending = {} # key -> (future, index of the png in its result), for visuals being drawn in the background
+        self._lock = threading.Lock()
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                if 'forkserver' in multiprocessing.get_all_start_methods():
+                    context = multiprocessing.get_context('forkserver')
+                    context.set_forkserver_preload(['functions'])
+                else:
+                    context = multiprocessing.get_context('spawn')
+
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context, initializer=_init_worker)
+                self._pool_pid = os.getpid()
+                self._pending = {}
+            return self._pool
+
+    def _reset_pool(self):
+        # a worker died, the next call creates a new pool
+        with self._lock:
+            self._pool = None
+
+    def prefetch(self, keyed_specs, on_rendered, theme=DEFAULT_THEME, dpis=(None,)):
+        """
+        starts drawing specs in the background without waiting for them, visuals already being drawn are skipped.
+        each visual is drawn once and rasterized at every resolution in dpis, such as the full size visual and its
+        thumbnail
+
+        Args:
+        keyed_specs -> list: (keys, spec) pairs, keys has the key of the visual at each resolution in dpis (see
+        cache.render_cache_key)
+        on_rendered -> function: called as on_rendered(key, png) for each resolution once a visual is drawn
+        theme -> str: the name of the theme to draw the visuals with, see functions.THEMES
+        dpis -> tuple: resolutions to rasterize at, such as functions.THUMBNAIL_DPI. None uses the figure dpi
+        """
+        if self.workers < 1:
+            return
+
+        pool = self._get_pool()
+        for keys, spec in keyed_specs:
+            with self._lock:
+                if all(key in self._pending for key in keys):
+                    continue
+                try:
+                    future = pool.submit(_render_pngs, spec, theme, dpis)
+                except BrokenProcessPool:
+                    self._pool = None
+                    return
+                for index, key in enumerate(keys):
+                    self._pending[key] = (future, index)
+
+            future.add_done_callback(lambda future, keys=keys: self._prefetch_done(keys, future, on_rendered))
+
+    def _prefetch_done(self, keys, future, on_rendered):
+        # the pngs are handed over before they stop being pending, so a caller checking the cache and then pending_png
+        # always finds them in one of them
+        if not future.cancelled() and future.exception() is None:
+            for key, png in zip(keys, future.result()):
+                on_rendered(key, png)
+
+        with self._lock:
+            for key in keys:
+                if self._pending.get(key, (None,))[0] is future:
+                    del self._pending[key]
+
+    def pending_png(self, key, timeout=None):
+        """
+        waits for a visual that is being drawn in the background
+
+        Args:
+        key -> str: the key of the visual at the resolution wanted, as it was prefetched
+        timeout -> float: max seconds to wait, None for the engine timeout. a hung or very slow worker never holds
+        up the caller for longer, it can draw the visual itself instead
+
+        Returns:
+        png -> bytes: the png, or None if the visual is not being drawn (or failed to draw, or took too long)
+        """
+        with self._lock:
+            pending = self._pending.get(key)
+        if pending is None:
+            return None
+
+        future, index = pending
+        try:
+            return future.result(timeout=self.timeout if timeout is None else timeout)[index]
+        except Exception:
+            return None
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None and self._pool_pid == os.getpid():
+                self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+            self._pending = {}
@@ -7,6 +7,7 @@ document.addEventListener('DOMContentLoaded', () => {
     // listens for clicks on the 'visual buttons' in the dashboard other visuals section
     visualButtons.forEach(button => {
         button.addEventListener('click', () => {
+            // data-visual is the url of the full size visual, the button itself only shows a thumbnail
             const newVisual = button.getAttribute('data-visual');
             if (mainVisual) {
                 mainVisual.src = newVisual;
@@ -24,6 +25,96 @@ document.addEventListener('DOMContentLoaded', () => {
         });
     });
 
+    // data table, the rows are loaded from the server a page at a time instead of the whole dataset at once
+    const dataTable = document.querySelector('.data-table');
+    if (dataTable) {
+        const rowsUrl = dataTable.getAttribute('data-rows-url');
+        const tableHead = dataTable.querySelector('thead');
+        const tableBody = dataTable.querySelector('tbody');
+        const prevButton = document.querySelector('.data-table-prev');
+        const nextButton = document.querySelector('.data-table-next');
+        const pageStatus = document.querySelector('.data-table-status');
+
+        const pageSize = 50;
+        let offset = 0;
+        let sort = '';
+        let total = 0;
+
+        // get a page of rows from the server
+        const loadRows = () => {
+            const params = new URLSearchParams({ offset: offset, limit: pageSize });
+            if (sort) {
+                params.set('sort', sort);
+            }
+            fetch(`${rowsUrl}?${params}`)
+                .then(response => {
+                    if (!response.ok) {
+                        throw new Error(`status ${response.status}`);
+                    }
+                    return response.json();
+                })
+                .then(page => {
+                    total = page.total;
+                    renderRows(page);
+                })
+                .catch(error => {
+                    // keep the last page shown, only the status line says the rows couldnt be loaded
+                    console.error('Error loading rows:', error);
+                    pageStatus.textContent = 'Could not load the rows, try again or reload the page';
+                });
+        };
+
+        // replace the table contents with the page, textContent is used so values are never read as html
+        const renderRows = (page) => {
+            // header, clicking a column sorts by it, clicking it again reverses the order
+            const headerRow = document.createElement('tr');
+            headerRow.appendChild(document.createElement('th')); // index column
+            page.columns.forEach(column => {
+                const th = document.createElement('th');
+                th.textContent = column + (sort === column ? ' \u25B2' : sort === `-${column}` ? ' \u25BC' : '');
+                th.style.cursor = 'pointer';
+                th.addEventListener('click', () => {
+                    sort = sort === column ? `-${column}` : column;
+                    offset = 0;
+                    loadRows();
+                });
+                headerRow.appendChild(th);
+            });
+            tableHead.replaceChildren(headerRow);
+
+            // rows, with the row index as the first cell
+            const rows = page.rows.map((row, i) => {
+                const tr = document.createElement('tr');
+                const indexCell = document.createElement('th');
+                indexCell.textContent = page.index[i];
+                tr.appendChild(indexCell);
+                row.forEach(value => {
+                    const td = document.createElement('td');
+                    td.textContent = value === null ? '<NA>' : value;
+                    tr.appendChild(td);
+                });
+                return tr;
+            });
+            tableBody.replaceChildren(...rows);
+
+            // pager
+            pageStatus.textContent = total ? `Rows ${offset + 1} - ${offset + page.rows.length} of ${total}` : 'No rows';
+            prevButton.disabled = offset === 0;
+            nextButton.disabled = offset + pageSize >= total;
+        };
+
+        prevButton.addEventListener('click', () => {
+            offset = Math.max(offset - pageSize, 0);
+            loadRows();
+        });
+        nextButton.addEventListener('click', () => {
+            offset += pageSize;
+            loadRows();
+        });
+
+        loadRows();
+    }
+
     // get form objects
     const saveDatasetForm = document.getElementById("saveDatasetForm");
     const formParent = document.querySelector('.save-this-dataset'); 
@@ -1,13 +1,46 @@
 import pytest
 import pandas as pd
+import numpy as np
+import matplotlib
 import matplotlib.pyplot as plt
+import seaborn as sns
+import sqlite3
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor, Future
 
 # personal functions to test
 from functions import (
     generate_and_recommend_WIP, 
+    plan_visuals,
+    column_type,
+    register_visual,
+    PlotAggregates,
+    VISUALS,
+    render_visual,
+    figure_to_png,
+    render_png,
+    render_pngs,
+    VISUAL_DPIS,
+    THUMBNAIL_DPI,
+    compile_theme,
+    theme_context,
     process_data, 
     get_data_report_data,
+    get_data_rows,
+    get_sort_order,
+    reduce_plot_data,
     )
+from rendering import RenderEngine
+from reduction import grid_strata, stratified_sample, lttb
+from database import Database, MIGRATIONS
+from blob_store import BlobStore
+from frame_store import ProcessedFrameStore
+from profiling import ColumnProfileStore, profile_column, hyperloglog_count
+import profiling
+import functions
+from ingestion import ingest_csv, sniff_csv
+from maintenance import Maintenance
+from cache import DataFrameCache, SortOrderCache, RenderCache, hash_data_set, render_cache_key
 
 """
 run in terminal to test:
@@ -73,6 +106,64 @@ def test_process_data():
 
 
 
+def test_process_data_inplace():
+    df = pd.DataFrame({
+        'int_column': [1, 2, 3],
+        'string_column': ['  hello', ' world  ', ' foo '],
+    })
+
+    # assert the input frame is left unchanged by default
+    processed_df = process_data(df)
+    assert df['int_column'].dtype == 'int64'
+    assert df['string_column'][0] == '  hello'
+
+    # assert inplace processes the frame itself, the same as a copy
+    column_times = {}
+    result = process_data(df, inplace=True, column_times=column_times)
+    assert result is df
+    pd.testing.assert_frame_equal(df, processed_df)
+
+    # assert the time of every column is reported
+    assert set(column_times) == {(0, 'int_column'), (1, 'string_column')}
+    assert all(seconds >= 0 for seconds in column_times.values())
+
+    # assert columns with the same name are timed separately
+    column_times = {}
+    process_data(pd.DataFrame([[1, 'a', 2.5]], columns=['col', 'col', 'other']), column_times=column_times)
+    assert set(column_times) == {(0, 'col'), (1, 'col'), (2, 'other')}
+
+
+def test_ingest_csv():
+    csv = (
+        b"int_col,float_col,whole_float_col,str_col,bool_col,empty_col\n"
+        b"1, 1.5 ,1.0, a ,True,\n"
+        b"2,,2.0,b ,False,\n"
+        b"3,2.5,,  c,True,\n"
+    )
+
+    # assert the result is the same as reading the file and processing it after
+    pd.testing.assert_frame_equal(ingest_csv(BytesIO(csv)), process_data(pd.read_csv(BytesIO(csv))))
+
+    # assert the delimiter is sniffed
+    df = ingest_csv(BytesIO(b"a;b\n1;2.5\n3;4.5\n"))
+    assert list(df.columns) == ['a', 'b']
+    assert df['a'].tolist() == [1, 3]
+    assert sniff_csv("name\tcity\nbob\tparis\n") == '\t'
+
+    # assert the first row is always the header, numeric headers included, the same as read_csv
+    for csv in (b"2019,2020\n100,200\n300,400\n", b"2019,2020\n1.5,2.5\n3.5,4.5\n", b"1\n2\n3\n"):
+        df = ingest_csv(BytesIO(csv))
+        pd.testing.assert_frame_equal(df, process_data(pd.read_csv(BytesIO(csv))))
+    assert list(ingest_csv(BytesIO(b"2019,2020\n100,200\n300,400\n")).columns) == ['2019', '2020']
+    assert ingest_csv(BytesIO(b"1\n2\n3\n"))['1'].tolist() == [2, 3]
+
+    # assert column names keep their spaces, the same as read_csv, values are stripped
+    for csv in (b"a, b\n1, 2\nx, y\n", b" a , b \n1 , 2\n"):
+        df = ingest_csv(BytesIO(csv))
+        pd.testing.assert_frame_equal(df, process_data(pd.read_csv(BytesIO(csv))))
+    assert list(ingest_csv(BytesIO(b" a , b \n1 , 2\n")).columns) == [' a ', ' b ']
+
+
 def test_get_data_report_data():
     # case 1: df with mixed column types
     data = {
@@ -138,6 +229,51 @@ test_data = process_data(pd.DataFrame({
 }))
 
 
+def test_get_data_rows():
+    df = process_data(pd.DataFrame({
+        'int_col': [3, 1, 2, 5, 4],
+        'float_col': [1.5, None, 0.5, 2.5, None],
+    }))
+
+    # assert a page holds the requested slice and the total number of rows
+    page = get_data_rows(df, offset=1, limit=2)
+    assert page['columns'] == ['int_col', 'float_col']
+    assert page['index'] == [1, 2]
+    assert page['rows'] == [[1, None], [2, 0.5]]
+    assert page['total'] == 5
+
+    # assert sorting happens before paging, with a '-' prefix sorting descending
+    page = get_data_rows(df, offset=0, limit=2, sort='-int_col')
+    assert page['index'] == [3, 4]
+    assert [row[0] for row in page['rows']] == [5, 4]
+
+    # assert missing values are sorted last in either direction
+    page = get_data_rows(df, offset=3, limit=2, sort='-float_col')
+    assert page['rows'] == [[1, None], [4, None]]
+
+    # assert an offset past the end gives an empty page
+    assert get_data_rows(df, offset=10)['rows'] == []
+
+    # assert unknown sort columns are rejected
+    with pytest.raises(KeyError):
+        get_data_rows(df, sort='missing_col')
+
+    # assert a cached sort order gives the same pages as sorting again, and is reused without sorting
+    cache = SortOrderCache(max_bytes=2**20)
+    cache.put('hash', '-float_col', get_sort_order(df, '-float_col'))
+    order = cache.get('hash', '-float_col')
+    for offset in range(0, 5, 2):
+        assert get_data_rows(df, offset=offset, limit=2, sort='-float_col', order=order) == \
+            get_data_rows(df, offset=offset, limit=2, sort='-float_col')
+    assert cache.get('hash', 'float_col') is None
+
+    # assert orders past the memory bound are evicted, least recently used first
+    cache = SortOrderCache(max_bytes=order.nbytes * 2)
+    for sort in ('int_col', '-int_col', 'float_col'):
+        cache.put('hash', sort, get_sort_order(df, sort))
+    assert len(cache) == 2 and cache.get('hash', 'int_col') is None
+
+
 def test_both_columns_none():
     visuals, recommendations = generate_and_recommend_WIP(test_data, None, None)
     
@@ -146,9 +282,291 @@ def test_both_columns_none():
     assert recommendations is None
 
 
+def test_plan_visuals():
+
+    # neither column in the dataset, nothing planned
+    assert plan_visuals(test_data, None, None) is None
+
+    # run function
+    x_col = 'int_col'
+    y_col = 'float_col'
+    plan = plan_visuals(test_data, x_col, y_col)
+
+    # assert the plan matches the visuals generate_and_recommend_WIP draws, in the same order
+    visuals, recommended = generate_and_recommend_WIP(test_data, x_col, y_col)
+    assert [spec['title'] for spec in plan] == list(visuals)
+    assert plan[0]['title'] == recommended
+
+    # assert the specs only carry the selected columns
+    frames = [spec['kwargs']['data'] for spec in plan if isinstance(spec['kwargs'].get('data'), pd.DataFrame)]
+    assert frames and all(list(frame.columns) == [x_col, y_col] for frame in frames)
+
+    # assert a single spec can be drawn and converted to a png on its own
+    fig = render_visual(plan[1])
+    assert isinstance(fig, plt.Figure)
+    assert figure_to_png(fig).startswith(b'\x89PNG')
+
+
+def test_render_pngs(monkeypatch):
+    spec = plan_visuals(test_data, 'int_col', None)[0]
+    drawn = []
+    render_visual = functions.render_visual
+    monkeypatch.setattr(functions, 'render_visual', lambda *args, **kwargs: drawn.append(1) or render_visual(*args, **kwargs))
+
+    # assert the full size visual and its thumbnail are rasterized from one drawing, the same as drawn on their own
+    full_png, thumbnail_png = render_pngs(spec, dpis=VISUAL_DPIS)
+    assert len(drawn) == 1
+    assert full_png == render_png(spec)
+    assert thumbnail_png == render_png(spec, dpi=THUMBNAIL_DPI)
+    assert len(thumbnail_png) < len(full_png)
+
+
+def test_theme_context():
+    theme = compile_theme("dark_background", {"axes.facecolor": "#2B2B2B"})
+    original_facecolor = matplotlib.rcParams["axes.facecolor"]
+    original_text_color = matplotlib.rcParams["text.color"]
+
+    # assert the theme is applied inside the with block, with the overrides taking priority
+    with theme_context(theme):
+        assert matplotlib.rcParams["axes.facecolor"] == "#2B2B2B"
+        assert matplotlib.rcParams["text.color"] == "white"
+
+    # assert rcParams are restored after it
+    assert matplotlib.rcParams["axes.facecolor"] == original_facecolor
+    assert matplotlib.rcParams["text.color"] == original_text_color
+
+    # assert invalid styles are rejected when the theme is compiled, not when it is applied
+    with pytest.raises(ValueError):
+        compile_theme({"axes.facecolor": "not a color"})
+
+
+def test_generate_visuals_in_threads():
+    column_pairs = [('str_col', None), ('int_col', 'str_col'), ('str_col', 'str_col')]
+
+    def generate_pngs(columns):
+        visuals, _ = generate_and_recommend_WIP(test_data, *columns)
+        # regression plots bootstrap a random confidence band, so they are never drawn the same twice
+        return {title: figure_to_png(fig) for title, fig in visuals.items() if 'Regression' not in title}
+
+    # drawn one after another
+    serial_pngs = [generate_pngs(columns) for columns in column_pairs]
+
+    # drawn from many threads at once
+    with ThreadPoolExecutor(max_workers=len(column_pairs)) as executor:
+        threaded_pngs = list(executor.map(generate_pngs, column_pairs * 2))
+
+    # assert the visuals are the same no matter how many threads draw at once
+    assert threaded_pngs == serial_pngs * 2
+
+    # assert drawing doesnt leave any figures open in pyplot
+    assert plt.get_fignums() == []
+
+
+def test_render_engine():
+    plan = plan_visuals(test_data, 'int_col', 'float_col')[:3]
+    assert any(spec['plot_func'] is sns.regplot for spec in plan)
+
+    # regression plots bootstrap a random confidence band, seeded so it is the same in every process
+    for spec in plan:
+        if spec['plot_func'] is sns.regplot:
+            spec['kwargs'] = {**spec['kwargs'], 'seed': 0}
+    keyed_specs = [((spec['title'], f"{spec['title']} thumbnail"), spec) for spec in plan]
+
+    # drawn in worker processes in the background
+    engine = RenderEngine(workers=2)
+    rendered = {}
+    try:
+        engine.prefetch(keyed_specs, on_rendered=rendered.__setitem__, dpis=VISUAL_DPIS)
+        pool_pngs = [tuple(engine.pending_png(key) or rendered[key] for key in keys) for keys, _ in keyed_specs]
+    finally:
+        engine.shutdown()
+
+    # assert every visual was drawn the same as when drawn in this process, at both sizes
+    assert pool_pngs == [render_pngs(spec, dpis=VISUAL_DPIS) for spec in plan]
+
+    # assert a visual that isnt being drawn isnt waited for, and a visual that takes too long is given up on
+    assert engine.pending_png('not drawn') is None
+    engine._pending['hung'] = (Future(), 0)
+    assert engine.pending_png('hung', timeout=0.01) is None
+
+    # assert nothing is drawn in the background without workers
+    RenderEngine(workers=0).prefetch(keyed_specs, on_rendered=rendered.__setitem__)
+    assert RenderEngine(workers=0).pending_png(keyed_specs[0][0][0]) is None
+
+
 """
 1 dimensional plot tests
 """
+def test_stratified_sample():
+    # one large stratum and one stratum of a single outlier
+    strata = np.array([0] * 10000 + [1])
+    positions = stratified_sample(strata, 100)
+
+    # assert the sample is about the requested size, sorted, and keeps the outlier
+    assert 100 <= len(positions) <= 102
+    assert list(positions) == sorted(positions)
+    assert 10000 in positions
+
+    # assert the sample is the same every time, and small data isnt sampled
+    assert list(positions) == list(stratified_sample(strata, 100))
+    assert len(stratified_sample(strata[:50], 100)) == 50
+
+    # assert numeric columns are cut into bins and other columns are split by value
+    strata = grid_strata([pd.Series([0.0, 0.1, 10.0]), pd.Series(['a', 'b', 'a'])], bins=2)
+    assert strata[0] != strata[1] and strata[0] != strata[2] and len(set(strata)) == 3
+
+
+def test_lttb():
+    x = np.arange(1000, dtype=float)
+    y = np.zeros(1000)
+    y[500] = 100
+
+    positions = lttb(x, y, 50)
+
+    # assert the size, the first and last points, and the peak are kept
+    assert len(positions) == 50
+    assert positions[0] == 0 and positions[-1] == 999
+    assert 500 in positions
+    assert list(positions) == sorted(positions)
+
+
+def test_reduce_plot_data(monkeypatch):
+    rng = np.random.default_rng(0)
+    dataset = process_data(pd.DataFrame({
+        'int_col': rng.integers(0, 50, 5000),
+        'float_col': rng.normal(size=5000),
+    }))
+
+    # assert visuals within the budget are left as they are
+    kwargs = {'data': dataset, 'x': 'int_col', 'y': 'float_col'}
+    assert reduce_plot_data(sns.scatterplot, kwargs, row_budget=5000) is kwargs
+
+    # assert scatter plots are sampled down to about the budget
+    reduced = reduce_plot_data(sns.scatterplot, kwargs, row_budget=500)
+    assert 500 <= len(reduced['data']) < 1000
+
+    # assert histograms are drawn from counts that add up to every row
+    reduced = reduce_plot_data(sns.histplot, {'data': dataset, 'x': 'int_col'}, row_budget=500)
+    assert reduced['weights'].sum() == 5000
+    assert reduced['x'].name == 'int_col'
+
+    # assert lines are downsampled and their bootstrapped error bands are skipped
+    reduced = reduce_plot_data(sns.lineplot, {'data': dataset, 'x': 'float_col', 'y': 'int_col'}, row_budget=500)
+    assert len(reduced['x']) == 500
+    assert reduced['errorbar'] is None
+
+    # assert reduced visuals are still drawn with their column labels
+    spec = {'title': 'Line plot', 'plot_func': sns.lineplot, 'kwargs': reduced}
+    fig = render_visual(spec)
+    assert fig.axes[0].get_xlabel() == 'float_col'
+
+    # assert planning doesnt reduce anything, each visual is reduced to the budget of its plan only when it is drawn
+    reduced_funcs = []
+    monkeypatch.setattr(functions, 'reduce_plot_data', lambda plot_func, kwargs, row_budget: reduced_funcs.append(plot_func) or reduce_plot_data(plot_func, kwargs, row_budget=row_budget))
+    plan = plan_visuals(dataset, 'int_col', 'float_col', row_budget=500)
+    assert reduced_funcs == []
+    assert all(spec['row_budget'] == 500 for spec in plan)
+    assert len(plan[0]['kwargs']['data']) == 5000
+    render_visual(plan[0])
+    assert reduced_funcs == [plan[0]['plot_func']]
+
+
+def test_visual_registry(monkeypatch):
+    df = process_data(pd.DataFrame({
+        'int_col': [1, 2, 3, 4],
+        'float_col': [1.5, 2.5, 3.5, 4.5],
+        'str_col': ['a', 'b', 'a', 'b'],
+        'bool_col': [True, False, True, None],
+    }))
+
+    # assert bool columns are classified as bool instead of int
+    assert [column_type(df[col]) for col in df.columns] == ['int', 'float', 'str', 'bool']
+
+    # assert each column is classified once per plan
+    classified = []
+    monkeypatch.setattr(functions, 'column_type', lambda col: classified.append(col.name) or column_type(col))
+    plan_visuals(df, 'int_col', 'str_col')
+    assert classified == ['int_col', 'str_col']
+
+    # assert bool columns get their own visuals, and only those
+    titles = [spec['title'] for spec in plan_visuals(df, None, 'bool_col')]
+    assert titles == ['Count Plot of bool_col', 'Histogram of bool_col', 'Pie Chart of bool_col']
+
+    # assert pairs of different types get the same visuals whichever column is x
+    kinds = lambda plan: [spec['title'].split(' of ')[0] for spec in plan]
+    assert kinds(plan_visuals(df, 'int_col', 'str_col')) == kinds(plan_visuals(df, 'str_col', 'int_col'))
+
+    # assert each pair of types keeps the titles and styling it had before the registry
+    plan = plan_visuals(df, 'int_col', 'int_col')
+    assert [spec['title'] for spec in plan] == [
+        'Scatter plot of int_col against int_col', 'Line plot of int_col against int_col',
+        'Bar plot of int_col against int_col', 'correlation matrix heatmap of int_col and int_col',
+        'Boxplot of int_col and int_col', 'Violin Plot of int_col and int_col',
+        'Linear Regression Plot of int_col and int_col',
+    ]
+    assert 'line_kws' not in plan[-1]['kwargs'] and plan[3]['kwargs']['linewidths'] == 0.5
+    assert [spec['title'] for spec in plan_visuals(df, None, 'float_col')] == [
+        'Histogram of float_col', 'Boxplot of float_col', 'Violin Plot of float_col', 'Density Plot of float_col',
+    ]
+    spec = plan_visuals(df, 'int_col', 'float_col')[1]
+    assert spec['title'] == 'Hexbin plot of int_col against float_col' and spec['kwargs']['cmap'] == 'Blues'
+
+    # assert the bool column is the hue of the string/bool count plot, whichever column is x
+    for x_col, y_col in (('str_col', 'bool_col'), ('bool_col', 'str_col')):
+        plan = plan_visuals(df, x_col, y_col)
+        assert [spec['title'] for spec in plan] == [f'Count plot of {x_col} against {y_col}', f'Bar plot of {x_col} against {y_col}']
+        assert plan[0]['kwargs']['data'].columns.name == 'bool_col'
+        assert plan[0]['kwargs']['data'].index.name == 'str_col'
+
+    # assert a float column is plotted against the categories on its side
+    spec = next(spec for spec in plan_visuals(df, 'float_col', 'bool_col') if spec['title'].startswith('Box plot'))
+    assert spec['kwargs']['orient'] == 'h'
+
+    # assert registered visuals are planned for both orders of the column types
+    monkeypatch.setitem(VISUALS, ('int', 'str'), list(VISUALS[('int', 'str')]))
+    monkeypatch.setitem(VISUALS, ('str', 'int'), list(VISUALS[('str', 'int')]))
+    register_visual(('int', 'str'), lambda dataset, aggregates, x_col, y_col: (f"Strip plot of {x_col} against {y_col}", sns.stripplot, {'data': dataset, 'x': x_col, 'y': y_col}))
+    assert plan_visuals(df, 'str_col', 'int_col')[-1]['title'] == "Strip plot of str_col against int_col"
+    assert plan_visuals(df, 'int_col', 'str_col')[-1]['plot_func'] is sns.stripplot
+
+
+def test_plot_aggregates(monkeypatch):
+    df = process_data(pd.DataFrame({
+        'int_col': [1, 2, 3, 4],
+        'float_col': [1.5, 2.5, 3.5, 5.5],
+        'str_col': ['a', 'b', 'a', 'b'],
+        'str_col2': ['x', 'x', 'y', 'y'],
+    }))
+
+    # count every crosstab, including any computed outside the aggregates
+    crosstabs = []
+    crosstab = pd.crosstab
+    monkeypatch.setattr(pd, 'crosstab', lambda *args, **kwargs: crosstabs.append(args) or crosstab(*args, **kwargs))
+
+    # assert the four visuals of two string columns are drawn from one crosstab
+    aggregates = PlotAggregates(df)
+    plan = plan_visuals(df, 'str_col', 'str_col2', aggregates=aggregates)
+    assert len(plan) == 4
+    assert aggregates.computed == [('crosstab', ('str_col', 'str_col2'))]
+    assert len(crosstabs) == 1
+
+    # assert the pie chart and count plot share the value counts
+    aggregates = PlotAggregates(df)
+    plan = plan_visuals(df, 'str_col', None, aggregates=aggregates)
+    assert [spec['title'] for spec in plan] == ['Pie Chart of str_col', 'Count Plot of str_col']
+    assert aggregates.computed == [('value_counts', ('str_col',))]
+
+    # assert the count plot has the bars sns.countplot would count
+    count_spec = plan[1]
+    assert list(count_spec['kwargs']['x']) == ['a', 'b']
+    assert list(count_spec['kwargs']['y']) == [2, 2]
+
+    # assert aggregates are reused between plans of the same request
+    plan_visuals(df, 'int_col', 'float_col', aggregates=aggregates)
+    plan_visuals(df, 'int_col', 'float_col', aggregates=aggregates)
+    assert aggregates.computed == [('value_counts', ('str_col',)), ('corr', ('int_col', 'float_col'))]
+
+
 def test_int_column_plot():
 
     # run function
@@ -305,6 +723,443 @@ def test_int_float_column_plot():
 
 
 
+"""
+cache tests
+"""
 
-
-
+def test_data_frame_cache_get_and_put():
+    cache = DataFrameCache(max_bytes=2**20)
+    df = process_data(pd.DataFrame({'int_column': [1, 2, 3]}))
+    content_hash = hash_data_set(b"int_column\n1\n2\n3\n")
+
+    # nothing cached yet
+    assert cache.get(content_hash) is None
+
+    cache.put(content_hash, df)
+
+    # same content is a hit, different content is a miss
+    assert cache.get(content_hash) is df
+    assert cache.get(hash_data_set(b"other contents")) is None
+
+    # clearing empties the cache
+    cache.clear()
+    assert cache.get(content_hash) is None
+    assert cache.total_bytes == 0
+
+def test_data_frame_cache_lru_eviction():
+    df = pd.DataFrame({'int_column': range(100)})
+    size = int(df.memory_usage(index=True, deep=True).sum())
+
+    # room for exactly two frames
+    cache = DataFrameCache(max_bytes=size * 2)
+    cache.put('a', df)
+    cache.put('b', df)
+
+    # use a so b becomes the least recently used
+    cache.get('a')
+    cache.put('c', df)
+
+    assert cache.get('a') is df
+    assert cache.get('b') is None
+    assert cache.get('c') is df
+    assert cache.total_bytes <= cache.max_bytes
+
+    # frames larger than the whole cache are not cached
+    small_cache = DataFrameCache(max_bytes=size - 1)
+    small_cache.put('a', df)
+    assert len(small_cache) == 0
+
+def test_render_cache_key():
+    key = render_cache_key('hash', 'int_col', None, 'Histogram of int_col', 'dark', 1)
+
+    # same inputs give the same key, any changed input gives a different key
+    assert key == render_cache_key('hash', 'int_col', None, 'Histogram of int_col', 'dark', 1)
+    assert key != render_cache_key('other hash', 'int_col', None, 'Histogram of int_col', 'dark', 1)
+    assert key != render_cache_key('hash', None, 'int_col', 'Histogram of int_col', 'dark', 1)
+    assert key != render_cache_key('hash', 'int_col', None, 'Histogram of int_col', 'light', 1)
+    assert key != render_cache_key('hash', 'int_col', None, 'Histogram of int_col', 'dark', 2)
+    assert key != render_cache_key('hash', 'int_col', None, 'Histogram of int_col', 'dark', 1, row_budget=100)
+
+def test_render_cache_memory_and_disk(tmp_path):
+    png = b'\x89PNG' + b'0' * 96
+
+    # memory only cache with room for two pngs
+    cache = RenderCache(max_memory_bytes=len(png) * 2)
+    cache.put('a', png)
+    cache.put('b', png)
+    cache.put('c', png)
+    assert cache.get('a') is None
+    assert cache.get('c') == png
+
+    # two caches sharing a directory, like two worker processes, share hits through the disk
+    worker1 = RenderCache(max_memory_bytes=2**20, directory=tmp_path, max_disk_bytes=len(png) * 2)
+    worker2 = RenderCache(max_memory_bytes=2**20, directory=tmp_path, max_disk_bytes=len(png) * 2)
+    worker1.put('a', png)
+    assert worker2.get('a') == png
+
+    # the disk cache stays within its size bound
+    worker1.put('b', png)
+    worker1.put('c', png)
+    assert sum(f.stat().st_size for f in tmp_path.iterdir()) <= len(png) * 2
+    assert RenderCache(max_memory_bytes=2**20, directory=tmp_path, max_disk_bytes=0).get('c') == png
+
+
+def test_database_connections(tmp_path):
+    db = Database(str(tmp_path / "test.db"))
+
+    # assert each thread reuses its own connection
+    conn = db.get_connection()
+    assert db.get_connection() is conn
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        assert executor.submit(db.get_connection).result() is not conn
+
+    # assert the database uses write ahead logging
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+
+    # assert queries still work and are committed through the reused connection
+    db.add_user('user', 'hash')
+    db.close_connection()
+    assert db.get_connection() is not conn
+    assert db.user_exists('user')
+    assert db.get_user('user')['password_hash'] == 'hash'
+
+
+def test_blob_store_and_references(tmp_path):
+    db = Database(str(tmp_path / "test.db"))
+    blob_store = BlobStore(str(tmp_path / "blobs"))
+
+    # assert the same contents are stored once, under the hash of the contents
+    blob_hash = blob_store.put(b"a,b\n1,2\n")
+    assert blob_store.put(b"a,b\n1,2\n") == blob_hash == hash_data_set(b"a,b\n1,2\n")
+    with open(blob_store.path(blob_hash), 'rb') as f:
+        assert f.read() == b"a,b\n1,2\n"
+
+    # assert rows of both tables are counted as references to the blob
+    dataset_id = db.add_data_set(1, 'data.csv', 'csv', 8, blob_hash)
+    db.save_user_data_set(1, blob_hash, 'data.csv', 'csv', 8, 1024)
+    assert db.get_data_set_by_id(dataset_id)['blob_hash'] == blob_hash
+    assert db.get_data_set_by_id(dataset_id)['data_set'] is None
+    with db.get_connection() as conn:
+        assert conn.execute("SELECT ref_count FROM blobs WHERE blob_hash = ?", (blob_hash,)).fetchone()[0] == 2
+
+    # assert a blob is kept while it is referenced
+    db.expire_data_sets(idle_seconds=-1, max_age_seconds=0)
+    assert db.get_data_set_by_id(dataset_id) is None
+    assert db.get_referenced_blob_hashes() == {blob_hash}
+    assert blob_store.collect_garbage(db.get_referenced_blob_hashes(), grace_seconds=0) == 0
+
+    # assert it is removed once it isnt, but only after the grace period
+    db.delete_saved_user_dataset_by_id(1)
+    db.delete_unreferenced_blobs()
+    assert db.get_referenced_blob_hashes() == set()
+    assert blob_store.collect_garbage(set()) == 0
+    assert blob_store.collect_garbage(set(), grace_seconds=0) == 1
+    assert not blob_store.exists(blob_hash)
+
+
+def test_database_migrations(tmp_path):
+    path = str(tmp_path / "test.db")
+
+    # a database from before migrations, only the first migration was ever applied to it and a saved dataset has a
+    # text user id
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    MIGRATIONS[0](conn)
+    conn.execute("""
+        INSERT INTO users_data_sets (user_id, data_set, file_name, file_type, file_size_bytes, user_max_server_storage_bytes, blob_hash)
+        VALUES ('1', X'', 'data.csv', 'csv', 8, 1024, 'abc')
+    """)
+    conn.commit()
+    conn.close()
+
+    # assert the rest are applied, and the row is kept along with its blob reference
+    db = Database(path)
+    assert db.migrate() == len(MIGRATIONS)
+    assert db.get_user_id_saved_datasets_counnt(1) == 1
+    with db.get_connection() as conn:
+        assert conn.execute("SELECT typeof(user_id) FROM users_data_sets").fetchone()[0] == 'integer'
+        assert conn.execute("SELECT ref_count FROM blobs WHERE blob_hash = 'abc'").fetchone()[0] == 1
+
+        # assert the per user queries use the indexes
+        plan = " ".join(row[3] for row in conn.execute("EXPLAIN QUERY PLAN SELECT COUNT(*) FROM users_data_sets WHERE user_id = 1"))
+        assert "COVERING INDEX users_data_sets_listing" in plan
+        plan = " ".join(row[3] for row in conn.execute("EXPLAIN QUERY PLAN SELECT * FROM data_sets WHERE uploaded_at < '2000-01-01'"))
+        assert "INDEX data_sets_uploaded_at" in plan
+
+    # assert the triggers still count references after the table was rebuilt
+    db.save_user_data_set(1, 'abc', 'data.csv', 'csv', 8, 1024)
+    db.delete_saved_user_dataset_by_id(1)
+    with db.get_connection() as conn:
+        assert conn.execute("SELECT ref_count FROM blobs WHERE blob_hash = 'abc'").fetchone()[0] == 1
+        assert conn.execute("SELECT saved_data_set_id FROM users_data_sets").fetchone()[0] == 2
+
+    # assert opening an up to date database applies nothing
+    assert Database(path).migrate() == len(MIGRATIONS)
+
+    # a database from before migrations whose newest saved datasets were deleted
+    path = str(tmp_path / "deleted.db")
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    MIGRATIONS[0](conn)
+    for i in range(5):
+        conn.execute("""
+            INSERT INTO users_data_sets (user_id, data_set, file_name, file_type, file_size_bytes, user_max_server_storage_bytes)
+            VALUES (1, X'', 'data.csv', 'csv', 8, 1024)
+        """)
+    conn.execute("DELETE FROM users_data_sets WHERE saved_data_set_id IN (4, 5)")
+    conn.commit()
+    conn.close()
+
+    # assert the ids of the deleted datasets arent given out again, and the table keeps one sequence row
+    db = Database(path)
+    db.migrate()
+    db.save_user_data_set(1, 'abc', 'data.csv', 'csv', 8, 1024)
+    with db.get_connection() as conn:
+        assert conn.execute("SELECT MAX(saved_data_set_id) FROM users_data_sets").fetchone()[0] == 6
+        assert [tuple(row) for row in conn.execute("SELECT name, seq FROM sqlite_sequence WHERE name = 'users_data_sets'")] == [('users_data_sets', 6)]
+
+
+def test_list_saved_user_data_sets(tmp_path):
+    db = Database(str(tmp_path / "test.db"))
+    for i in range(5):
+        db.save_user_data_set(1, f"hash{i}", f"data{i}.csv", 'csv', 8, 1024)
+    db.save_user_data_set(2, "hash", "other.csv", 'csv', 8, 1024)
+
+    # assert pages hold only the metadata of the users datasets, newest first (ids break ties of saved_at)
+    page = db.list_saved_user_data_sets(1, limit=2, include_total=True)
+    assert page['total'] == 5
+    assert [row['file_name'] for row in page['data_sets']] == ['data4.csv', 'data3.csv']
+    assert set(page['data_sets'][0]) == {'saved_data_set_id', 'file_name', 'file_type', 'file_size_bytes', 'saved_at'}
+
+    # assert following next visits every dataset once, and the last page has no next
+    ids = [row['saved_data_set_id'] for row in page['data_sets']]
+    while page['next'] is not None:
+        page = db.list_saved_user_data_sets(1, limit=2, after=page['next'])
+        assert page['total'] is None
+        ids += [row['saved_data_set_id'] for row in page['data_sets']]
+    assert ids == [5, 4, 3, 2, 1]
+
+
+def test_move_saved_user_data_set_to_blob_store(tmp_path):
+    db = Database(str(tmp_path / "test.db"))
+    blob_store = BlobStore(str(tmp_path / "blobs"))
+
+    # a dataset saved before the blob store, with its file in the db
+    with db.get_connection() as conn:
+        conn.execute("""
+            INSERT INTO users_data_sets (user_id, data_set, file_name, file_type, file_size_bytes, user_max_server_storage_bytes)
+            VALUES (1, X'612c620a312c320a', 'data.csv', 'csv', 8, 1024)
+        """)
+        conn.commit()
+    saved = db.get_saved_user_dataset_data_by_id(1)
+    assert saved['blob_hash'] is None
+
+    # assert once moved only its hash is kept, and it is counted as a reference to the blob once
+    blob_hash = blob_store.put(saved['data_set'])
+    db.move_saved_user_data_set_to_blob_store(1, blob_hash)
+    db.move_saved_user_data_set_to_blob_store(1, blob_hash)
+    saved = db.get_saved_user_dataset_data_by_id(1)
+    assert saved['blob_hash'] == blob_hash
+    assert saved['data_set'] is None
+    assert db.get_referenced_blob_hashes() == {blob_hash}
+
+    db.delete_saved_user_dataset_by_id(1)
+    assert db.get_referenced_blob_hashes() == set()
+
+
+def test_expire_data_sets(tmp_path):
+    db = Database(str(tmp_path / "test.db"))
+    with db.get_connection() as conn:
+        assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2 # incremental
+
+    for i in range(5):
+        db.add_data_set(1, 'data.csv', 'csv', 8, f"hash{i}")
+    with db.get_connection() as conn:
+        # a dataset from before the blob store, with its file in the db
+        conn.execute("""
+            INSERT INTO data_sets (user_id, file_name, file_type, file_size_bytes, last_accessed_at, data_set)
+            VALUES (1, 'old.csv', 'csv', 200000, CURRENT_TIMESTAMP, zeroblob(200000))
+        """)
+        # 1 and 2 were idle for a day, 3 was uploaded long ago but is still in use, 6 was idle for a day too
+        conn.execute("UPDATE data_sets SET last_accessed_at = datetime('now', '-1 day') WHERE data_set_id IN (1, 2, 6)")
+        conn.execute("UPDATE data_sets SET uploaded_at = datetime('now', '-30 days') WHERE data_set_id = 3")
+        conn.commit()
+    assert db.get_data_set_by_id(1)['idle_seconds'] >= 60 * 60 * 24
+    assert db.get_data_set_by_id(4)['idle_seconds'] < 60
+
+    # assert only the expired datasets are deleted, in batches, and the space of the file in the db is reclaimed
+    metrics = db.expire_data_sets(idle_seconds=60 * 60, max_age_seconds=60 * 60 * 24 * 7, batch_size=2)
+    assert metrics['rows'] == 4
+    assert metrics['batches'] == 2
+    assert metrics['file_bytes'] == 8 * 3 + 200000
+    assert metrics['db_bytes'] > 150000
+    assert 0 < metrics['max_lock_seconds'] <= metrics['lock_seconds']
+    assert db.get_data_set_by_id(1) is None
+    assert db.get_data_set_by_id(4) is not None
+    assert db.get_referenced_blob_hashes() == {'hash3', 'hash4'}
+
+    # assert a touched dataset isnt expired
+    with db.get_connection() as conn:
+        conn.execute("UPDATE data_sets SET last_accessed_at = datetime('now', '-1 day')")
+        conn.commit()
+    db.touch_data_set(4)
+    assert db.expire_data_sets(idle_seconds=60 * 60, max_age_seconds=60 * 60 * 24 * 7)['rows'] == 1
+    assert db.get_data_set_by_id(4) is not None
+
+    # assert the metrics are exposed through the maintenance status when expiry runs as a job, added up over runs
+    maintenance = Maintenance(str(tmp_path / "maintenance.lock"), str(tmp_path / "status.json"))
+    db.add_data_set(1, 'data.csv', 'csv', 8, "hash5")
+    with db.get_connection() as conn:
+        conn.execute("UPDATE data_sets SET last_accessed_at = datetime('now', '-1 day')")
+        conn.commit()
+    expire = lambda: db.expire_data_sets(idle_seconds=60 * 60, max_age_seconds=60 * 60 * 24 * 7)
+    assert maintenance.run('expire_data_sets', expire) and maintenance.run('expire_data_sets', expire)
+    status = maintenance.status()['expire_data_sets']
+    assert status['last_result']['rows'] == 0
+    assert status['totals']['rows'] == 2 and status['totals']['file_bytes'] == 16
+    assert set(status['totals']) >= {'batches', 'db_bytes', 'lock_seconds', 'max_lock_seconds'}
+
+
+def test_maintenance(tmp_path):
+    # two workers of the same host
+    worker1 = Maintenance(str(tmp_path / "maintenance.lock"), str(tmp_path / "status.json"))
+    worker2 = Maintenance(str(tmp_path / "maintenance.lock"), str(tmp_path / "status.json"))
+    runs = []
+
+    def job():
+        runs.append(1)
+        return {'rows': 2, 'max_lock_seconds': len(runs) / 10}
+
+    # assert only the first worker to take the lock runs the jobs, and keeps running them
+    assert worker1.run('expire', job)
+    assert not worker2.run('expire', job)
+    assert worker1.run('expire', job)
+    assert len(runs) == 2
+
+    # assert every worker sees the status, with the results added up
+    status = worker2.status()['expire']
+    assert status['runs'] == 2
+    assert status['last_status'] == 'ok'
+    assert status['last_result'] == {'rows': 2, 'max_lock_seconds': 0.2}
+    assert status['totals'] == {'rows': 4, 'max_lock_seconds': 0.2}
+
+    # assert a failing job is recorded instead of raised
+    def failing_job():
+        raise ValueError("broken")
+    assert worker1.run('failing', failing_job)
+    assert worker2.status()['failing']['last_status'] == 'error'
+    assert 'broken' in worker2.status()['failing']['last_error']
+
+
+def test_blob_store_put_stream(tmp_path):
+    blob_store = BlobStore(str(tmp_path / "blobs"))
+    data = b"a,b\n" + b"1,2\n" * 1000
+
+    # assert a stream read in small chunks is stored with the hash of the whole contents
+    blob_hash, size = blob_store.put_stream(BytesIO(data), max_bytes=len(data), chunk_size=100)
+    assert blob_hash == hash_data_set(data)
+    assert size == len(data)
+    with open(blob_store.path(blob_hash), 'rb') as f:
+        assert f.read() == data
+
+    # assert a stream over the max size stops being read and nothing is stored
+    blob_store = BlobStore(str(tmp_path / "other_blobs"))
+    blob_hash, size = blob_store.put_stream(BytesIO(data), max_bytes=500, chunk_size=100)
+    assert blob_hash is None
+    assert size == 600
+    assert list((tmp_path / "other_blobs").iterdir()) == []
+
+
+def test_processed_frame_store(tmp_path):
+    blob_store = BlobStore(str(tmp_path / "blobs"))
+    processed_frames = ProcessedFrameStore(blob_store)
+    blob_hash = blob_store.put(b"data")
+
+    df = process_data(pd.DataFrame({
+        'int_col': [1, None, 3],
+        'str_col': [' a', 'b ', None],
+        'bool_col': [True, False, None],
+    }))
+
+    # assert nothing is found before a frame is stored
+    assert not processed_frames.exists(blob_hash)
+    assert processed_frames.get(blob_hash) is None
+
+    # assert the frame is read back with the dtypes from process_data
+    processed_frames.put(blob_hash, df)
+    assert processed_frames.exists(blob_hash)
+    pd.testing.assert_frame_equal(processed_frames.get(blob_hash), df)
+
+    # assert the frame is removed along with its blob
+    blob_store.collect_garbage(set(), grace_seconds=0)
+    assert not processed_frames.exists(blob_hash)
+
+
+def test_profile_column(monkeypatch):
+    df = process_data(pd.DataFrame({
+        'int_col': [1, 2, 2, None],
+        'str_col': [' a', 'b', 'a', None],
+    }))
+
+    # assert small columns are profiled exactly
+    profile = profile_column(df['int_col'])
+    assert profile['nulls'] == 1 and profile['count'] == 3
+    assert profile['distinct'] == 2
+    assert (profile['min'], profile['max']) == (1, 2)
+    assert profile['quantiles']['50%'] == 2
+    assert profile['top'][0] == [2, 2]
+    assert not profile['approximate']
+
+    profile = profile_column(df['str_col'])
+    assert profile['quantiles'] is None
+    assert profile['top'][0] == ['a', 2]
+    assert (profile['min'], profile['max']) == ('a', 'b')
+
+    # assert large columns are estimated close to the exact values
+    monkeypatch.setattr(profiling, 'EXACT_ROWS', 1000)
+    rng = np.random.default_rng(0)
+    col = pd.Series(rng.integers(0, 5000, 20000))
+    profile = profile_column(col)
+    assert profile['approximate']
+    assert abs(profile['distinct'] - col.nunique()) / col.nunique() < 0.05
+    assert abs(profile['quantiles']['50%'] - col.median()) < 250
+    assert (profile['min'], profile['max']) == (col.min(), col.max())
+    assert abs(hyperloglog_count(col) - col.nunique()) / col.nunique() < 0.05
+
+
+def test_column_profile_store(tmp_path, monkeypatch):
+    blob_store = BlobStore(str(tmp_path / "blobs"))
+    column_profiles = ColumnProfileStore(blob_store)
+    blob_hash = blob_store.put(b"data")
+    df = process_data(pd.DataFrame({'int_col': [1, 2, 3], 'str_col': ['a', 'b', 'c']}))
+
+    profiled = []
+    profile_column = profiling.profile_column
+    monkeypatch.setattr(profiling, 'profile_column', lambda col: profiled.append(col.name) or profile_column(col))
+
+    # assert each column is profiled once, then served from memory
+    profiles = column_profiles.get(blob_hash, df, blob_hash=blob_hash)
+    assert column_profiles.get(blob_hash, df, blob_hash=blob_hash) == profiles
+    assert profiled == ['int_col', 'str_col']
+
+    # assert the profiles are read back from beside the blob by another process, and only new columns are profiled
+    column_profiles = ColumnProfileStore(blob_store)
+    df['new_col'] = df['int_col'] * 2
+    profiles = column_profiles.get(blob_hash, df, blob_hash=blob_hash)
+    assert profiled == ['int_col', 'str_col', 'new_col']
+    assert [profile['column'] for profile in profiles] == ['int_col', 'str_col', 'new_col']
+
+    # assert the data report shows the profiles
+    data_report = get_data_report_data(df, profiles)
+    assert list(data_report['col data']['Distinct']) == [3, 3, 3]
+    assert data_report['memory'] == sum(profile['memory'] for profile in profiles)
+
+    # assert columns with the same name each get their own profile
+    dupes = process_data(pd.DataFrame([[1, 'a'], [1, 'b']], columns=['col', 'col']))
+    profiles = column_profiles.get('dupes', dupes)
+    assert [profile['distinct'] for profile in profiles] == [1, 2]
+    assert list(get_data_report_data(dupes, profiles)['col data']['Distinct']) == [1, 2]
+
+    # assert the profiles are removed along with their blob
+    blob_store.collect_garbage(set(), grace_seconds=0)
+    assert not list((tmp_path / "blobs").rglob("*.json"))